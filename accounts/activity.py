@@ -0,0 +1,159 @@
+"""
+Buffered activity logging.
+
+``log_activity`` queues an ActivityLog entry in memory instead of writing
+it right away. The buffer is written with one ``bulk_create`` when it holds
+ACTIVITY_LOG_BUFFER_SIZE entries, ACTIVITY_LOG_FLUSH_INTERVAL seconds after
+its oldest entry (checked when a request finishes, after the response has
+been sent, and by a timer for idle workers) and when the process exits.
+Views can log every action without adding a write to the request.
+
+Entries logged inside a transaction are only queued once it commits, so a
+rolled-back action leaves no log behind. Each entry keeps the time it was
+logged, not the time it was flushed. If the database rejects a batch over
+a constraint (an entry whose user was deleted meanwhile), the entries are
+written one by one and only the offending ones are dropped. Set
+ACTIVITY_LOG_BUFFER_SIZE to 1 to write entries as they are logged.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Pending entries kept when flushing fails, as a multiple of the buffer size
+MAX_BUFFERED_FLUSHES = 10
+
+
+class ActivityLogBuffer:
+    """Thread-safe in-process queue of ActivityLog entries"""
+
+    def __init__(self, size=None, flush_interval=None):
+        self._size = size
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._oldest = None
+        self._timer = None
+
+    @property
+    def size(self):
+        if self._size is None:
+            self._size = getattr(settings, 'ACTIVITY_LOG_BUFFER_SIZE', 100)
+        return self._size
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is None:
+            self._flush_interval = getattr(settings, 'ACTIVITY_LOG_FLUSH_INTERVAL', 5)
+        return self._flush_interval
+
+    def log(self, user, action, details=None):
+        """Queue one entry; written on commit of the current transaction, if any"""
+        from .models import ActivityLog
+
+        entry = ActivityLog(user_id=getattr(user, 'pk', user), action=action, details=details or {},
+                            timestamp=timezone.now())
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self._append(entry))
+        else:
+            self._append(entry)
+
+    def _append(self, entry):
+        with self._lock:
+            self._pending.append(entry)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._pending) >= self.size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush_if_due(self):
+        """Flush when the oldest pending entry has waited flush_interval seconds"""
+        oldest = self._oldest
+        if oldest is not None and time.monotonic() - oldest >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the pending entries with one bulk_create; returns how many were written"""
+        from .models import ActivityLog
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._oldest = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        try:
+            ActivityLog.objects.bulk_create(pending, batch_size=500)
+        except IntegrityError:
+            # Some entry can never be written (e.g. its user was deleted since); keep the others
+            return self._write_each(pending)
+        except DatabaseError:
+            logger.exception('Could not write %d activity log entries', len(pending))
+            self._requeue(pending)
+            return 0
+        return len(pending)
+
+    def _write_each(self, entries):
+        """Write the entries one by one, dropping those that violate a constraint"""
+        written = 0
+        for index, entry in enumerate(entries):
+            entry.pk = None
+            try:
+                with transaction.atomic():
+                    entry.save(force_insert=True)
+            except IntegrityError as e:
+                logger.warning('Dropping activity log entry %r of user %s: %s', entry.action, entry.user_id, e)
+            except DatabaseError:
+                logger.exception('Could not write %d activity log entries', len(entries) - index)
+                self._requeue(entries[index:])
+                break
+            else:
+                written += 1
+        return written
+
+    def _requeue(self, entries):
+        """Keep entries for the next flush, dropping the oldest if the database stays unavailable"""
+        with self._lock:
+            self._pending = (entries + self._pending)[-self.size * MAX_BUFFERED_FLUSHES:]
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread has its own database connection
+            connection.close()
+
+
+activity_log = ActivityLogBuffer()
+atexit.register(activity_log.flush)
+
+
+def log_activity(user, action, details=None):
+    """Record an action of user in the activity log (buffered, see module docstring)"""
+    activity_log.log(user, action, details)
+
+
+def request_finished(sender, **kwargs):
+    activity_log.flush_if_due()
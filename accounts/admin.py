@@ -1,8 +1,7 @@
 from django.contrib import admin, messages
-from trash.models import TrashSubmission, CollectionRecord, RewardPointHistory, RewardClaim
+from trash.models import TrashSubmission, CollectionRecord, RewardPointHistory, RewardClaim, PayoutBatch
 from accounts.models import CustomUser, ActivityLog
-from dashboard.models import SystemSettings
-from django.utils import timezone
+from dashboard.models import HistoryArchive, Job, SystemSettings
 
 # admin.site.register(CustomUser)
 # admin.site.register(ActivityLog)
@@ -18,17 +17,58 @@ from django.utils import timezone
 
 
 
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.helpers import ActionForm
 from trash.models import TrashSubmission, CollectionRecord, RewardPointHistory
 from accounts.models import CustomUser, ActivityLog
 from dashboard.models import SystemSettings
+from dashboard.search import search_service
+
+
+class IndexedSearchMixin:
+    """Answer the changelist search box from the search index instead of icontains scans.
+
+    search_index maps a field path of the model to the search entity it points at.
+    """
+    search_index = {}
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        condition = None
+        for path, entity in self.search_index.items():
+            match = search_service.filter(entity, search_term, path=path)
+            condition = match if condition is None else condition | match
+        return queryset.filter(condition), False
+
+
+class SocietyListFilter(admin.SimpleListFilter):
+    title = 'society'
+    parameter_name = 'society'
+
+    def lookups(self, request, model_admin):
+        from trash.locations import KNOWN_SOCIETIES
+        return [(society, society.title()) for society in KNOWN_SOCIETIES]
+
+    def queryset(self, request, queryset):
+        from dashboard.bonuses import society_filter
+        if self.value():
+            return queryset.filter(society_filter(self.value()))
+        return queryset
+
+
+class BonusPointsActionForm(ActionForm):
+    points = forms.IntegerField(required=False, min_value=1, max_value=10000, label='Bonus points')
+    reason = forms.CharField(required=False, label='Reason')
 
 
 @admin.register(CustomUser)
-class CustomUserAdmin(admin.ModelAdmin):
+class CustomUserAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'user_type', 'status', 'reward_points', 'created_at')
-    list_filter = ('user_type', 'status', 'created_at')
-    search_fields = ('username', 'email', 'first_name', 'last_name', 'phone', 'address')
+    list_filter = ('user_type', 'status', SocietyListFilter, 'created_at')
+    search_fields = ('username', 'email', 'first_name', 'last_name', 'phone')
+    search_index = {'pk': 'user'}
     readonly_fields = ('created_at', 'updated_at')
     fieldsets = (
         ('User Information', {
@@ -49,6 +89,28 @@ class CustomUserAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at', 'last_login', 'date_joined')
         }),
     )
+    action_form = BonusPointsActionForm
+    actions = ['award_bonus_points']
+
+    @admin.action(description="Award bonus points to selected users")
+    def award_bonus_points(self, request, queryset):
+        from dashboard.bonuses import BonusError, award_bonus, bonus_recipients
+
+        try:
+            awarded = award_bonus(
+                bonus_recipients(users=queryset),
+                request.POST.get('points'),
+                request.POST.get('reason'),
+                awarded_by=request.user,
+            )
+        except BonusError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(
+            request,
+            f"Awarded {request.POST.get('points')} bonus points to {awarded} users (admins and inactive users skipped).",
+            messages.SUCCESS
+        )
 
 
 @admin.register(ActivityLog)
@@ -60,10 +122,11 @@ class ActivityLogAdmin(admin.ModelAdmin):
 
 
 @admin.register(TrashSubmission)
-class TrashSubmissionAdmin(admin.ModelAdmin):
+class TrashSubmissionAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('track_id', 'user', 'quantity_kg', 'location', 'status', 'created_at', 'rider')
     list_filter = ('status', 'created_at', 'rider')
     search_fields = ('track_id', 'user__username', 'location', 'rider__username')
+    search_index = {'pk': 'submission', 'user_id': 'user', 'rider_id': 'user'}
     readonly_fields = ('track_id', 'created_at', 'updated_at')
     fieldsets = (
         ('Submission Information', {
@@ -82,10 +145,11 @@ class TrashSubmissionAdmin(admin.ModelAdmin):
 
 
 @admin.register(CollectionRecord)
-class CollectionRecordAdmin(admin.ModelAdmin):
+class CollectionRecordAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('submission', 'rider', 'trash_type', 'actual_quantity', 'points_awarded', 'collected_at', 'admin_verified')
     list_filter = ('admin_verified', 'collected_at', 'trash_type')
     search_fields = ('submission__track_id', 'rider__username', 'trash_type')
+    search_index = {'submission_id': 'submission', 'rider_id': 'user'}
     readonly_fields = ('collected_at',)
     fieldsets = (
         ('Collection Details', {
@@ -109,10 +173,11 @@ class RewardPointHistoryAdmin(admin.ModelAdmin):
     
     
 @admin.register(RewardClaim)
-class RewardClaimAdmin(admin.ModelAdmin):
+class RewardClaimAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('reference_id', 'user', 'claim_amount', 'monetary_amount', 'claim_type', 'donation_hospital', 'status', 'created_at')
     list_filter = ('status', 'claim_type', 'created_at')
     search_fields = ('user__username', 'reference_id', 'notes')
+    search_index = {'pk': 'claim', 'user_id': 'user'}
     readonly_fields = ('reference_id', 'created_at', 'updated_at')
     fieldsets = (
         ('Claim Information', {
@@ -130,77 +195,93 @@ class RewardClaimAdmin(admin.ModelAdmin):
     
     @admin.action(description="Mark selected claims as Processing")
     def mark_as_processing(self, request, queryset):
-        valid_claims = []
-        for claim in queryset:
-            if claim.status == 'pending':
-                valid_claims.append(claim.id)
-        
-        updated = queryset.filter(id__in=valid_claims).update(
-            status='processing',
-            processed_by=request.user,
-            updated_at=timezone.now()
-        )
-        self.message_user(
-            request,
-            f"{updated} claims marked as Processing.",
-            messages.SUCCESS
-        )
+        self._transition(request, queryset, 'processing', "{} claims marked as Processing.")
     
     @admin.action(description="Mark selected claims as Completed")
     def mark_as_completed(self, request, queryset):
-        from django.db import transaction
-        
-        valid_claims = []
-        for claim in queryset:
-            # Only process claims in 'processing' status
-            if claim.status == 'processing':
-                # Check if user has enough points
-                if claim.user.reward_points >= claim.claim_amount:
-                    valid_claims.append(claim.id)
-        
-        with transaction.atomic():
-            # Update the claims status
-            claims_to_complete = queryset.filter(id__in=valid_claims)
-            
-            # For each claim, deduct the points from the user
-            for claim in claims_to_complete:
-                user = claim.user
-                user.reward_points -= claim.claim_amount
-                user.save()
-                
-                # Record this transaction in point history
-                RewardPointHistory.objects.create(
-                    user=user,
-                    points=-claim.claim_amount,  # Negative value for deduction
-                    reason=f"Claim {claim.reference_id} processed ({claim.get_claim_type_display()})",
-                    awarded_by=request.user
-                )
-                
-                # Mark as completed
-                claim.status = 'completed'
-                claim.processed_by = request.user
-                claim.processed_at = timezone.now()
-                claim.save()
-                
-        self.message_user(
-            request,
-            f"{len(valid_claims)} claims completed and points deducted.",
-            messages.SUCCESS
-        )
+        self._transition(request, queryset, 'completed', "{} claims completed and points deducted.")
     
     @admin.action(description="Mark selected claims as Cancelled")
     def mark_as_cancelled(self, request, queryset):
-        # Only update claims that are pending or processing
-        updated = queryset.filter(status__in=['pending', 'processing']).update(
-            status='cancelled',
-            processed_by=request.user,
-            updated_at=timezone.now()
-        )
-        self.message_user(
-            request,
-            f"{updated} claims marked as Cancelled.",
-            messages.SUCCESS
-        )
+        self._transition(request, queryset, 'cancelled', "{} claims marked as Cancelled.")
+    
+    def _transition(self, request, queryset, to_status, message):
+        from trash.claims import transition_claims
+        
+        results = transition_claims(list(queryset.values_list('id', flat=True)), to_status, request.user)
+        moved = sum(result['success'] for result in results)
+        self.message_user(request, message.format(moved), messages.SUCCESS)
+        skipped = len(results) - moved
+        if skipped:
+            self.message_user(
+                request,
+                f"{skipped} claims skipped: they cannot move to {to_status} (or the user lacks the points).",
+                messages.WARNING
+            )
+
+
+@admin.register(PayoutBatch)
+class PayoutBatchAdmin(admin.ModelAdmin):
+    list_display = ('reference_id', 'status', 'claim_count', 'total_points', 'total_amount', 'created_by', 'created_at', 'completed_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('reference_id',)
+    readonly_fields = ('reference_id', 'status', 'created_by', 'created_at', 'completed_by', 'completed_at',
+                       'claim_count', 'total_points', 'total_amount')
+    
+    actions = ['complete_batches']
+    
+    @admin.action(description="Complete selected payout batches")
+    def complete_batches(self, request, queryset):
+        from dashboard.jobs import enqueue
+        
+        for batch in queryset.filter(status='open'):
+            job = enqueue('complete_payout_batch', {'batch_id': batch.id, 'user_id': request.user.id}, created_by=request.user)
+            self.message_user(
+                request,
+                f"{batch.reference_id}: completion queued as job #{job.id}.",
+                messages.SUCCESS
+            )
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'progress_display', 'message', 'attempts', 'created_by', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'name', 'created_at')
+    search_fields = ('name', 'message')
+    readonly_fields = [field.name for field in Job._meta.fields]
+    
+    actions = ['retry_jobs', 'cancel_jobs']
+    
+    def has_add_permission(self, request):
+        # Jobs are queued by the application, not written by hand
+        return False
+    
+    @admin.display(description='Progress')
+    def progress_display(self, obj):
+        return f"{obj.progress}%" if obj.progress is not None else '-'
+    
+    @admin.action(description="Retry selected failed or cancelled jobs")
+    def retry_jobs(self, request, queryset):
+        from dashboard.jobs import retry
+        self.message_user(request, f"{retry(queryset.values_list('id', flat=True))} jobs queued again.")
+    
+    @admin.action(description="Cancel selected queued jobs")
+    def cancel_jobs(self, request, queryset):
+        from dashboard.jobs import cancel
+        self.message_user(request, f"{cancel(queryset.values_list('id', flat=True))} jobs cancelled.")
+
+
+@admin.register(HistoryArchive)
+class HistoryArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'period_start', 'period_end', 'row_count', 'points_earned', 'points_spent', 'created_at')
+    list_filter = ('kind', 'period_end')
+    search_fields = ('user__username',)
+    exclude = ('data',)
+    readonly_fields = [field.name for field in HistoryArchive._meta.fields if field.name != 'data']
+    
+    def has_add_permission(self, request):
+        # Blocks are written by the archive_history command
+        return False
 
 
 @admin.register(SystemSettings)
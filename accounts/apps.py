@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from django.core.signals import request_finished
+        from .activity import request_finished as flush_activity_log
+        request_finished.connect(flush_activity_log, dispatch_uid='activity_log_flush')
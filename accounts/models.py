@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 
 class CustomUser(AbstractUser):
@@ -36,7 +37,8 @@ class CustomUser(AbstractUser):
 class ActivityLog(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     action = models.CharField(max_length=100)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Time the action was logged; entries are written later in batches (accounts.activity)
+    timestamp = models.DateTimeField(default=timezone.now)
     details = models.JSONField(default=dict)
     
     def __str__(self):
@@ -1,3 +1,22 @@
-from django.test import TestCase
+from django.test import TransactionTestCase
 
-# Create your tests here.
+from .activity import ActivityLogBuffer
+from .models import ActivityLog, CustomUser
+
+
+class ActivityLogBufferTests(TransactionTestCase):
+    def test_entry_of_a_deleted_user_does_not_block_the_others(self):
+        ayesha = CustomUser.objects.create_user(username='ayesha', password='x')
+        bilal = CustomUser.objects.create_user(username='bilal', password='x')
+        buffer = ActivityLogBuffer(size=100, flush_interval=60)
+        buffer.log(ayesha, 'login')
+        buffer.log(bilal, 'login')
+        buffer.log(ayesha, 'logout')
+        bilal.delete()
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(
+            list(ActivityLog.objects.order_by('id').values_list('user__username', 'action')),
+            [('ayesha', 'login'), ('ayesha', 'logout')],
+        )
@@ -0,0 +1,98 @@
+"""
+Concurrent execution of independent dashboard aggregates.
+
+Dashboard endpoints run many independent count/aggregate queries. Instead of
+issuing them one after another, callers hand ``run_aggregates`` a dict of
+name -> zero-argument callable and get back a dict of name -> result. On a
+database server the groups run on a small thread pool, so the latency of the
+whole batch approaches that of the slowest group instead of the sum.
+
+SQLite serialises access to a single file anyway (and in-memory test databases
+are not shared between threads), so for SQLite, inside a transaction, or when
+AGGREGATE_EXECUTOR_MAX_WORKERS is 1 the groups simply run in order on the
+calling thread.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+_executor = None
+_executor_lock = threading.Lock()
+_worker_state = threading.local()
+
+
+def _max_workers():
+    return getattr(settings, 'AGGREGATE_EXECUTOR_MAX_WORKERS', 4)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=_max_workers(),
+                    thread_name_prefix='dashboard-aggregates',
+                )
+    return _executor
+
+
+def can_run_concurrently():
+    """Whether independent query groups may run on separate connections"""
+    if _max_workers() <= 1:
+        return False
+    # Nested calls from a pool thread would wait on their own pool
+    if getattr(_worker_state, 'active', False):
+        return False
+    for conn in connections.all(initialized_only=True):
+        # Other threads can't see uncommitted rows of this transaction
+        if conn.in_atomic_block:
+            return False
+    return all(connections[alias].vendor != 'sqlite' for alias in connections)
+
+
+def _run_in_worker(func):
+    """Run one group on a pool thread and release that thread's connections"""
+    _worker_state.active = True
+    try:
+        return func()
+    finally:
+        _worker_state.active = False
+        # Django connections are per thread; don't leave them open in idle workers
+        connections.close_all()
+
+
+def run_sequentially(tasks):
+    return {name: func() for name, func in tasks.items()}
+
+
+def run_aggregates(tasks):
+    """Run independent query groups, concurrently where the database allows it"""
+    if len(tasks) < 2 or not can_run_concurrently():
+        return run_sequentially(tasks)
+
+    executor = _get_executor()
+    # Each group runs in a copy of the caller's context, so a replica_reads scope carries over
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, _run_in_worker, func)
+        for name, func in tasks.items()
+    }
+    # .result() re-raises the first failure in the caller's thread
+    return {name: future.result() for name, future in futures.items()}
+
+
+async def arun_aggregates(tasks):
+    """Async variant of run_aggregates for async views"""
+    if len(tasks) < 2 or not can_run_concurrently():
+        return await sync_to_async(run_sequentially)(tasks)
+
+    names = list(tasks)
+    results = await asyncio.gather(*[
+        sync_to_async(_run_in_worker, thread_sensitive=False)(tasks[name]) for name in names
+    ])
+    return dict(zip(names, results))
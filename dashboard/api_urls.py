@@ -14,6 +14,8 @@ urlpatterns = [
     # Admin dashboard
     path('stats/admin/', api_views.get_admin_dashboard_stats, name='api_admin_dashboard_stats'),
     path('analytics/', api_views.get_admin_analytics, name='api_admin_analytics'),
+    path('analytics/forecast/', api_views.get_demand_forecast, name='api_demand_forecast'),
+    path('analytics/stages/', api_views.get_stage_durations, name='api_stage_durations'),
     
     # System settings
     path('settings/', api_views.manage_system_settings, name='api_system_settings'),
@@ -24,7 +26,16 @@ urlpatterns = [
     path('users/', api_views.get_user_management_data, name='api_user_management'),
     path('users/<int:user_id>/toggle-status/', api_views.toggle_user_status, name='api_toggle_user_status'),
     path('users/<int:user_id>/clear-points/', api_views.clear_user_points, name='api_clear_user_points'),
+    path('users/bonus/', api_views.award_bulk_bonus, name='api_award_bulk_bonus'),
     
     # Submission management
     path('submissions/pending/', api_views.get_pending_submissions, name='api_pending_submissions'),
+    
+    # Monitoring
+    path('metrics/', api_views.get_metrics, name='api_metrics'),
+    
+    # Background jobs
+    path('jobs/', api_views.background_jobs, name='api_background_jobs'),
+    path('jobs/<int:job_id>/', api_views.background_job_detail, name='api_background_job_detail'),
+    path('jobs/<int:job_id>/download/', api_views.download_job_export, name='api_download_job_export'),
 ]
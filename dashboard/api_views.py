@@ -4,14 +4,18 @@ from rest_framework.response import Response
 from django.utils import timezone
 from django.db.models import Count, Q, Sum
 from datetime import timedelta
-from django.db import transaction
 from django.core.paginator import Paginator
+from django.http import HttpResponse
 
 from .models import SystemSettings
-from .serializers import SystemSettingsSerializer
+from .serializers import SystemSettingsSerializer, BonusAwardSerializer
 from accounts.models import CustomUser
-from trash.models import TrashSubmission, CollectionRecord, RewardPointHistory, RewardClaim
+from trash.models import TrashSubmission, CollectionRecord, RewardClaim
 from accounts.utils import token_required
+from trash.idempotency import idempotent
+from .aggregates import run_aggregates
+from .replica import replica_reads
+from .search import search_service
 
 @api_view(['GET'])
 def get_public_stats(request):
@@ -106,99 +110,56 @@ def get_rider_dashboard_stats(request):
 
 @api_view(['GET'])
 @token_required(['admin'])
+@replica_reads()
 def get_admin_dashboard_stats(request):
     """Get comprehensive dashboard statistics for admins"""
     try:
-        now = timezone.now()
-        
-        # Basic stats
-        total_users = CustomUser.objects.count()
-        total_submissions = TrashSubmission.objects.count()
-        pending_submissions = TrashSubmission.objects.filter(status='pending').count()
-        active_riders = CustomUser.objects.filter(user_type='rider', status='active').count()
-        total_points = sum([user.reward_points for user in CustomUser.objects.all()])
-        
-        # Recent submissions
-        recent_submissions = TrashSubmission.objects.all().order_by('-created_at')[:10]
         from trash.serializers import TrashSubmissionSerializer
-        recent_serializer = TrashSubmissionSerializer(recent_submissions, many=True)
-    
-        # Weekly stats
-        start_of_week = now - timedelta(days=now.weekday())
-        start_of_week = start_of_week.replace(hour=0, minute=0, second=0, microsecond=0)
-        start_of_prev_week = start_of_week - timedelta(days=7)
-        
-        this_week_collections = CollectionRecord.objects.filter(
-            collected_at__gte=start_of_week
-        ).count()
-        
-        last_week_collections = CollectionRecord.objects.filter(
-            collected_at__gte=start_of_prev_week,
-            collected_at__lt=start_of_week
-        ).count()
-        
-        # Calculate weekly growth
-        weekly_growth = 0
-        if last_week_collections > 0:
-            weekly_growth = round(((this_week_collections - last_week_collections) / last_week_collections) * 100)
-        elif this_week_collections > 0:
-            weekly_growth = 100
-        
-        # System health metrics
-        total_collections = CollectionRecord.objects.count()
-        completion_rate = round((total_collections / total_submissions * 100), 1) if total_submissions > 0 else 0
-        
-        # Recent activity
-        yesterday = now - timedelta(days=1)
-        new_submissions_24h = TrashSubmission.objects.filter(created_at__gte=yesterday).count()
-        new_collections_24h = CollectionRecord.objects.filter(collected_at__gte=yesterday).count()
-        new_users_24h = CustomUser.objects.filter(created_at__gte=yesterday).count()
-        
-        # Top performing riders
-        top_riders = CustomUser.objects.filter(user_type='rider').annotate(
-            collection_count=Count('collections')
-        ).order_by('-collection_count')[:5]
-        
-            # Get daily collection data for the chart
-        daily_collections = []
-        daily_labels = []
-            
-        for i in range(7):
-            date = start_of_week + timedelta(days=i)
-            count = CollectionRecord.objects.filter(
-                collected_at__date=date.date()
-            ).count()
-            daily_collections.append(count)
-            daily_labels.append(date.strftime('%a'))
+        from .widgets import weekly_stats, system_health, top_riders
+        
+        def recent_submissions():
+            recent = TrashSubmission.objects.select_related('user', 'rider').order_by('-created_at')[:10]
+            return TrashSubmissionSerializer(recent, many=True).data
+        
+        # Independent query groups, run concurrently where the database allows it
+        results = run_aggregates({
+            'health': lambda: system_health(request),
+            'weekly': lambda: weekly_stats(request),
+            'riders': lambda: top_riders(request),
+            'recent': recent_submissions,
+            'points': lambda: CustomUser.objects.aggregate(total=Sum('reward_points'))['total'] or 0,
+        })
+        health = results['health']
+        weekly = results['weekly']
             
         return Response({
                 'success': True,
             'basic_stats': {
-                'total_users': total_users,
-                'total_submissions': total_submissions,
-                'pending_submissions': pending_submissions,
-                'active_riders': active_riders,
-                'total_points': total_points,
+                'total_users': health['total_users'],
+                'total_submissions': health['total_submissions'],
+                'pending_submissions': health['pending_submissions'],
+                'active_riders': health['active_riders'],
+                'total_points': results['points'],
             },
-                'recent_submissions': recent_serializer.data,
+                'recent_submissions': results['recent'],
             'weekly_stats': {
-                'this_week_collections': this_week_collections,
-                'last_week_collections': last_week_collections,
-                'weekly_growth': weekly_growth,
-                    'daily_collections': daily_collections,
-                    'daily_labels': daily_labels,
+                'this_week_collections': weekly['this_week_collections'],
+                'last_week_collections': weekly['last_week_collections'],
+                'weekly_growth': weekly['weekly_growth'],
+                    'daily_collections': weekly['daily_collections'],
+                    'daily_labels': weekly['daily_labels'],
             },
             'system_health': {
-                'completion_rate': completion_rate,
-                'new_submissions_24h': new_submissions_24h,
-                'new_collections_24h': new_collections_24h,
-                'new_users_24h': new_users_24h,
+                'completion_rate': health['completion_rate'],
+                'new_submissions_24h': health['new_submissions_24h'],
+                'new_collections_24h': health['new_collections_24h'],
+                'new_users_24h': health['new_users_24h'],
             },
             'top_riders': [{
-                'id': rider.id,
-                'username': rider.username,
-                'collection_count': rider.collection_count
-            } for rider in top_riders]
+                'id': rider['id'],
+                'username': rider['username'],
+                'collection_count': rider['collection_count']
+            } for rider in results['riders']['riders']]
         })
     except Exception as e:
         return Response({
@@ -208,6 +169,7 @@ def get_admin_dashboard_stats(request):
 
 @api_view(['GET'])
 @token_required(['admin'])
+@replica_reads()
 def get_admin_analytics(request):
     """Get detailed analytics data for admins"""
     try:
@@ -223,68 +185,70 @@ def get_admin_analytics(request):
         else:
             end = timezone.now()
             start = end - timedelta(days=period)
+        prev_start = start - timedelta(days=period)
         
-        # Current period data
-        current_users = CustomUser.objects.filter(created_at__gte=start).count()
-        current_submissions = TrashSubmission.objects.filter(created_at__gte=start).count()
-        current_riders = CustomUser.objects.filter(user_type='rider', created_at__gte=start).count()
-        current_points = sum([user.reward_points for user in CustomUser.objects.filter(created_at__gte=start)])
+        def current_period():
+            return {
+                'current_users': CustomUser.objects.filter(created_at__gte=start).count(),
+                'current_submissions': TrashSubmission.objects.filter(created_at__gte=start).count(),
+                'current_riders': CustomUser.objects.filter(user_type='rider', created_at__gte=start).count(),
+                'current_points': CustomUser.objects.filter(
+                    created_at__gte=start
+                ).aggregate(total=Sum('reward_points'))['total'] or 0,
+            }
         
-        # Previous period data
-        prev_start = start - timedelta(days=period)
-        prev_users = CustomUser.objects.filter(created_at__gte=prev_start, created_at__lt=start).count()
-        prev_submissions = TrashSubmission.objects.filter(created_at__gte=prev_start, created_at__lt=start).count()
+        def previous_period():
+            return {
+                'prev_users': CustomUser.objects.filter(created_at__gte=prev_start, created_at__lt=start).count(),
+                'prev_submissions': TrashSubmission.objects.filter(created_at__gte=prev_start, created_at__lt=start).count(),
+            }
         
-        # Growth calculations
-        user_growth = ((current_users - prev_users) / prev_users * 100) if prev_users > 0 else 0
-        submission_growth = ((current_submissions - prev_submissions) / prev_submissions * 100) if prev_submissions > 0 else 0
+        def monthly_trends():
+            # Monthly submission trends for the last 6 months
+            monthly_submissions = []
+            monthly_labels = []
+            for i in range(6):
+                month_start = end.replace(day=1) - timedelta(days=30*i)
+                month_end = month_start.replace(day=28) + timedelta(days=4)
+                month_end = month_end.replace(day=1) - timedelta(seconds=1)
+                
+                count = TrashSubmission.objects.filter(
+                    created_at__gte=month_start,
+                    created_at__lte=month_end
+                ).count()
+                
+                monthly_submissions.insert(0, count)
+                monthly_labels.insert(0, month_start.strftime('%b %Y'))
+            return monthly_submissions, monthly_labels
         
-            # Get monthly submission trends for the last 6 months
-        monthly_submissions = []
-        monthly_labels = []
-            
-        for i in range(6):
-            month_start = end.replace(day=1) - timedelta(days=30*i)
-            month_end = month_start.replace(day=28) + timedelta(days=4)
-            month_end = month_end.replace(day=1) - timedelta(seconds=1)
-            
-            count = TrashSubmission.objects.filter(
-                created_at__gte=month_start,
-                created_at__lte=month_end
-            ).count()
-            
-            monthly_submissions.insert(0, count)
-            monthly_labels.insert(0, month_start.strftime('%b %Y'))
-            
-            # Get user type distribution
-            user_types = CustomUser.objects.values('user_type').annotate(count=Count('user_type'))
-            user_type_labels = []
-            user_type_counts = []
-            
-            for user_type in user_types:
-                user_type_labels.append(user_type['user_type'].title())
-                user_type_counts.append(user_type['count'])
-            
-            # Get rider performance data
-            rider_performance = []
-            rider_names = []
-            
-            top_riders = CustomUser.objects.filter(user_type='rider').annotate(
+        def user_type_distribution():
+            return list(CustomUser.objects.values('user_type').annotate(count=Count('user_type')))
+        
+        def rider_ranking():
+            return list(CustomUser.objects.filter(user_type='rider').annotate(
                 collection_count=Count('collections')
-            ).order_by('-collection_count')[:10]
-            
-            for rider in top_riders:
-                rider_names.append(rider.username)
-                rider_performance.append(rider.collection_count)
+            ).order_by('-collection_count').values_list('username', 'collection_count')[:10])
+        
+        # Independent query groups, run concurrently where the database allows it
+        results = run_aggregates({
+            'current': current_period,
+            'previous': previous_period,
+            'monthly': monthly_trends,
+            'user_types': user_type_distribution,
+            'riders': rider_ranking,
+        })
+        current = results['current']
+        prev_users = results['previous']['prev_users']
+        prev_submissions = results['previous']['prev_submissions']
+        monthly_submissions, monthly_labels = results['monthly']
+        
+        # Growth calculations
+        user_growth = ((current['current_users'] - prev_users) / prev_users * 100) if prev_users > 0 else 0
+        submission_growth = ((current['current_submissions'] - prev_submissions) / prev_submissions * 100) if prev_submissions > 0 else 0
         
         return Response({
                 'success': True,
-            'period_stats': {
-                'current_users': current_users,
-                'current_submissions': current_submissions,
-                'current_riders': current_riders,
-                'current_points': current_points,
-            },
+            'period_stats': current,
             'growth_stats': {
                 'user_growth': user_growth,
                 'submission_growth': submission_growth,
@@ -292,10 +256,10 @@ def get_admin_analytics(request):
                 'trends': {
                     'monthly_submissions': monthly_submissions,
                     'monthly_labels': monthly_labels,
-                    'user_type_labels': user_type_labels,
-                    'user_type_counts': user_type_counts,
-                    'rider_names': rider_names,
-                    'rider_performance': rider_performance,
+                    'user_type_labels': [row['user_type'].title() for row in results['user_types']],
+                    'user_type_counts': [row['count'] for row in results['user_types']],
+                    'rider_names': [username for username, _ in results['riders']],
+                    'rider_performance': [count for _, count in results['riders']],
                 },
             'date_range': {
                 'start_date': start.strftime('%Y-%m-%d'),
@@ -309,6 +273,66 @@ def get_admin_analytics(request):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@token_required(['admin'])
+def get_demand_forecast(request):
+    """Forecast pickups per area and the riders needed per day (admin only)"""
+    from .forecasting import get_forecast
+    
+    try:
+        horizon = int(request.GET.get('horizon', 14))
+    except ValueError:
+        horizon = 0
+    if not 1 <= horizon <= 60:
+        return Response({
+            'success': False,
+            'error': 'horizon must be between 1 and 60 days'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        forecast = get_forecast(horizon, refresh=request.GET.get('refresh') == '1')
+        area = request.GET.get('area', '')
+        if area:
+            forecast = {**forecast, 'areas': [item for item in forecast['areas'] if item['area'].startswith(area)]}
+        return Response({
+            'success': True,
+            'forecast': forecast
+        })
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@token_required(['admin'])
+@replica_reads()
+def get_stage_durations(request):
+    """Time submissions spend in each stage, from their status events (admin only)"""
+    from trash.events import stage_durations
+    
+    try:
+        days = int(request.GET.get('days', 30))
+        submissions = TrashSubmission.objects.filter(created_at__gte=timezone.now() - timedelta(days=days))
+        rider_id = request.GET.get('rider')
+        if rider_id:
+            submissions = submissions.filter(rider_id=rider_id)
+        return Response({
+            'success': True,
+            'days': days,
+            'stages': stage_durations(submissions)
+        })
+    except ValueError:
+        return Response({
+            'success': False,
+            'error': 'days and rider must be numbers'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET', 'PUT'])
 @token_required(['admin'])
 def manage_system_settings(request):
@@ -365,30 +389,102 @@ def reset_system_settings(request):
 @api_view(['POST'])
 @token_required(['admin'])
 def clear_system_data(request):
-    """Clear all system data (admin only)"""
+    """Queue clearing all system data (admin only); poll the returned job for progress"""
+    from .jobs import enqueue, job_status
+    
     try:
-        with transaction.atomic():
-            # Clear all data from all tables
-            RewardPointHistory.objects.all().delete()
-            CollectionRecord.objects.all().delete()
-            TrashSubmission.objects.all().delete()
-            
-            # Clear all non-admin users
-            CustomUser.objects.exclude(user_type='admin').delete()
-            
-            # Reset admin reward points
-            CustomUser.objects.filter(user_type='admin').update(reward_points=0)
-        
+        job = enqueue('clear_system_data', created_by=request.user)
         return Response({
             'success': True,
-            'message': 'All system data cleared successfully'
-        })
+            'message': 'Clearing all system data in the background',
+            'job': job_status(job)
+        }, status=status.HTTP_202_ACCEPTED)
     except Exception as e:
         return Response({
             'success': False,
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET', 'POST'])
+@token_required(['admin'])
+def background_jobs(request):
+    """List background jobs, or queue one: {"name": ..., "params": {...}} (admin only)"""
+    from .jobs import enqueue, job_status, registered_jobs
+    from .models import Job
+    
+    try:
+        if request.method == 'GET':
+            jobs = Job.objects.order_by('-created_at')
+            if request.GET.get('status'):
+                jobs = jobs.filter(status=request.GET['status'])
+            if request.GET.get('name'):
+                jobs = jobs.filter(name=request.GET['name'])
+            paginator = Paginator(jobs, 20)
+            page_obj = paginator.get_page(request.GET.get('page', 1))
+            return Response({
+                'success': True,
+                'jobs': [job_status(job) for job in page_obj],
+                'available_jobs': registered_jobs(),
+                'pagination': {
+                    'current_page': page_obj.number,
+                    'total_pages': paginator.num_pages,
+                    'total_count': paginator.count,
+                }
+            })
+        
+        name = request.data.get('name')
+        params = request.data.get('params') or {}
+        if name not in registered_jobs() or not isinstance(params, dict):
+            return Response({
+                'success': False,
+                'error': f'name must be one of {", ".join(registered_jobs())} and params an object'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        job = enqueue(name, params, created_by=request.user)
+        return Response({
+            'success': True,
+            'job': job_status(job)
+        }, status=status.HTTP_202_ACCEPTED)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@token_required(['admin'])
+def background_job_detail(request, job_id):
+    """Status and progress of a background job (admin only)"""
+    from .jobs import job_status
+    from .models import Job
+    
+    try:
+        return Response({
+            'success': True,
+            'job': job_status(Job.objects.get(id=job_id))
+        })
+    except Job.DoesNotExist:
+        return Response({
+            'success': False,
+            'error': 'Job not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+@api_view(['GET'])
+@token_required(['admin'])
+def download_job_export(request, job_id):
+    """Download the file written by a finished export job (admin only)"""
+    from django.http import FileResponse
+    from .models import Job
+    from .tasks import export_dir
+    
+    job = Job.objects.filter(id=job_id, name='export', status='succeeded').first()
+    path = export_dir() / job.result['file'] if job and job.result else None
+    if path is None or not path.is_file():
+        return Response({
+            'success': False,
+            'error': 'Export file not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
 @api_view(['GET'])
 @token_required(['admin'])
 def get_user_management_data(request):
@@ -405,22 +501,18 @@ def get_user_management_data(request):
         users = CustomUser.objects.exclude(user_type='admin')
         
         # Apply filters
-        if search_query:
-            users = users.filter(
-                Q(username__icontains=search_query) |
-                Q(email__icontains=search_query) |
-                Q(first_name__icontains=search_query) |
-                Q(last_name__icontains=search_query)
-            )
-        
         if user_type_filter:
             users = users.filter(user_type=user_type_filter)
         
         if status_filter:
             users = users.filter(status=status_filter)
         
-        # Order by creation date
-        users = users.order_by('-created_at')
+        if search_query:
+            # Best matches first
+            users = search_service.ranked(users, 'user', search_query)
+        else:
+            # Order by creation date
+            users = users.order_by('-created_at')
         
         # Pagination
         paginator = Paginator(users, per_page)
@@ -550,6 +642,53 @@ def clear_user_points(request, user_id):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@token_required(['admin'])
+@idempotent
+def award_bulk_bonus(request):
+    """Award bonus points to every user matching a filter (admin only)"""
+    from .bonuses import BonusError, award_bonus, bonus_recipients
+    
+    serializer = BonusAwardSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+    
+    try:
+        recipients = bonus_recipients(
+            society=data.get('society'),
+            user_type=data.get('user_type'),
+            active_days=data.get('active_days'),
+        )
+        if data['dry_run']:
+            return Response({
+                'success': True,
+                'dry_run': True,
+                'recipients': recipients.count()
+            })
+        
+        awarded = award_bonus(recipients, data['points'], data['reason'], awarded_by=request.user)
+        return Response({
+            'success': True,
+            'message': f'Awarded {data["points"]} bonus points to {awarded} users',
+            'recipients': awarded,
+            'points_awarded': data['points'] * awarded
+        })
+    except BonusError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET'])
 @token_required(['admin'])
 def get_pending_submissions(request):
@@ -565,8 +704,8 @@ def get_pending_submissions(request):
         
         if search_query:
             submissions = submissions.filter(
-                Q(user__username__icontains=search_query) |
-                Q(location__icontains=search_query)
+                search_service.filter('user', search_query, path='user_id') |
+                search_service.filter('submission', search_query)
             )
         
         if date_filter:
@@ -609,3 +748,16 @@ def get_pending_submissions(request):
             'success': False,
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@token_required(['admin'])
+def get_metrics(request):
+    """Export request metrics in Prometheus text format (admin only)"""
+    try:
+        from .metrics import registry, PROMETHEUS_CONTENT_TYPE
+        return HttpResponse(registry.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
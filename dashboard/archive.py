@@ -0,0 +1,272 @@
+"""
+Archival of old point history and activity log rows.
+
+``archive`` moves the RewardPointHistory or ActivityLog rows older than a
+cutoff into HistoryArchive: one zlib-compressed JSON block per user and
+month, together with its row count and, for point history, the number and
+sum of earned and spent points. Rows are moved one batch of users per
+transaction. Balances live on the user (``reward_points``) and are never
+derived from the history, so archiving leaves them untouched, and the block
+totals keep lifetime earned/spent figures right.
+
+``HistoryList`` puts a user's hot rows and archived rows back together,
+newest first. It supports ``count()`` and slicing, so views hand it to a
+Paginator as before: pages inside the hot window cost what they did, and
+pages past it skip whole blocks by their counts and only decompress the
+blocks they show.
+"""
+import json
+import zlib
+from datetime import datetime, time
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .data_versions import bump_data_version
+from .models import HistoryArchive
+
+# kind -> (model label, time field, archived fields)
+ARCHIVES = {
+    'points': ('trash.RewardPointHistory', 'created_at',
+               ['id', 'points', 'reason', 'submission_id', 'awarded_by_id', 'created_at']),
+    'activity': ('accounts.ActivityLog', 'timestamp',
+                 ['id', 'action', 'details', 'timestamp']),
+}
+
+# Related objects looked up in bulk for the archived rows of a page
+ARCHIVE_RELATIONS = {
+    'points': [('submission', 'trash.TrashSubmission'), ('awarded_by', 'accounts.CustomUser')],
+    'activity': [],
+}
+
+DEFAULT_BATCH_SIZE = 200
+
+
+def archive(kind, before, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """Move the rows of kind older than before into the archive; returns (rows, blocks)
+
+    on_batch(rows, blocks) is called after each committed batch of users.
+    """
+    label, time_field, fields = ARCHIVES[kind]
+    model = apps.get_model(label)
+    old = model.objects.filter(**{f'{time_field}__lt': before})
+    rows = blocks = 0
+    last_user = 0
+    while True:
+        user_ids = list(
+            old.filter(user_id__gt=last_user).order_by('user_id')
+            .values_list('user_id', flat=True).distinct()[:batch_size]
+        )
+        if not user_ids:
+            break
+        with transaction.atomic():
+            moved, created = _archive_users(kind, model, old.filter(user_id__in=user_ids), time_field, fields)
+        rows += moved
+        blocks += created
+        last_user = user_ids[-1]
+        if on_batch:
+            on_batch(rows, blocks)
+
+    if rows and kind == 'points':
+        bump_data_version('rewards')
+    return rows, blocks
+
+
+def _archive_users(kind, model, queryset, time_field, fields):
+    archived = []
+    ids = []
+    group = None
+    block_rows = []
+    for user_id, *row in queryset.order_by('user_id', f'-{time_field}', '-id').values_list(
+        'user_id', *fields
+    ).iterator():
+        moment = row[-1]
+        key = (user_id, moment.year, moment.month)
+        if key != group:
+            if block_rows:
+                archived.append(_block(kind, group[0], block_rows))
+            group, block_rows = key, []
+        block_rows.append(row)
+        ids.append(row[0])
+    if block_rows:
+        archived.append(_block(kind, group[0], block_rows))
+
+    HistoryArchive.objects.bulk_create(archived, batch_size=100)
+    # Nothing references these rows, so they are deleted without the collector
+    for start in range(0, len(ids), 1000):
+        deleted = model.objects.filter(id__in=ids[start:start + 1000])
+        deleted._raw_delete(deleted.db)
+    return len(ids), len(archived)
+
+
+def _block(kind, user_id, rows):
+    period_start, period_end = rows[-1][-1], rows[0][-1]
+    for row in rows:
+        # Full precision; DjangoJSONEncoder would cut datetimes to milliseconds
+        row[-1] = row[-1].isoformat()
+    block = HistoryArchive(
+        kind=kind,
+        user_id=user_id,
+        period_start=period_start,
+        period_end=period_end,
+        row_count=len(rows),
+        data=zlib.compress(json.dumps(rows, cls=DjangoJSONEncoder, separators=(',', ':')).encode()),
+    )
+    if kind == 'points':
+        earned = [row[1] for row in rows if row[1] > 0]
+        spent = [row[1] for row in rows if row[1] < 0]
+        block.earned_count, block.points_earned = len(earned), sum(earned)
+        block.spent_count, block.points_spent = len(spent), -sum(spent)
+    return block
+
+
+def _decode(block):
+    """Rows of a block as (id, ..., created_at) lists, newest first"""
+    rows = json.loads(zlib.decompress(bytes(block.data)))
+    for row in rows:
+        row[-1] = parse_datetime(row[-1])
+    return rows
+
+
+def start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+class HistoryList:
+    """A user's rows of kind, hot rows from queryset first, then archived ones
+
+    points ('earned' or 'spent') and since (an aware datetime) filter the
+    archived rows the way the caller filtered queryset.
+    """
+
+    def __init__(self, kind, user, queryset, points=None, since=None):
+        self.kind = kind
+        self.user = user
+        self.queryset = queryset
+        self.points = points
+        self.since = since
+        self._hot_count = None
+        self._blocks = None
+
+    def _matches(self, row):
+        if self.since and row[-1] < self.since:
+            return False
+        if self.points == 'earned':
+            return row[1] > 0
+        if self.points == 'spent':
+            return row[1] < 0
+        return True
+
+    def blocks(self):
+        """[(block, number of matching rows)] of the user's archive, newest first"""
+        if self._blocks is None:
+            blocks = HistoryArchive.objects.filter(user=self.user, kind=self.kind).defer('data')
+            if self.since:
+                blocks = blocks.filter(period_end__gte=self.since)
+            self._blocks = []
+            for block in blocks.order_by('-period_end', '-id'):
+                if self.since and block.period_start < self.since:
+                    # Straddles the cutoff: count the matching rows themselves
+                    count = sum(1 for row in _decode(block) if self._matches(row))
+                elif self.points == 'earned':
+                    count = block.earned_count
+                elif self.points == 'spent':
+                    count = block.spent_count
+                else:
+                    count = block.row_count
+                if count:
+                    self._blocks.append((block, count))
+        return self._blocks
+
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.queryset.count()
+        return self._hot_count
+
+    def count(self):
+        return self.hot_count() + sum(count for _, count in self.blocks())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop
+        hot = self.hot_count()
+        items = list(self.queryset[start:stop]) if start < hot else []
+        if stop is not None and stop <= hot:
+            return items
+
+        skip = max(0, start - hot)
+        wanted = None if stop is None else stop - max(start, hot)
+        archived = []
+        for block, count in self.blocks():
+            if wanted is not None and len(archived) >= wanted:
+                break
+            if skip >= count:
+                skip -= count
+                continue
+            rows = [row for row in _decode(block) if self._matches(row)]
+            archived.extend(rows[skip:])
+            skip = 0
+        return items + self._instances(archived[:wanted])
+
+    def _instances(self, rows):
+        """Unsaved model instances for archived rows, with their relations looked up in bulk"""
+        label, _, fields = ARCHIVES[self.kind]
+        model = apps.get_model(label)
+        instances = [model(**dict(zip(fields, row))) for row in rows]
+        for name, related_label in ARCHIVE_RELATIONS[self.kind]:
+            ids = {getattr(instance, f'{name}_id') for instance in instances} - {None}
+            related = apps.get_model(related_label).objects.in_bulk(ids)
+            for instance in instances:
+                setattr(instance, name, related.get(getattr(instance, f'{name}_id')))
+        for instance in instances:
+            instance.user = self.user
+            instance.archived = True
+        return instances
+
+    def totals(self):
+        """(points earned, points spent) over all matching rows, hot and archived"""
+        sums = self.queryset.aggregate(
+            earned=Sum('points', filter=Q(points__gt=0)), spent=Sum('points', filter=Q(points__lt=0))
+        )
+        earned, spent = sums['earned'] or 0, -(sums['spent'] or 0)
+        for block, _ in self.blocks():
+            if self.since and block.period_start < self.since:
+                rows = [row for row in _decode(block) if self._matches(row)]
+                earned += sum(row[1] for row in rows if row[1] > 0)
+                spent -= sum(row[1] for row in rows if row[1] < 0)
+            else:
+                earned += block.points_earned if self.points != 'spent' else 0
+                spent += block.points_spent if self.points != 'earned' else 0
+        return earned, spent
+
+
+def point_history(user, type_filter='', date_filter=''):
+    """HistoryList of a user's point history with the history views' type and date filters"""
+    from trash.models import RewardPointHistory
+
+    history = RewardPointHistory.objects.filter(user=user).order_by('-created_at', '-id')
+    points = type_filter if type_filter in ('earned', 'spent') else None
+    if points == 'earned':
+        history = history.filter(points__gt=0)
+    elif points == 'spent':
+        history = history.filter(points__lt=0)
+
+    since = None
+    today = timezone.now().date()
+    if date_filter == 'today':
+        since = start_of_day(today)
+    elif date_filter == 'week':
+        since = start_of_day(today - timezone.timedelta(days=7))
+    elif date_filter == 'month':
+        since = start_of_day(today - timezone.timedelta(days=30))
+    if since:
+        history = history.filter(created_at__gte=since)
+    return HistoryList('points', user, history, points=points, since=since)
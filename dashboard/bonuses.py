@@ -0,0 +1,91 @@
+"""
+Bonus point campaigns.
+
+``bonus_recipients`` selects the users of a campaign (by society, user type
+and recent activity) as a queryset, and ``award_bonus`` credits all of them
+at once: the recipients are locked and listed once, then each chunk of them
+gets one ``UPDATE ... SET reward_points = reward_points + N`` and one insert
+of its RewardPointHistory rows, in one transaction. A campaign to thousands
+of users costs a handful of queries, credits exactly the users it records
+in the history, and either fully happens or not at all.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from trash.locations import KNOWN_SOCIETIES, SOCIETY_PATTERNS
+from trash.models import RewardPointHistory, TrashSubmission
+from .data_versions import bump_data_version
+
+MIN_BONUS_POINTS = 1
+MAX_BONUS_POINTS = 10000
+HISTORY_CHUNK_SIZE = 1000
+
+
+class BonusError(Exception):
+    pass
+
+
+def society_filter(society):
+    """Q matching users whose profile location or any submission is in the society"""
+    if society not in KNOWN_SOCIETIES:
+        raise BonusError(f'Unknown society: {society}')
+    # Whole words only, like location_key: "Quetta Road" is not in UET
+    return (
+        Exists(TrashSubmission.objects.filter(user=OuterRef('pk'), location_key__startswith=f'{society}:'))
+        | Q(location__iregex=SOCIETY_PATTERNS[society].pattern)
+    )
+
+
+def bonus_recipients(society=None, user_type=None, active_days=None, users=None):
+    """Active non-admin users matching every given filter
+
+    active_days keeps users who submitted trash in the last active_days days.
+    users narrows down an existing CustomUser queryset instead of all users.
+    """
+    recipients = (users if users is not None else CustomUser.objects.all()).filter(
+        status='active'
+    ).exclude(user_type='admin')
+    if society:
+        recipients = recipients.filter(society_filter(society))
+    if user_type:
+        recipients = recipients.filter(user_type=user_type)
+    if active_days:
+        since = timezone.now() - timedelta(days=active_days)
+        recipients = recipients.filter(Exists(TrashSubmission.objects.filter(user=OuterRef('pk'), created_at__gte=since)))
+    return recipients
+
+
+def award_bonus(recipients, points, reason, awarded_by=None):
+    """Add points to every user of the recipients queryset; returns the number of users"""
+    try:
+        points = int(points)
+    except (TypeError, ValueError):
+        raise BonusError('Invalid points value.')
+    if points < MIN_BONUS_POINTS or points > MAX_BONUS_POINTS:
+        raise BonusError('Points must be between 1 and 10,000.')
+    reason = (reason or '').strip()
+    if not reason:
+        raise BonusError('A reason is required.')
+
+    with transaction.atomic():
+        user_ids = list(recipients.select_for_update().values_list('id', flat=True))
+        if not user_ids:
+            return 0
+        now = timezone.now()
+        for start in range(0, len(user_ids), HISTORY_CHUNK_SIZE):
+            chunk = user_ids[start:start + HISTORY_CHUNK_SIZE]
+            # Credit the listed users, not a re-evaluation of recipients
+            CustomUser.objects.filter(id__in=chunk).update(
+                reward_points=F('reward_points') + points,
+                updated_at=now,
+            )
+            RewardPointHistory.objects.bulk_create([
+                RewardPointHistory(user_id=user_id, points=points, reason=f'Bonus: {reason}', awarded_by=awarded_by)
+                for user_id in chunk
+            ])
+    bump_data_version('users', 'rewards')
+    return len(user_ids)
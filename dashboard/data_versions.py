@@ -0,0 +1,84 @@
+"""
+Data versions for cache invalidation.
+
+Every data domain (users, submissions, ...) has a version number. Model
+signals bump the version whenever a row of that domain changes, and cached
+fragments and widget payloads include the versions they depend on in their
+cache key, so an update invalidates exactly the entries built from that data
+while everything else stays cached.
+
+The versions are rows of DataVersion rather than cache entries, so a bump in
+one worker process invalidates the fragments every worker caches. A version
+is the time of the last change in microseconds (or one more than the previous
+version, whichever is larger), and a bump made inside a transaction only
+happens once it commits: a page rendered meanwhile reads the old data under
+the old version, never old data under the new one.
+
+Bulk queryset updates bypass model signals; code doing those must call
+bump_data_version itself.
+"""
+import time
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .replica import require_version
+
+CACHE_KEY_PREFIX = 'data_version'
+
+# model label -> data domain
+MODEL_DOMAINS = {
+    'accounts.CustomUser': 'users',
+    'trash.TrashSubmission': 'submissions',
+    'trash.CollectionRecord': 'collections',
+    'trash.RewardPointHistory': 'rewards',
+    'trash.RewardClaim': 'claims',
+}
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def get_data_versions(*names):
+    """{domain: version} of the given domains"""
+    from .models import DataVersion
+
+    versions = dict(DataVersion.objects.filter(name__in=names).values_list('name', 'version'))
+    missing = [name for name in names if name not in versions]
+    if missing:
+        now = _now()
+        DataVersion.objects.bulk_create(
+            [DataVersion(name=name, version=now) for name in missing], ignore_conflicts=True
+        )
+        versions.update(DataVersion.objects.filter(name__in=missing).values_list('name', 'version'))
+    # Whatever is cached under these versions must not be built from an older replica
+    require_version(max(versions.values()))
+    return versions
+
+
+def get_data_version(*names):
+    """Combined version string of the given domains, usable in cache keys"""
+    versions = get_data_versions(*names)
+    return '-'.join(str(versions[name]) for name in names)
+
+
+def _bump(names):
+    from .models import DataVersion
+
+    now = _now()
+    updated = DataVersion.objects.filter(name__in=names).update(
+        version=Greatest(F('version') + 1, Value(now))
+    )
+    if updated < len(set(names)):
+        DataVersion.objects.bulk_create(
+            [DataVersion(name=name, version=now) for name in set(names)], ignore_conflicts=True
+        )
+
+
+def bump_data_version(*names):
+    """Invalidate everything cached against the given domains, once the current transaction commits"""
+    if names:
+        transaction.on_commit(partial(_bump, names))
@@ -0,0 +1,92 @@
+"""
+SQLite tuning.
+
+Every new SQLite connection gets DEFAULT_PRAGMAS, with the SQLITE_PRAGMAS
+setting's entries overriding or adding to them, through the
+connection_created signal:
+
+* ``journal_mode=WAL``: readers no longer block the writer nor the writer
+  the readers, and a commit appends to the log instead of rewriting pages.
+* ``synchronous=NORMAL``: in WAL mode a commit is durable once the log is
+  checkpointed; a power loss can only drop the last transactions, never
+  corrupt the database.
+* ``busy_timeout``: a connection waits this many milliseconds for the write
+  lock instead of failing with "database is locked".
+* ``cache_size`` / ``mmap_size`` / ``temp_store``: keep hot pages, memory
+  mapped reads and temporary b-trees in memory.
+
+Together with IMMEDIATE transactions (a transaction takes the write lock
+when it starts, so it never has to upgrade a read lock and deadlock),
+CONN_MAX_AGE (connections are reused across requests, so the pragmas run
+once per worker instead of per request) and CONN_HEALTH_CHECKS (a reused
+connection that went bad is replaced before the request uses it) this is
+what lets concurrent riders write without lock errors.
+``benchmark_sqlite`` measures the difference.
+
+The read replica (dashboard.replica) is a copy that is replaced as a whole,
+so its connections keep the rollback journal, skip the pragmas that write
+to the file and are opened with query_only.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # milliseconds
+    'cache_size': -64000,  # negative: KiB, so 64 MB
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+# Pragmas that change the database file, not applied to the replica
+WRITE_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+def sqlite_pragmas():
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def replica_pragmas():
+    pragmas = {name: value for name, value in sqlite_pragmas().items() if name not in WRITE_PRAGMAS}
+    pragmas['query_only'] = 1
+    return pragmas
+
+
+def apply_pragmas(cursor, pragmas=None):
+    """Run the PRAGMA statements on a DB-API cursor; returns the values SQLite reports back"""
+    applied = {}
+    for name, value in (sqlite_pragmas() if pragmas is None else pragmas).items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+        row = cursor.fetchone()
+        applied[name] = row[0] if row else value
+    return applied
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    from .replica import replica_alias
+
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, replica_pragmas() if connection.alias == replica_alias() else None)
+
+
+def connect_signals():
+    connection_created.connect(configure_connection, dispatch_uid='sqlite_pragmas')
+
+
+def database_status(using='default'):
+    """Current journal mode, synchronous level, busy timeout and page cache of a connection"""
+    from django.db import connections
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return {'vendor': connection.vendor}
+    status = {'vendor': 'sqlite'}
+    with connection.cursor() as cursor:
+        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size'):
+            cursor.execute(f'PRAGMA {name}')
+            status[name] = cursor.fetchone()[0]
+    return status
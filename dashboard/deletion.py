@@ -0,0 +1,119 @@
+"""
+Chunked bulk deletion.
+
+``QuerySet.delete()`` runs Django's delete collector, which loads every
+related row into memory to cascade and send signals, and deletes everything
+in one transaction, so on SQLite a reset holds the write lock from start to
+end. ``delete_in_chunks`` deletes a queryset in primary-key order instead,
+DELETE_CHUNK_SIZE rows per short transaction, with raw set-based DELETEs.
+Before a chunk is deleted the on_delete rule of every relation pointing at
+it is applied with one statement per relation (CASCADE rows are deleted the
+same way, SET_NULL columns are cleared), so the outcome matches ``delete()``
+without loading model instances. The lock is released between chunks, and
+DELETE_CHUNK_PAUSE gives waiting writers a chance to take it, so requests
+and other workers keep going during a reset.
+
+Signals are not sent: the search index entries of deleted rows are removed
+and the data versions of the deleted models bumped here instead. Every
+chunk commits on its own and only rows still matching the queryset are
+deleted, so an interrupted deletion is resumed by running it again.
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, deletion
+from django.db.models.deletion import get_candidate_relations_to_delete
+
+from .data_versions import MODEL_DOMAINS, bump_data_version
+from .search import MODEL_ENTITIES, search_service
+
+
+class DeletionError(Exception):
+    pass
+
+
+def delete_in_chunks(queryset, on_chunk=None, chunk_size=None, pause=None):
+    """Delete the rows of queryset chunk by chunk; returns the number of rows deleted
+
+    on_chunk(deleted) is called after each committed chunk with the number
+    of rows of queryset deleted so far.
+    """
+    chunk_size = chunk_size or getattr(settings, 'DELETE_CHUNK_SIZE', 1000)
+    pause = getattr(settings, 'DELETE_CHUNK_PAUSE', 0.02) if pause is None else pause
+    model = queryset.model
+    deleted = 0
+    last_pk = None
+    touched = set()
+    while True:
+        chunk = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        removed = {}
+        with transaction.atomic(using=queryset.db):
+            deleted += _delete_rows(model, pks, queryset.db, removed)
+        for label, label_pks in removed.items():
+            touched.add(label)
+            if label in MODEL_ENTITIES:
+                search_service.remove_objects(MODEL_ENTITIES[label], label_pks)
+        last_pk = pks[-1]
+        if on_chunk:
+            on_chunk(deleted)
+        if pause:
+            time.sleep(pause)
+
+    domains = {MODEL_DOMAINS[label] for label in touched if label in MODEL_DOMAINS}
+    if domains:
+        bump_data_version(*sorted(domains))
+    return deleted
+
+
+def _delete_rows(model, pks, using, removed):
+    """Delete the given rows of model after applying the on_delete rules pointing at them"""
+    for relation in get_candidate_relations_to_delete(model._meta):
+        field = relation.field
+        related_model = relation.related_model
+        related = related_model._base_manager.using(using).filter(**{f'{field.name}__in': pks})
+        on_delete = field.remote_field.on_delete
+        if on_delete is deletion.DO_NOTHING:
+            continue
+        if on_delete is deletion.SET_NULL:
+            related.update(**{field.name: None})
+        elif on_delete is deletion.CASCADE:
+            related_pks = list(related.values_list('pk', flat=True))
+            if related_pks:
+                _delete_rows(related_model, related_pks, using, removed)
+        else:
+            raise DeletionError(
+                f'{related_model._meta.label}.{field.name} ({on_delete.__name__}) cannot be deleted in chunks'
+            )
+
+    removed.setdefault(model._meta.label, []).extend(pks)
+    return model._base_manager.using(using).filter(pk__in=pks)._raw_delete(using)
+
+
+def system_data_steps():
+    """(label, queryset) of everything clear_system_data deletes, children before parents"""
+    from accounts.models import ActivityLog, CustomUser
+    from trash.models import (
+        CollectionRecord, IdempotencyKey, RewardClaim, RewardPointHistory,
+        RiderLocation, SubmissionEvent, TrashSubmission,
+    )
+    from .models import HistoryArchive
+
+    users = CustomUser.objects.exclude(user_type='admin')
+    return [
+        ('point history', RewardPointHistory.objects.all()),
+        ('archived history', HistoryArchive.objects.filter(Q(kind='points') | Q(user__in=users))),
+        ('submission events', SubmissionEvent.objects.all()),
+        ('collection records', CollectionRecord.objects.all()),
+        ('submissions', TrashSubmission.objects.all()),
+        ('reward claims', RewardClaim.objects.filter(user__in=users)),
+        ('rider locations', RiderLocation.objects.filter(rider__in=users)),
+        ('activity logs', ActivityLog.objects.filter(user__in=users)),
+        ('idempotency keys', IdempotencyKey.objects.filter(user__in=users)),
+        ('non-admin users', users),
+    ]
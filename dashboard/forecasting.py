@@ -0,0 +1,185 @@
+"""
+Pickup demand forecasts per area.
+
+Daily submission counts per area (the society:block of location_key, or
+"other" for unknown addresses) are rolled up into DailyAreaDemand, so
+forecasting never rescans the submissions table. The last DEMAND_HISTORY_DAYS
+of the rollup become one areas x days matrix, and a single seasonal model is
+fitted to every area at once with NumPy:
+
+* weekday factors: each weekday's mean over the area's overall mean, shrunk
+  towards 1 for areas with little history
+* level and trend: exponentially weighted least squares line through the
+  deseasonalized series, with a damped trend for the extrapolation
+* interval: weighted residual spread around the fitted values
+
+Forecasts are cached for DEMAND_FORECAST_CACHE_TIMEOUT. NumPy is only needed
+when a forecast is computed.
+"""
+import math
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from trash.locations import location_area
+
+OTHER_AREA = 'other'
+DEMAND_HISTORY_DAYS = 112  # 16 weeks
+SMOOTHING = 0.05  # weight decay per day of age
+TREND_DAMPING = 0.9
+SEASONAL_SHRINKAGE = 28  # submissions at which weekday factors get half weight
+SEASON_FLOOR = 0.05
+INTERVAL_Z = 1.64  # ~90% interval
+CACHE_KEY = 'demand_forecast:{horizon}:{date}'
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImproperlyConfigured('Demand forecasting requires NumPy (pip install numpy)')
+    return numpy
+
+
+def demand_area(key):
+    """Forecast area of a location key: "society:block" (or society), else "other" """
+    return location_area(key) or OTHER_AREA
+
+
+def refresh_rollup(since=None, rebuild=False):
+    """Recount DailyAreaDemand from `since` to today
+
+    By default starts the day before the last rolled-up day, so only recent
+    days are recounted; rebuild recounts the whole history.
+    """
+    from trash.models import TrashSubmission
+    from .models import DailyAreaDemand
+
+    if since is None and not rebuild:
+        last = DailyAreaDemand.objects.aggregate(last=Max('date'))['last']
+        since = last - timedelta(days=1) if last else None
+
+    submissions = TrashSubmission.objects.all()
+    if since is not None:
+        submissions = submissions.filter(created_at__date__gte=since)
+    counts = Counter()
+    for key, day, total in submissions.annotate(day=TruncDate('created_at')).values_list(
+        'location_key', 'day'
+    ).annotate(n=Count('id')).order_by():
+        counts[(demand_area(key), day)] += total
+
+    with transaction.atomic():
+        stale = DailyAreaDemand.objects.all()
+        if since is not None:
+            stale = stale.filter(date__gte=since)
+        stale.delete()
+        DailyAreaDemand.objects.bulk_create([
+            DailyAreaDemand(area=area, date=day, submissions=total)
+            for (area, day), total in counts.items()
+        ], batch_size=1000)
+    return len(counts)
+
+
+def demand_matrix(end, days=DEMAND_HISTORY_DAYS):
+    """(areas, areas x days count matrix) for the `days` days ending on `end`"""
+    from .models import DailyAreaDemand
+
+    np = _numpy()
+    start = end - timedelta(days=days - 1)
+    rows = list(DailyAreaDemand.objects.filter(date__gte=start, date__lte=end).values_list('area', 'date', 'submissions'))
+    areas = sorted({area for area, _, _ in rows})
+    position = {area: index for index, area in enumerate(areas)}
+    matrix = np.zeros((len(areas), days))
+    if rows:
+        area_index, date_index, totals = zip(*((position[area], (day - start).days, total) for area, day, total in rows))
+        matrix[list(area_index), list(date_index)] = totals
+    return areas, matrix
+
+
+def fit_forecast(history, first_weekday, horizon):
+    """Forecast every row of an areas x days matrix `horizon` days past its last column
+
+    Returns (forecast, lower, upper), each areas x horizon.
+    """
+    np = _numpy()
+    days = history.shape[1]
+    weekday = (np.arange(days) + first_weekday) % 7
+    future_weekday = (np.arange(days, days + horizon) + first_weekday) % 7
+
+    # Weekday factors, shrunk towards 1 when an area has little history
+    one_hot = np.eye(7)[weekday]
+    weekday_mean = history @ one_hot / np.maximum(one_hot.sum(axis=0), 1)
+    overall_mean = history.mean(axis=1, keepdims=True)
+    raw_season = np.divide(weekday_mean, overall_mean, out=np.ones_like(weekday_mean), where=overall_mean > 0)
+    volume = history.sum(axis=1, keepdims=True)
+    season = 1 + volume / (volume + SEASONAL_SHRINKAGE) * (raw_season - 1)
+
+    # Exponentially weighted least squares line through the deseasonalized series
+    deseasonalized = history / np.maximum(season[:, weekday], SEASON_FLOOR)
+    weights = (1 - SMOOTHING) ** np.arange(days)[::-1]
+    weights /= weights.sum()
+    t = np.arange(days)
+    t_mean = weights @ t
+    level_mean = deseasonalized @ weights
+    slope = ((deseasonalized - level_mean[:, None]) * (t - t_mean)) @ weights / (weights @ (t - t_mean) ** 2)
+    level = level_mean + slope * (days - 1 - t_mean)
+
+    fitted = (level_mean[:, None] + slope[:, None] * (t - t_mean)) * season[:, weekday]
+    spread = np.sqrt(((history - fitted) ** 2) @ weights)
+
+    steps = np.arange(1, horizon + 1)
+    damped_steps = TREND_DAMPING * (1 - TREND_DAMPING ** steps) / (1 - TREND_DAMPING)
+    forecast = np.maximum((level[:, None] + slope[:, None] * damped_steps) * season[:, future_weekday], 0)
+    margin = INTERVAL_Z * spread[:, None] * np.sqrt(steps)
+    return forecast, np.maximum(forecast - margin, 0), forecast + margin
+
+
+def compute_forecast(horizon=14):
+    """Forecast pickups per area for today and the following days"""
+    today = timezone.localdate()
+    history_end = today - timedelta(days=1)
+    areas, history = demand_matrix(history_end)
+    first_weekday = (history_end - timedelta(days=history.shape[1] - 1)).weekday()
+    forecast, lower, upper = fit_forecast(history, first_weekday, horizon)
+
+    per_rider = (getattr(settings, 'PICKUP_SLOT_RIDER_CAPACITY', 6)
+                 * len(getattr(settings, 'PICKUP_SLOT_HOURS', [(9, 12), (12, 15), (15, 18)])))
+    daily_totals = forecast.sum(axis=0)
+    recent = history[:, -28:].mean(axis=1)
+    result_areas = [{
+        'area': area,
+        'forecast': [round(value, 2) for value in forecast[index].tolist()],
+        'lower': [round(value, 2) for value in lower[index].tolist()],
+        'upper': [round(value, 2) for value in upper[index].tolist()],
+        'total': round(float(forecast[index].sum()), 2),
+        'recent_daily_average': round(float(recent[index]), 2),
+    } for index, area in enumerate(areas)]
+    result_areas.sort(key=lambda item: item['total'], reverse=True)
+
+    return {
+        'generated_at': timezone.now().isoformat(),
+        'horizon': horizon,
+        'history_days': history.shape[1],
+        'dates': [(today + timedelta(days=day)).isoformat() for day in range(horizon)],
+        'totals': [round(value, 2) for value in daily_totals.tolist()],
+        'riders_needed': [math.ceil(value / per_rider) for value in daily_totals.tolist()],
+        'areas': result_areas,
+    }
+
+
+def get_forecast(horizon=14, refresh=False):
+    """Cached forecast; refresh recomputes it after bringing the rollup up to date"""
+    key = CACHE_KEY.format(horizon=horizon, date=timezone.localdate().isoformat())
+    forecast = None if refresh else cache.get(key)
+    if forecast is None:
+        refresh_rollup()
+        forecast = compute_forecast(horizon)
+        cache.set(key, forecast, getattr(settings, 'DEMAND_FORECAST_CACHE_TIMEOUT', 6 * 60 * 60))
+    return forecast
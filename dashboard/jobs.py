@@ -0,0 +1,195 @@
+"""
+Background jobs backed by the database.
+
+Heavy operations (clearing data, customer imports, index rebuilds, exports)
+are queued as Job rows with ``enqueue`` and run by the ``run_jobs``
+management command, so requests return right away. No broker is needed:
+a worker claims the oldest due job with a conditional UPDATE, so several
+workers never run the same job.
+
+Handlers are registered by name with ``@register_job`` (see dashboard.tasks)
+and receive a JobContext to report progress. A handler that raises is
+retried up to its max_attempts, waiting JOB_RETRY_DELAY seconds doubled
+after each attempt. Progress reports double as heartbeats: a running job
+whose worker has not reported for JOB_STALE_TIMEOUT seconds is treated as
+abandoned and queued again. Long handlers can save a checkpoint with
+``ctx.checkpoint`` and read it back from ``ctx.state`` to resume where a
+failed or abandoned attempt stopped.
+"""
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+_registry = {}
+
+
+def register_job(name):
+    """Register the decorated function as the handler of jobs called name"""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def job_handler(name):
+    # Handlers register themselves when dashboard.tasks is imported
+    from . import tasks  # noqa: F401
+    return _registry.get(name)
+
+
+def registered_jobs():
+    from . import tasks  # noqa: F401
+    return sorted(_registry)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class JobContext:
+    """Passed to handlers to report progress"""
+
+    def __init__(self, job):
+        self.job = job
+
+    @property
+    def params(self):
+        return self.job.params
+
+    def progress(self, done, total=None, message=None):
+        """Record progress (and a heartbeat); total and message are kept when omitted"""
+        changes = {'progress_done': done, 'heartbeat_at': timezone.now()}
+        if total is not None:
+            changes['progress_total'] = total
+        if message is not None:
+            changes['message'] = message[:255]
+        Job.objects.filter(id=self.job.id).update(**changes)
+        for field, value in changes.items():
+            setattr(self.job, field, value)
+
+    @property
+    def state(self):
+        """Checkpoint saved by an earlier attempt of this job, or {}"""
+        return self.job.result or {}
+
+    def checkpoint(self, state):
+        """Save JSON-serializable state for a later attempt; replaced by the result on success"""
+        Job.objects.filter(id=self.job.id).update(result=state, heartbeat_at=timezone.now())
+        self.job.result = state
+
+
+def enqueue(name, params=None, created_by=None, max_attempts=None, unique=True):
+    """Queue a job; with unique, returns the queued or running job with the same name and params instead"""
+    if job_handler(name) is None:
+        raise ValueError(f'Unknown job: {name}')
+    params = params or {}
+    if unique:
+        existing = Job.objects.filter(name=name, params=params, status__in=ACTIVE_STATUSES).first()
+        if existing is not None:
+            return existing
+    return Job.objects.create(
+        name=name,
+        params=params,
+        created_by=created_by,
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 3),
+    )
+
+
+def requeue_stale():
+    """Queue again the running jobs whose worker stopped reporting"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'JOB_STALE_TIMEOUT', 600))
+    stale = Job.objects.filter(status='running', heartbeat_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', error='Worker stopped responding', finished_at=timezone.now()
+    )
+    return failed + stale.update(status='queued', worker='')
+
+
+def claim_next(worker):
+    """Take the oldest due queued job for this worker, or None"""
+    while True:
+        now = timezone.now()
+        candidate = Job.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'id').values_list('id', flat=True).first()
+        if candidate is None:
+            return None
+        claimed = Job.objects.filter(id=candidate, status='queued').update(
+            status='running',
+            worker=worker,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            heartbeat_at=now,
+            error='',
+        )
+        if claimed:
+            return Job.objects.get(id=candidate)
+        # Another worker got it first; try the next one
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome"""
+    handler = job_handler(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job {job.name}')
+        result = handler(JobContext(job), **job.params)
+    except Exception:
+        error = traceback.format_exc()
+        retry = handler is not None and job.attempts < job.max_attempts
+        changes = {'error': error, 'worker': '', 'heartbeat_at': None}
+        if retry:
+            delay = getattr(settings, 'JOB_RETRY_DELAY', 30) * 2 ** (job.attempts - 1)
+            changes.update(status='queued', run_after=timezone.now() + timedelta(seconds=delay))
+        else:
+            changes.update(status='failed', finished_at=timezone.now())
+        Job.objects.filter(id=job.id, status='running').update(**changes)
+        return False
+
+    Job.objects.filter(id=job.id, status='running').update(
+        status='succeeded',
+        result=result,
+        progress_done=F('progress_total'),
+        finished_at=timezone.now(),
+        worker='',
+    )
+    return True
+
+
+def cancel(job_ids):
+    """Cancel queued jobs; running jobs finish their current attempt"""
+    return Job.objects.filter(id__in=job_ids, status='queued').update(status='cancelled', finished_at=timezone.now())
+
+
+def retry(job_ids):
+    """Queue failed or cancelled jobs again with a fresh set of attempts"""
+    return Job.objects.filter(id__in=job_ids, status__in=('failed', 'cancelled')).update(
+        status='queued', attempts=0, run_after=timezone.now(), finished_at=None, error=''
+    )
+
+
+def job_status(job):
+    return {
+        'id': job.id,
+        'name': job.name,
+        'params': job.params,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'progress': job.progress,
+        'progress_done': job.progress_done,
+        'progress_total': job.progress_total,
+        'message': job.message,
+        'result': job.result,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
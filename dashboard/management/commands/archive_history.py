@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from dashboard.archive import ARCHIVES, DEFAULT_BATCH_SIZE, archive
+
+class Command(BaseCommand):
+    help = 'Move point history and activity log rows older than the archive horizon into compressed archive blocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Archive rows older than this many days (default: HISTORY_ARCHIVE_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--kind',
+            choices=sorted(ARCHIVES) + ['all'],
+            default='all',
+            help='Which history to archive (default: all)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Users archived per transaction (default: {DEFAULT_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else getattr(settings, 'HISTORY_ARCHIVE_AFTER_DAYS', 365)
+        before = timezone.now() - timedelta(days=days)
+        kinds = sorted(ARCHIVES) if options['kind'] == 'all' else [options['kind']]
+        for kind in kinds:
+            rows, blocks = archive(kind, before, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{kind}: archived {rows} rows older than {before:%Y-%m-%d} into {blocks} blocks'
+            ))
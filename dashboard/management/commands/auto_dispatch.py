@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from trash.dispatch import auto_dispatch
+
+class Command(BaseCommand):
+    help = 'Assign pending trash submissions to active riders by area and open load'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show the plan without assigning anything',
+        )
+        parser.add_argument(
+            '--area',
+            help='Only dispatch submissions whose area starts with this key (e.g. "uet" or "uet:b")',
+        )
+        parser.add_argument(
+            '--max-per-rider',
+            type=int,
+            help='Leave submissions pending rather than give a rider more open pickups than this',
+        )
+
+    def handle(self, *args, **options):
+        result = auto_dispatch(
+            dry_run=options['dry_run'],
+            area=options['area'],
+            max_per_rider=options['max_per_rider'],
+        )
+
+        for assignment in result['assignments']:
+            areas = ', '.join(f"{chunk['area']} ({len(chunk['submission_ids'])})" for chunk in assignment['areas'])
+            planned = sum(len(chunk['submission_ids']) for chunk in assignment['areas'])
+            self.stdout.write(
+                f"{assignment['rider']}: {assignment['open_load_before']} open + {planned} new - {areas}"
+            )
+        if result['unassigned']:
+            self.stdout.write(self.style.WARNING(f"{len(result['unassigned'])} submissions left pending"))
+
+        if result['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Dry run: would assign {result['planned_count']} of {result['pending_count']} pending submissions"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Assigned {result['assigned_count']} of {result['pending_count']} pending submissions"
+            ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from trash.locations import location_key
+from trash.models import TrashSubmission
+from dashboard.data_versions import bump_data_version
+
+class Command(BaseCommand):
+    help = 'Compute location_key for existing trash submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute every key, not only the missing ones (use after changing the normalization)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows updated per query',
+        )
+
+    def handle(self, *args, **options):
+        submissions = TrashSubmission.objects.only('id', 'location', 'location_key').order_by('id')
+        if not options['all']:
+            submissions = submissions.filter(location_key='')
+
+        batch = []
+        updated = 0
+        for submission in submissions.iterator(chunk_size=options['batch_size']):
+            key = location_key(submission.location)
+            if key != submission.location_key:
+                submission.location_key = key
+                batch.append(submission)
+            if len(batch) >= options['batch_size']:
+                updated += TrashSubmission.objects.bulk_update(batch, ['location_key'])
+                batch = []
+        if batch:
+            updated += TrashSubmission.objects.bulk_update(batch, ['location_key'])
+
+        if updated:
+            # bulk_update bypasses the signals that invalidate cached analytics
+            bump_data_version('submissions')
+        self.stdout.write(self.style.SUCCESS(f'Updated location_key on {updated} submissions'))
@@ -0,0 +1,164 @@
+import multiprocessing
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from dashboard.database import apply_pragmas, database_status, sqlite_pragmas
+
+SUBMISSIONS = 1000
+
+# name -> (pragmas, BEGIN statement, reuse the connection across requests)
+CONFIGURATIONS = {
+    # What Django does without tuning: rollback journal, DEFERRED
+    # transactions, the 5 second driver timeout and a new connection per request
+    'default': ({}, 'BEGIN', False),
+    'tuned': (None, 'BEGIN IMMEDIATE', True),
+}
+
+
+def _create_database(path, pragmas):
+    conn = sqlite3.connect(path, isolation_level=None)
+    apply_pragmas(conn.cursor(), pragmas)
+    conn.executescript(
+        """
+        CREATE TABLE location (
+            id INTEGER PRIMARY KEY, rider_id INTEGER, latitude REAL, longitude REAL, recorded_at REAL
+        );
+        CREATE INDEX location_rider_idx ON location (rider_id, recorded_at);
+        CREATE TABLE submission (id INTEGER PRIMARY KEY, rider_id INTEGER, status TEXT, updated_at REAL);
+        """
+    )
+    conn.executemany(
+        'INSERT INTO submission (id, rider_id, status, updated_at) VALUES (?, NULL, ?, ?)',
+        [(i, 'pending', time.time()) for i in range(1, SUBMISSIONS + 1)],
+    )
+    conn.close()
+
+
+def _writer(path, pragmas, begin, persistent, deadline, worker):
+    """Rider requests: read the rider's last ping, insert a ping, update a submission"""
+    rng = random.Random(worker)
+    conn = None
+    done = errors = 0
+    latencies = []
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+                apply_pragmas(conn.cursor(), pragmas)
+            conn.execute(begin)
+            try:
+                conn.execute('SELECT MAX(recorded_at) FROM location WHERE rider_id = ?', (worker,)).fetchone()
+                conn.execute(
+                    'INSERT INTO location (rider_id, latitude, longitude, recorded_at) VALUES (?, ?, ?, ?)',
+                    (worker, 31.5 + rng.random() / 10, 74.3 + rng.random() / 10, time.time()),
+                )
+                conn.execute(
+                    'UPDATE submission SET rider_id = ?, status = ?, updated_at = ? WHERE id = ?',
+                    (worker, rng.choice(['assigned', 'in_progress', 'collected']), time.time(),
+                     rng.randint(1, SUBMISSIONS)),
+                )
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            done += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            errors += 1
+        if not persistent and conn is not None:
+            conn.close()
+            conn = None
+    return 'write', done, errors, latencies
+
+
+def _reader(path, pragmas, begin, persistent, deadline, worker):
+    """Dashboard requests reading while the riders write"""
+    conn = None
+    done = errors = 0
+    latencies = []
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+                apply_pragmas(conn.cursor(), pragmas)
+            conn.execute('SELECT status, COUNT(*) FROM submission GROUP BY status').fetchall()
+            conn.execute('SELECT rider_id, COUNT(*) FROM location GROUP BY rider_id').fetchall()
+            done += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            errors += 1
+        if not persistent and conn is not None:
+            conn.close()
+            conn = None
+    return 'read', done, errors, latencies
+
+
+def _run(job):
+    func, *args = job
+    return func(*args)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent SQLite write throughput with the default and the tuned configuration'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Concurrent writer processes (default: 8)')
+        parser.add_argument('--readers', type=int, default=2, help='Concurrent reader processes (default: 2)')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration of each run (default: 10)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Configured database: {database_status()}")
+        self.stdout.write(
+            f"{options['writers']} writers, {options['readers']} readers, {options['seconds']:g}s per configuration"
+        )
+        directory = Path(tempfile.mkdtemp(prefix='sqlite-benchmark-'))
+        results = {}
+        try:
+            for name, (pragmas, begin, persistent) in CONFIGURATIONS.items():
+                pragmas = sqlite_pragmas() if pragmas is None else pragmas
+                path = str(directory / f'{name}.sqlite3')
+                _create_database(path, pragmas)
+                deadline = time.time() + options['seconds']
+                jobs = [(_writer, path, pragmas, begin, persistent, deadline, worker)
+                        for worker in range(options['writers'])]
+                jobs += [(_reader, path, pragmas, begin, persistent, deadline, worker)
+                         for worker in range(options['readers'])]
+                with multiprocessing.Pool(len(jobs)) as pool:
+                    results[name] = pool.map(_run, jobs)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        header = f"{'config':<8} {'writes/s':>9} {'lock errors':>11} {'write p50':>10} {'write p99':>10} {'reads/s':>8} {'read p99':>9}"
+        self.stdout.write(header)
+        throughput = {}
+        for name, runs in results.items():
+            writes = [run for run in runs if run[0] == 'write']
+            reads = [run for run in runs if run[0] == 'read']
+            write_latencies = [value for run in writes for value in run[3]]
+            read_latencies = [value for run in reads for value in run[3]]
+            throughput[name] = sum(run[1] for run in writes) / options['seconds']
+            self.stdout.write(
+                f"{name:<8} {throughput[name]:>9.0f} {sum(run[2] for run in runs):>11} "
+                f"{_percentile(write_latencies, 0.5):>8.2f}ms {_percentile(write_latencies, 0.99):>8.2f}ms "
+                f"{sum(run[1] for run in reads) / options['seconds']:>8.0f} {_percentile(read_latencies, 0.99):>7.1f}ms"
+            )
+        if throughput.get('default'):
+            self.stdout.write(self.style.SUCCESS(
+                f"Tuned write throughput: {throughput['tuned'] / throughput['default']:.1f}x the default"
+            ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from trash.exports import EXPORTS, EXPORT_FORMATS, DEFAULT_CHUNK_SIZE, stream_export
+
+class Command(BaseCommand):
+    help = 'Stream submissions, collections, point history or claims to a CSV/JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORTS), help='What to export')
+        parser.add_argument('--output', choices=EXPORT_FORMATS, default='csv', help='Export format')
+        parser.add_argument('--file', help='Write to this file instead of stdout')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows fetched from the database per round trip')
+        # Same filters as the list views
+        parser.add_argument('--status')
+        parser.add_argument('--claim-type', dest='claim_type')
+        parser.add_argument('--type', choices=['earned', 'spent'], help='Point history direction')
+        parser.add_argument('--search')
+        parser.add_argument('--date', choices=['today', 'week', 'month'])
+        parser.add_argument('--start-date', dest='start_date', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--end-date', dest='end_date', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--user', type=int, help='User ID')
+        parser.add_argument('--rider', type=int, help='Rider ID')
+
+    def handle(self, *args, **options):
+        params = {
+            key: options[key]
+            for key in ('status', 'claim_type', 'type', 'search', 'date', 'start_date', 'end_date', 'user', 'rider')
+            if options[key]
+        }
+
+        output = open(options['file'], 'w', newline='', encoding='utf-8') if options['file'] else None
+        rows = 0
+        try:
+            for line in stream_export(options['dataset'], params, options['output'], options['chunk_size']):
+                if output:
+                    output.write(line)
+                else:
+                    self.stdout.write(line, ending='')
+                rows += 1
+        except Exception as e:
+            raise CommandError(str(e))
+        finally:
+            if output:
+                output.close()
+
+        if output:
+            # The CSV header is not a data row
+            if options['output'] == 'csv':
+                rows -= 1
+            self.stderr.write(self.style.SUCCESS(f'Exported {rows} rows to {options["file"]}'))
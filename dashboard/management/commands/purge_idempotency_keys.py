@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from trash.idempotency import purge_expired
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys whose stored responses have expired'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.search import SEARCH_ENTITIES, search_service
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of users, submissions and claims'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'entities',
+            nargs='*',
+            help=f'Entities to rebuild: {", ".join(sorted(SEARCH_ENTITIES))} (default: all)',
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['entities']) - set(SEARCH_ENTITIES)
+        if unknown:
+            raise CommandError(f'Unknown entities: {", ".join(sorted(unknown))}')
+
+        backend = type(search_service.backend).__name__
+        for entity in options['entities'] or SEARCH_ENTITIES:
+            search_service.rebuild(entity)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {entity} index ({backend})'))
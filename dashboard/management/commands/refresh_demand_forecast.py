@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from dashboard.forecasting import get_forecast, refresh_rollup
+
+class Command(BaseCommand):
+    help = 'Update the daily area demand rollup and recompute the cached pickup forecast'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recount the whole rollup instead of only the most recent days',
+        )
+        parser.add_argument(
+            '--horizon',
+            type=int,
+            default=14,
+            help='Days to forecast',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['rebuild']:
+            rows = refresh_rollup(rebuild=True)
+            self.stdout.write(f'Rebuilt rollup: {rows} area-days')
+
+        forecast = get_forecast(options['horizon'], refresh=True)
+        for area in forecast['areas'][:10]:
+            self.stdout.write(f"{area['area']}: {area['total']} pickups over {forecast['horizon']} days")
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast {len(forecast['areas'])} areas in {time.perf_counter() - started:.2f}s; "
+            f"riders needed per day: {forecast['riders_needed']}"
+        ))
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from dashboard.replica import refresh_replica
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database over the read replica used by analytics and exports'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            nargs='?',
+            const=-1,
+            default=None,
+            help='Keep refreshing every this many seconds (without a value: REPLICA_REFRESH_INTERVAL)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval == -1:
+            interval = getattr(settings, 'REPLICA_REFRESH_INTERVAL', 5 * 60)
+
+        while True:
+            started = time.monotonic()
+            try:
+                path = refresh_replica()
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f'Refreshed {path.name} in {time.monotonic() - started:.2f}s'
+            ))
+            if not interval:
+                return
+            close_old_connections()
+            time.sleep(max(0, interval - (time.monotonic() - started)))
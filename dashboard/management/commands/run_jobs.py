@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dashboard.jobs import claim_next, requeue_stale, run_job, worker_name
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (clear data, imports, exports, ...) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the jobs that are due now and exit instead of waiting for more',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            default=0,
+            help='Exit after running this many jobs (default: no limit)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=None,
+            help='Seconds to wait when the queue is empty (default: JOB_POLL_INTERVAL)',
+        )
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        sleep = options['sleep'] if options['sleep'] is not None else getattr(settings, 'JOB_POLL_INTERVAL', 2)
+        ran = 0
+        self.stdout.write(f'Worker {worker} started')
+        try:
+            while not options['max_jobs'] or ran < options['max_jobs']:
+                close_old_connections()
+                requeue_stale()
+                job = claim_next(worker)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(sleep)
+                    continue
+
+                started = time.perf_counter()
+                self.stdout.write(f'Running job #{job.id} {job.name} (attempt {job.attempts}/{job.max_attempts})')
+                succeeded = run_job(job)
+                ran += 1
+                elapsed = time.perf_counter() - started
+                if succeeded:
+                    self.stdout.write(self.style.SUCCESS(f'Job #{job.id} succeeded in {elapsed:.2f}s'))
+                else:
+                    job.refresh_from_db(fields=['status', 'error'])
+                    self.stdout.write(self.style.ERROR(
+                        f'Job #{job.id} failed in {elapsed:.2f}s ({job.status}): '
+                        f'{job.error.strip().splitlines()[-1] if job.error else ""}'
+                    ))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping')
+        self.stdout.write(f'Worker {worker} ran {ran} jobs')
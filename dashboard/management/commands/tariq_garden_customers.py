@@ -8,6 +8,7 @@ from decimal import Decimal
 from difflib import SequenceMatcher
 from accounts.models import CustomUser
 from trash.models import TrashSubmission, CollectionRecord, RewardPointHistory
+from trash.locations import normalize_address, extract_house_number
 
 class Command(BaseCommand):
     help = 'Create demo data for Tariq Garden customers with collection records'
@@ -114,31 +115,16 @@ class Command(BaseCommand):
         """Calculate similarity between two strings"""
         return SequenceMatcher(None, a.lower(), b.lower()).ratio()
 
-    def extract_house_number(self, address):
-        """Extract house number from address"""
-        match = re.match(r'^(\d+)', address.strip())
-        if match:
-            return match.group(1)
-        return None
-
-    def normalize_address(self, address):
-        """Normalize address for better matching"""
-        if not address:
-            return ""
-        normalized = re.sub(r'\s+', ' ', address.lower().strip())
-        normalized = normalized.replace('street', 'st').replace('block', 'blk')
-        return normalized
-
     def find_matching_collections(self, user_address, collection_data):
         """Find collection records that match the user's address"""
         matches = []
-        user_house_num = self.extract_house_number(user_address)
-        user_normalized = self.normalize_address(user_address)
+        user_house_num = extract_house_number(user_address)
+        user_normalized = normalize_address(user_address)
         
         for collection in collection_data:
             collection_address = collection.get('address', '')
-            collection_house_num = self.extract_house_number(collection_address)
-            collection_normalized = self.normalize_address(collection_address)
+            collection_house_num = extract_house_number(collection_address)
+            collection_normalized = normalize_address(collection_address)
             
             if user_house_num and collection_house_num and user_house_num == collection_house_num:
                 if 'tariq garden' in user_normalized and 'tariq garden' in collection_normalized:
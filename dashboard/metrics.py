@@ -0,0 +1,253 @@
+"""
+In-process request metrics.
+
+Each worker keeps request counters and latency histograms in memory and
+merges them into a small shared SQLite file METRICS_FLUSH_INTERVAL seconds
+after the oldest unmerged sample (on the next request, or from a timer when
+the worker is idle) and when the process exits, so the metrics endpoint can
+report totals across every worker without an external APM.
+
+Histograms use fixed log-linear buckets (HDR-style): every power of two
+between 1ms and ~2 minutes is split into SUB_BUCKETS equal steps, which keeps
+the relative error of any bucket below 1 / SUB_BUCKETS.
+"""
+import atexit
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+SUB_BUCKETS = 4
+MAX_EXPONENT = 17  # 2 ** 17 ms ~= 131 seconds
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRIC_PREFIX = 'trash_to_treasure_http'
+
+
+def _build_bucket_bounds():
+    """Upper bounds (ms) of the histogram buckets, ascending"""
+    bounds = []
+    for exponent in range(MAX_EXPONENT):
+        base = 2 ** exponent
+        for step in range(1, SUB_BUCKETS + 1):
+            bound = base + base * step / SUB_BUCKETS
+            if not bounds or bound > bounds[-1]:
+                bounds.append(bound)
+    return [1.0] + bounds
+
+
+BUCKET_BOUNDS_MS = _build_bucket_bounds()
+OVERFLOW_BUCKET = len(BUCKET_BOUNDS_MS)
+
+
+def bucket_index(duration_ms):
+    """Index of the bucket a duration falls into (OVERFLOW_BUCKET for +Inf)"""
+    return bisect_left(BUCKET_BOUNDS_MS, duration_ms)
+
+
+class _Series:
+    __slots__ = ('count', 'sum_ms', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.sum_ms = 0.0
+        self.buckets = Counter()
+
+
+class MetricsRegistry:
+    """Thread-safe registry of per (view, status, user_type) request metrics"""
+
+    def __init__(self, db_path=None, flush_interval=None):
+        self._db_path = db_path
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._schema_ready = False
+
+    @property
+    def db_path(self):
+        if self._db_path is None:
+            self._db_path = Path(getattr(
+                settings, 'METRICS_DB_PATH', Path(settings.BASE_DIR) / 'metrics.sqlite3'
+            ))
+        return self._db_path
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is None:
+            self._flush_interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+        return self._flush_interval
+
+    def observe(self, view, status_code, user_type, duration_ms):
+        """Record one finished request"""
+        key = (view, int(status_code), user_type)
+        with self._lock:
+            series = self._pending.get(key)
+            if series is None:
+                series = self._pending[key] = _Series()
+            series.count += 1
+            series.sum_ms += duration_ms
+            series.buckets[bucket_index(duration_ms)] += 1
+            if self._timer is None:
+                # Flushes the samples of a worker that receives no further request
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Merge the pending in-memory deltas into the shared store"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+
+        try:
+            with self._connection() as conn:
+                conn.executemany(
+                    """
+                    INSERT INTO request_metrics (view, status, user_type, count, sum_ms)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (view, status, user_type) DO UPDATE SET
+                        count = count + excluded.count,
+                        sum_ms = sum_ms + excluded.sum_ms
+                    """,
+                    [(*key, series.count, series.sum_ms) for key, series in pending.items()],
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO request_metric_buckets (view, status, user_type, bucket, count)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (view, status, user_type, bucket) DO UPDATE SET
+                        count = count + excluded.count
+                    """,
+                    [
+                        (*key, bucket, count)
+                        for key, series in pending.items()
+                        for bucket, count in series.buckets.items()
+                    ],
+                )
+        except sqlite3.Error:
+            # Put the deltas back so they are retried on the next flush
+            with self._lock:
+                for key, series in pending.items():
+                    current = self._pending.setdefault(key, _Series())
+                    current.count += series.count
+                    current.sum_ms += series.sum_ms
+                    current.buckets.update(series.buckets)
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def collect(self):
+        """Return the aggregated metrics of all workers"""
+        self.flush()
+        series = {}
+        with self._connection() as conn:
+            for view, status_code, user_type, count, sum_ms in conn.execute(
+                'SELECT view, status, user_type, count, sum_ms FROM request_metrics'
+            ):
+                series[(view, status_code, user_type)] = {
+                    'count': count, 'sum_ms': sum_ms, 'buckets': {},
+                }
+            for view, status_code, user_type, bucket, count in conn.execute(
+                'SELECT view, status, user_type, bucket, count FROM request_metric_buckets'
+            ):
+                entry = series.get((view, status_code, user_type))
+                if entry is not None:
+                    entry['buckets'][bucket] = count
+        return series
+
+    def render_prometheus(self):
+        """Render the aggregated metrics in the Prometheus text exposition format"""
+        series = sorted(self.collect().items())
+        lines = [
+            f'# HELP {METRIC_PREFIX}_requests_total Total HTTP requests by view, status and user type.',
+            f'# TYPE {METRIC_PREFIX}_requests_total counter',
+        ]
+        for key, entry in series:
+            lines.append(f'{METRIC_PREFIX}_requests_total{{{_labels(key)}}} {entry["count"]}')
+
+        name = f'{METRIC_PREFIX}_request_duration_seconds'
+        lines.append(f'# HELP {name} Request latency by view, status and user type.')
+        lines.append(f'# TYPE {name} histogram')
+        for key, entry in series:
+            labels = _labels(key)
+            buckets = entry['buckets']
+            highest = max((b for b in buckets if b < OVERFLOW_BUCKET), default=-1)
+            cumulative = 0
+            for index in range(highest + 1):
+                cumulative += buckets.get(index, 0)
+                le = _format_float(BUCKET_BOUNDS_MS[index] / 1000)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+            lines.append(f'{name}_sum{{{labels}}} {_format_float(entry["sum_ms"] / 1000)}')
+            lines.append(f'{name}_count{{{labels}}} {entry["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            if not self._schema_ready:
+                self._create_schema(conn)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _create_schema(self, conn):
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS request_metrics (
+                view TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                user_type TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                sum_ms REAL NOT NULL,
+                PRIMARY KEY (view, status, user_type)
+            );
+            CREATE TABLE IF NOT EXISTS request_metric_buckets (
+                view TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                user_type TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (view, status, user_type, bucket)
+            );
+            """
+        )
+        self._schema_ready = True
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(key):
+    view, status_code, user_type = key
+    return (f'view="{_escape_label(view)}",status="{status_code}",'
+            f'user_type="{_escape_label(user_type)}"')
+
+
+def _format_float(value):
+    return f'{value:.6f}'.rstrip('0').rstrip('.') or '0'
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
@@ -1,8 +1,18 @@
+import heapq
+import json
+import logging
+import time
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.http import HttpResponse, Http404
 from django.conf import settings as django_settings
+from django.db import connections
 from django.template.loader import render_to_string
+from django.utils import timezone
 
 class SystemStatusMiddleware:
     """Middleware to check system status and redirect users accordingly"""
@@ -138,3 +148,166 @@ class SystemStatusMiddleware:
                 """, 
                 status=404
             )
+
+
+class _QueryProfile:
+    """Execute wrapper that counts queries and keeps the slowest statements"""
+    
+    def __init__(self, keep):
+        self.keep = keep
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = []  # min-heap of (duration_ms, sequence, sql)
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.total_ms += duration
+            entry = (duration, self.count, sql)
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, entry)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+    
+    def top_queries(self):
+        return [
+            {'ms': round(duration, 2), 'sql': sql}
+            for duration, _, sql in sorted(self.slowest, reverse=True)
+        ]
+
+
+class QueryProfilingMiddleware:
+    """Opt-in per-request SQL profiling with a rotating slow-request log.
+    
+    Profiling is switched on for every request with the QUERY_PROFILING_ENABLED
+    setting, or for a single request by an admin sending ``X-Profile-Request: 1``.
+    When neither applies the request is passed straight through.
+    """
+    
+    HEADER = 'HTTP_X_PROFILE_REQUEST'
+    LOGGER_NAME = 'trash_to_treasure.slow_requests'
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(django_settings, 'QUERY_PROFILING_ENABLED', False)
+        self.slow_ms = getattr(django_settings, 'QUERY_PROFILING_SLOW_MS', 500)
+        self.top_n = getattr(django_settings, 'QUERY_PROFILING_TOP_QUERIES', 5)
+        self._logger = None
+    
+    def __call__(self, request):
+        header_requested = request.META.get(self.HEADER, '').lower() in ('1', 'true', 'yes')
+        if not self.enabled and not header_requested:
+            return self.get_response(request)
+        
+        profile = _QueryProfile(self.top_n)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(profile))
+            response = self.get_response(request)
+        wall_ms = (time.perf_counter() - start) * 1000
+        
+        # The header only counts for admins; API views authenticate inside the
+        # view, so the user is checked after the response has been produced
+        admin_requested = header_requested and self._is_admin_user(request)
+        if not self.enabled and not admin_requested:
+            return response
+        
+        if admin_requested:
+            response['X-Query-Count'] = str(profile.count)
+            response['Server-Timing'] = (
+                f'sql;dur={profile.total_ms:.1f};desc="{profile.count} queries", '
+                f'view;dur={wall_ms:.1f}'
+            )
+        
+        if admin_requested or wall_ms >= self.slow_ms:
+            self._write_record(request, response, profile, wall_ms)
+        
+        return response
+    
+    def _is_admin_user(self, request):
+        """Check if the current user is an admin"""
+        user = getattr(request, 'user', None)
+        return (user is not None and
+                user.is_authenticated and
+                getattr(user, 'user_type', None) == 'admin')
+    
+    def _write_record(self, request, response, profile, wall_ms):
+        """Append one JSON line describing the request to the slow-request log"""
+        user = getattr(request, 'user', None)
+        resolver_match = getattr(request, 'resolver_match', None)
+        record = {
+            'timestamp': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': resolver_match.view_name if resolver_match else None,
+            'status': response.status_code,
+            'user_id': user.id if user is not None and user.is_authenticated else None,
+            'wall_ms': round(wall_ms, 2),
+            'query_count': profile.count,
+            'sql_ms': round(profile.total_ms, 2),
+            'slowest_queries': profile.top_queries(),
+        }
+        try:
+            self._get_logger().info(json.dumps(record, default=str))
+        except Exception:
+            # Profiling must never break the request it is observing
+            pass
+    
+    def _get_logger(self):
+        if self._logger is None:
+            logger = logging.getLogger(self.LOGGER_NAME)
+            if not logger.handlers:
+                log_file = Path(getattr(
+                    django_settings, 'QUERY_PROFILING_LOG_FILE',
+                    Path(django_settings.BASE_DIR) / 'logs' / 'slow_requests.jsonl'
+                ))
+                log_file.parent.mkdir(parents=True, exist_ok=True)
+                handler = RotatingFileHandler(
+                    log_file,
+                    maxBytes=getattr(django_settings, 'QUERY_PROFILING_LOG_MAX_BYTES', 5 * 1024 * 1024),
+                    backupCount=getattr(django_settings, 'QUERY_PROFILING_LOG_BACKUP_COUNT', 5),
+                    encoding='utf-8',
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+            self._logger = logger
+        return self._logger
+
+
+class RequestMetricsMiddleware:
+    """Record request counts and latency per view, status and user type"""
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(django_settings, 'METRICS_ENABLED', True)
+    
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+        
+        try:
+            from .metrics import registry
+            resolver_match = getattr(request, 'resolver_match', None)
+            view = resolver_match.view_name if resolver_match else 'unmatched'
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                user_type = getattr(user, 'user_type', 'user')
+            else:
+                user_type = 'anonymous'
+            registry.observe(view, response.status_code, user_type, duration_ms)
+        except Exception:
+            # Metrics must never break the request they are measuring
+            pass
+        
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_systemsettings_co2_reduction_tons_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAreaDemand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('area', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('submissions', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'area'), name='dashboard_daily_area_demand_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Create the FTS5 search tables and index the existing rows (dashboard.search)"""
+    from dashboard.search import SEARCH_ENTITIES, SQLiteFTS5Backend, documents, search_service
+
+    if not isinstance(search_service.backend, SQLiteFTS5Backend):
+        return
+    for entity, (label, _) in SEARCH_ENTITIES.items():
+        SQLiteFTS5Backend.create_table(entity, schema_editor)
+        search_service.backend.index(entity, documents(entity, model=apps.get_model(label)))
+
+
+def drop_search_index(apps, schema_editor):
+    from dashboard.search import SEARCH_ENTITIES, SQLiteFTS5Backend
+
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for entity in SEARCH_ENTITIES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLiteFTS5Backend._table(entity)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_data_version'),
+        ('accounts', '0004_activity_log_timestamp_default'),
+        ('trash', '0015_payout_batch'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -62,3 +62,102 @@ class SystemSettings(models.Model):
         settings.trees_saved_count = 500
         settings.save()
         return settings
+
+class DailyAreaDemand(models.Model):
+    """Submissions per area and day, rolled up for forecasting (dashboard.forecasting)"""
+    area = models.CharField(max_length=100)
+    date = models.DateField()
+    submissions = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'area'], name='dashboard_daily_area_demand_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.area} on {self.date}: {self.submissions}"
+
+class DataVersion(models.Model):
+    """Version of a cached data domain, shared by all worker processes (dashboard.data_versions)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    # Microseconds since the epoch of the last change
+    version = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+class Job(models.Model):
+    """Background job run by the run_jobs worker (dashboard.jobs)"""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    )
+    
+    name = models.CharField(max_length=100)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    # Not picked up before this time; set for retries
+    run_after = models.DateTimeField(default=timezone.now)
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey('accounts.CustomUser', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Worker running the job and its last sign of life, to requeue jobs of dead workers
+    worker = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Workers take the oldest due queued job
+            models.Index(fields=['status', 'run_after'], name='dashboard_job_due_idx'),
+        ]
+    
+    @property
+    def progress(self):
+        """Percent done, or None while the job has not reported a total"""
+        if not self.progress_total:
+            return 100.0 if self.status == 'succeeded' else None
+        return round(100 * self.progress_done / self.progress_total, 1)
+    
+    def __str__(self):
+        return f"#{self.id} {self.name} ({self.status})"
+
+class HistoryArchive(models.Model):
+    """Compressed block of one user's point history or activity log rows for one month (dashboard.archive)"""
+    KIND_CHOICES = (
+        ('points', 'Point history'),
+        ('activity', 'Activity log'),
+    )
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    user = models.ForeignKey('accounts.CustomUser', on_delete=models.CASCADE, related_name='+')
+    # Oldest and newest row in the block
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    row_count = models.PositiveIntegerField()
+    # Point history totals, so earned/spent figures stay right without decompressing
+    earned_count = models.PositiveIntegerField(default=0)
+    spent_count = models.PositiveIntegerField(default=0)
+    points_earned = models.BigIntegerField(default=0)
+    points_spent = models.BigIntegerField(default=0)
+    # zlib-compressed JSON list of rows, newest first
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'kind', 'period_end'], name='dashboard_archive_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.kind} {self.period_start:%Y-%m}: {self.row_count} rows"
@@ -0,0 +1,203 @@
+"""
+Read replica for analytics.
+
+Analytics pages, dashboard aggregates and exports only read, but on the
+primary they compete with rider writes. Code wrapped in ``replica_reads``
+(a context manager and view decorator) sends its reads to the
+REPLICA_DATABASE_ALIAS database through ``ReplicaRouter``. Everything else,
+and every write, stays on the primary. Inside ``replica_reads`` reads still
+go to the primary:
+
+* inside a transaction, or once the code has written anything, so it reads
+  its own writes;
+* for objects related to an instance loaded from the primary;
+* when the replica is missing or older than REPLICA_MAX_LAG seconds;
+* once the code has looked up a data version (dashboard.data_versions) that
+  changed after the replica was copied. Cached fragments and widgets are
+  keyed by those versions, so a payload cached under a version is always
+  built from data at least as new as that version.
+
+Locally the replica is an SQLite copy of the primary made with the sqlite3
+backup API by ``refresh_replica`` (run it periodically with --interval, or
+queue it as a job). The copy is written to a temporary file and renamed
+over the replica, so readers see either the old or the new copy, never a
+partial one; its modification time is set to when the copy was taken. A
+server replica only needs its alias in DATABASES, but since its lag is
+unknown, versioned pages always read their data from the primary.
+"""
+import contextvars
+import os
+import sqlite3
+import time
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_scope = contextvars.ContextVar('replica_reads', default=None)
+
+# Models always read from the primary, whatever the scope
+PRIMARY_MODELS = {'dashboard.DataVersion'}
+
+# (checked at, available, snapshot time) of the last replica freshness check
+_availability = (0.0, False, None)
+AVAILABILITY_CHECK_INTERVAL = 1.0  # seconds
+
+
+def replica_alias():
+    return getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+
+
+class _Scope:
+    __slots__ = ('primary',)
+
+    def __init__(self):
+        # Set once the scope has to read from the primary
+        self.primary = False
+
+
+class replica_reads:
+    """Send the reads of a block or view to the replica"""
+
+    def __enter__(self):
+        self._token = _scope.set(_Scope())
+        return self
+
+    def __exit__(self, *exc_info):
+        _scope.reset(self._token)
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with replica_reads():
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def iterate_on_replica(iterable):
+    """Iterate with replica reads, for streamed responses consumed after the view has returned"""
+    iterator = iter(iterable)
+    while True:
+        with replica_reads():
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def _replica_path():
+    settings_dict = settings.DATABASES.get(replica_alias())
+    if settings_dict is None:
+        return None
+    if 'sqlite3' not in settings_dict['ENGINE']:
+        return ''
+    return Path(settings_dict['NAME'])
+
+
+def _check_replica():
+    """(available, snapshot time) of the replica, checked at most once a second"""
+    global _availability
+    checked_at, available, snapshot = _availability
+    now = time.monotonic()
+    if now - checked_at < AVAILABILITY_CHECK_INTERVAL:
+        return available, snapshot
+
+    path = _replica_path()
+    snapshot = None
+    if path is None:
+        available = False
+    elif path == '':
+        available = True  # A server replica; its lag is the database's business
+    else:
+        try:
+            snapshot = path.stat().st_mtime
+        except OSError:
+            pass
+        available = snapshot is not None and time.time() - snapshot <= getattr(settings, 'REPLICA_MAX_LAG', 15 * 60)
+    _availability = (now, available, snapshot)
+    return available, snapshot
+
+
+def replica_available():
+    """Whether the replica is configured and fresh enough"""
+    return _check_replica()[0]
+
+
+def require_version(version):
+    """Read from the primary for the rest of the current scope unless the
+    replica was copied after version (microseconds since the epoch) was set"""
+    scope = _scope.get()
+    if scope is None or scope.primary:
+        return
+    snapshot = _check_replica()[1]
+    if snapshot is None or snapshot * 1000000 < version:
+        scope.primary = True
+
+
+class ReplicaRouter:
+    """Route the reads of replica_reads blocks to the replica"""
+
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None or scope.primary or model._meta.label in PRIMARY_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if any(conn.in_atomic_block for conn in connections.all(initialized_only=True)):
+            return None
+        if not replica_available():
+            return None
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None:
+            scope.primary = True
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == replica_alias():
+            # Django would save an instance to the database it was loaded from
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica is a copy of the primary, never migrated itself
+        if db == replica_alias():
+            return False
+        return None
+
+
+def refresh_replica(using='default'):
+    """Copy the primary SQLite database over the replica; returns the replica path"""
+    global _availability
+    source = connections[using].settings_dict['NAME']
+    target = _replica_path()
+    if not target:
+        raise ValueError('The replica is not a local SQLite database')
+
+    temporary = target.with_name(target.name + '.tmp')
+    temporary.unlink(missing_ok=True)
+    started = time.time()
+    primary = sqlite3.connect(source, timeout=20)
+    copy = sqlite3.connect(temporary)
+    try:
+        # One step: a consistent snapshot, without blocking writers in WAL mode
+        primary.backup(copy)
+        # Readers never write; a rollback journal leaves no -wal/-shm files next to a replaced copy
+        copy.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        copy.close()
+        primary.close()
+    # The copy holds every change committed before it started
+    os.utime(temporary, (started, started))
+    os.replace(temporary, target)
+    # An open connection keeps reading the replaced file; other threads reconnect per request
+    connections[replica_alias()].close()
+    _availability = (0.0, False, None)
+    return target
@@ -0,0 +1,230 @@
+"""
+Search service for users, submissions and claims.
+
+Views and admin classes search through ``search_service`` instead of chains of
+``icontains`` ORs. The service keeps one text document per indexed row and
+hands the query to a backend that returns matching primary keys, best match
+first:
+
+* ``SQLiteFTS5Backend`` (default on SQLite): one FTS5 table per entity whose
+  rowid is the row's primary key, ranked with bm25. Words in the query match
+  word prefixes, so "tr55" finds "TR558E6F2F" and "gmail" finds
+  "user@gmail.com". The tables are created and filled by migration
+  dashboard 0008.
+* ``IcontainsBackend``: plain ORM ``icontains`` lookups, used on other
+  databases or when SQLite was built without FTS5.
+
+``filter`` hands the match to the database as a subquery, so it is combined
+with the caller's own conditions (a rider's collections, a user's claims)
+and never limited. Only ``search`` and ``ranked``, which order by rank,
+stop at SEARCH_MAX_RESULTS, and ``ranked`` applies its queryset inside the
+search so the limit counts rows of that queryset only.
+
+Set SEARCH_BACKEND to a dotted path to plug in another backend. Signals
+(dashboard/signals.py) keep the index in sync; ``rebuild_search_index``
+rebuilds it from scratch.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# entity -> (model label, fields that make up the document)
+SEARCH_ENTITIES = {
+    'user': ('accounts.CustomUser', ['username', 'email', 'first_name', 'last_name', 'phone']),
+    'submission': ('trash.TrashSubmission', ['track_id', 'location', 'collection_record__trash_type']),
+    'claim': ('trash.RewardClaim', ['reference_id', 'claim_type', 'notes', 'donation_hospital']),
+}
+
+MODEL_ENTITIES = {label: entity for entity, (label, _) in SEARCH_ENTITIES.items()}
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def get_model(entity):
+    return apps.get_model(SEARCH_ENTITIES[entity][0])
+
+
+def documents(entity, pks=None, model=None):
+    """Yield (pk, text) for the given rows of an entity (all rows if pks is None)
+
+    model overrides the entity's model, e.g. with a migration's historical model.
+    """
+    fields = SEARCH_ENTITIES[entity][1]
+    queryset = (model or get_model(entity)).objects.order_by('pk')
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    for pk, *values in queryset.values_list('pk', *fields).iterator(chunk_size=REBUILD_BATCH_SIZE):
+        yield pk, ' '.join(str(value) for value in values if value)
+
+
+class IcontainsBackend:
+    """Fallback backend: substring lookups on the document fields, newest first"""
+
+    def index(self, entity, rows):
+        pass
+
+    def remove(self, entity, pks):
+        pass
+
+    def rebuild(self, entity):
+        pass
+
+    def matching(self, entity, query):
+        fields = SEARCH_ENTITIES[entity][1]
+        condition = reduce(or_, [Q(**{f'{field}__icontains': query}) for field in fields])
+        return get_model(entity).objects.filter(condition).values('pk')
+
+    def search(self, entity, query, limit, scope=None):
+        matches = get_model(entity).objects.filter(pk__in=self.matching(entity, query))
+        if scope is not None:
+            matches = matches.filter(pk__in=scope.values('pk'))
+        return list(matches.order_by('-pk').values_list('pk', flat=True)[:limit])
+
+
+class SQLiteFTS5Backend:
+    """FTS5 index in the default SQLite database, ranked with bm25"""
+
+    @staticmethod
+    def is_available():
+        if connection.vendor != 'sqlite':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            return any(option == 'ENABLE_FTS5' for option, in cursor.fetchall())
+
+    @staticmethod
+    def _table(entity):
+        return f'search_index_{entity}'
+
+    @classmethod
+    def create_table(cls, entity, schema_editor=None):
+        """Create the entity's (empty) index table; run by migrations and rebuild"""
+        sql = f"CREATE VIRTUAL TABLE IF NOT EXISTS {cls._table(entity)} USING fts5(content, tokenize='unicode61')"
+        if schema_editor is not None:
+            schema_editor.execute(sql)
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+
+    def index(self, entity, rows):
+        batch = []
+        with connection.cursor() as cursor:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= REBUILD_BATCH_SIZE:
+                    self._write(cursor, entity, batch)
+                    batch = []
+            if batch:
+                self._write(cursor, entity, batch)
+
+    def _write(self, cursor, entity, batch):
+        table = self._table(entity)
+        cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(pk,) for pk, _ in batch])
+        cursor.executemany(f'INSERT INTO {table} (rowid, content) VALUES (%s, %s)', batch)
+
+    def remove(self, entity, pks):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self._table(entity)} WHERE rowid = %s', [(pk,) for pk in pks])
+
+    def rebuild(self, entity):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self._table(entity)}')
+        self.create_table(entity)
+        self.index(entity, documents(entity))
+
+    def matching(self, entity, query):
+        # A query without words matches nothing; rowid 0 is never a primary key
+        table = self._table(entity)
+        match = self.build_match(query)
+        if not match:
+            return RawSQL('SELECT 0 WHERE 0', [])
+        return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match])
+
+    def search(self, entity, query, limit, scope=None):
+        match = self.build_match(query)
+        if not match:
+            return []
+        table = self._table(entity)
+        sql = f'SELECT rowid FROM {table} WHERE {table} MATCH %s'
+        params = [match]
+        if scope is not None:
+            scope_sql, scope_params = scope.values('pk').query.sql_with_params()
+            sql += f' AND rowid IN ({scope_sql})'
+            params += scope_params
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} ORDER BY bm25({table}) LIMIT %s', params + [limit])
+            return [pk for pk, in cursor.fetchall()]
+
+    @staticmethod
+    def build_match(query):
+        """Turn free text into an FTS5 query: every word must match as a prefix"""
+        terms = re.findall(r'\w+', query.lower())
+        return ' '.join(f'"{term}"*' for term in terms)
+
+
+class SearchService:
+    """Single entry point for indexed search"""
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+            if backend_path:
+                self._backend = import_string(backend_path)()
+            elif SQLiteFTS5Backend.is_available():
+                self._backend = SQLiteFTS5Backend()
+            else:
+                self._backend = IcontainsBackend()
+        return self._backend
+
+    @property
+    def max_results(self):
+        return getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+
+    def search(self, entity, query):
+        """Primary keys of the matching rows, best match first"""
+        query = (query or '').strip()
+        if not query:
+            return []
+        return self.backend.search(entity, query, self.max_results)
+
+    def filter(self, entity, query, path='pk'):
+        """Q matching rows whose `path` points at a matching `entity` row, all of them
+
+        e.g. filter('user', 'ali', path='user_id') on a submission queryset
+        """
+        query = (query or '').strip()
+        if not query:
+            return Q(**{f'{path}__in': []})
+        return Q(**{f'{path}__in': self.backend.matching(entity, query)})
+
+    def ranked(self, queryset, entity, query):
+        """Filter a queryset of `entity` to its best matches, ordered by rank"""
+        query = (query or '').strip()
+        pks = self.backend.search(entity, query, self.max_results, scope=queryset) if query else []
+        return queryset.filter(pk__in=pks).order_by(Case(
+            *[When(pk=pk, then=position) for position, pk in enumerate(pks)],
+            output_field=IntegerField(),
+        ))
+
+    def index_objects(self, entity, pks):
+        self.backend.index(entity, documents(entity, pks))
+
+    def remove_objects(self, entity, pks):
+        self.backend.remove(entity, pks)
+
+    def rebuild(self, entity):
+        self.backend.rebuild(entity)
+
+
+search_service = SearchService()
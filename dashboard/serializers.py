@@ -5,3 +5,11 @@ class SystemSettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = SystemSettings
         fields = '__all__'
+
+class BonusAwardSerializer(serializers.Serializer):
+    points = serializers.IntegerField(min_value=1, max_value=10000)
+    reason = serializers.CharField()
+    society = serializers.CharField(required=False, allow_blank=True)
+    user_type = serializers.ChoiceField(choices=['user', 'rider'], required=False)
+    active_days = serializers.IntegerField(required=False, min_value=1)
+    dry_run = serializers.BooleanField(default=False)
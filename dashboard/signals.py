@@ -0,0 +1,59 @@
+from django.db.models.signals import post_save, post_delete
+
+from .data_versions import MODEL_DOMAINS, bump_data_version
+from .search import MODEL_ENTITIES, search_service
+
+# Saves that touch none of the data shown on dashboards
+IGNORED_UPDATE_FIELDS = {
+    'accounts.CustomUser': {'last_login'},
+}
+
+
+def data_changed(sender, instance, **kwargs):
+    """Bump the data version of the domain a saved or deleted row belongs to"""
+    label = sender._meta.label
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= IGNORED_UPDATE_FIELDS.get(label, set()):
+        return
+    bump_data_version(MODEL_DOMAINS[label])
+
+
+def search_document_saved(sender, instance, raw=False, **kwargs):
+    """Re-index a saved user, submission or claim"""
+    if raw:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= IGNORED_UPDATE_FIELDS.get(sender._meta.label, set()):
+        return
+    search_service.index_objects(MODEL_ENTITIES[sender._meta.label], [instance.pk])
+
+
+def search_document_deleted(sender, instance, **kwargs):
+    search_service.remove_objects(MODEL_ENTITIES[sender._meta.label], [instance.pk])
+
+
+def collection_record_changed(sender, instance, raw=False, **kwargs):
+    """The collected trash type is part of its submission's search document"""
+    if raw:
+        return
+    search_service.index_objects('submission', [instance.submission_id])
+
+
+def connect_signals():
+    from django.apps import apps
+
+    for label in MODEL_DOMAINS:
+        model = apps.get_model(label)
+        post_save.connect(data_changed, sender=model, dispatch_uid=f'data_version_save:{label}')
+        post_delete.connect(data_changed, sender=model, dispatch_uid=f'data_version_delete:{label}')
+
+    for label in MODEL_ENTITIES:
+        model = apps.get_model(label)
+        post_save.connect(search_document_saved, sender=model, dispatch_uid=f'search_index_save:{label}')
+        post_delete.connect(search_document_deleted, sender=model, dispatch_uid=f'search_index_delete:{label}')
+
+    collection_record = apps.get_model('trash.CollectionRecord')
+    post_save.connect(collection_record_changed, sender=collection_record,
+                      dispatch_uid='search_index_save:trash.CollectionRecord')
+    post_delete.connect(collection_record_changed, sender=collection_record,
+                        dispatch_uid='search_index_delete:trash.CollectionRecord')
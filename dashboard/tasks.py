@@ -0,0 +1,131 @@
+"""
+Job handlers for the background queue (dashboard.jobs).
+
+Each handler takes the JobContext and the job's params as keyword arguments
+and returns a JSON-serializable result.
+"""
+import io
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+
+from .data_versions import bump_data_version
+from .jobs import register_job
+
+# Management commands that may be queued with the "command" job
+COMMAND_JOBS = (
+    'uet_customers',
+    'nfc_customers',
+    'valencia_customers',
+    'wapda_town_customers',
+    'tariq_garden_customers',
+    'remaining_customers',
+    'create_demo_data',
+    'backfill_location_keys',
+    'rebuild_search_index',
+    'refresh_demand_forecast',
+    'auto_dispatch',
+    'purge_idempotency_keys',
+    'archive_history',
+    'refresh_replica',
+)
+
+OUTPUT_TAIL_LINES = 50
+
+
+def export_dir():
+    return Path(getattr(settings, 'JOB_EXPORT_DIR', settings.BASE_DIR / 'exports'))
+
+
+@register_job('clear_system_data')
+def clear_system_data(ctx):
+    """Delete all submissions, collections, point history and non-admin users
+
+    Deletes in committed chunks (dashboard.deletion); a retried attempt
+    continues from what is left and keeps the counts of earlier attempts.
+    """
+    from accounts.models import CustomUser
+    from trash.scheduling import schedule
+    from .deletion import delete_in_chunks, system_data_steps
+
+    deleted = dict(ctx.state.get('deleted', {}))
+    steps = [(label, queryset, queryset.count()) for label, queryset in system_data_steps()]
+    done = sum(deleted.values())
+    total = done + sum(count for _, _, count in steps) + 1
+    ctx.progress(done, total, 'Starting')
+
+    for label, queryset, count in steps:
+        if not count:
+            continue
+        before = deleted.get(label, 0)
+
+        def on_chunk(rows, label=label, before=before):
+            deleted[label] = before + rows
+            ctx.progress(done + rows, message=f'Deleting {label}')
+            ctx.checkpoint({'deleted': deleted})
+
+        done += delete_in_chunks(queryset, on_chunk=on_chunk)
+
+    ctx.progress(done, message='Resetting admin points')
+    CustomUser.objects.filter(user_type='admin').update(reward_points=0)
+    bump_data_version('users', 'submissions', 'collections', 'rewards', 'claims')
+    schedule.refresh()
+    ctx.progress(total, message='All system data cleared')
+    return {'deleted': deleted}
+
+
+@register_job('command')
+def run_command(ctx, command, args=None, options=None):
+    """Run one of COMMAND_JOBS; returns the tail of its output"""
+    if command not in COMMAND_JOBS:
+        raise ValueError(f'Command cannot be queued: {command}')
+    ctx.progress(0, 1, f'Running {command}')
+    output = io.StringIO()
+    call_command(command, *(args or []), stdout=output, stderr=output, **(options or {}))
+    ctx.progress(1, message=f'{command} finished')
+    return {'output': output.getvalue().splitlines()[-OUTPUT_TAIL_LINES:]}
+
+
+@register_job('export')
+def export(ctx, dataset, output='csv', filters=None):
+    """Write an export (trash.exports) to JOB_EXPORT_DIR"""
+    from trash.exports import EXPORTS, export_filename, stream_export
+
+    from .replica import iterate_on_replica, replica_reads
+
+    filters = filters or {}
+    filter_func = EXPORTS[dataset][0]
+    with replica_reads():
+        total = filter_func(filters).count()
+    ctx.progress(0, total, f'Exporting {total} {dataset}')
+
+    directory = export_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / export_filename(dataset, output)
+    rows = -1 if output == 'csv' else 0  # the CSV header is not a row
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        # Only the reads are scoped, the progress updates would send them back to the primary
+        for line in iterate_on_replica(stream_export(dataset, filters, output)):
+            file.write(line)
+            rows += 1
+            if rows and rows % 5000 == 0:
+                ctx.progress(rows)
+    return {'file': path.name, 'rows': rows, 'finished_at': timezone.now().isoformat()}
+
+
+@register_job('complete_payout_batch')
+def complete_payout_batch(ctx, batch_id, user_id=None):
+    from accounts.models import CustomUser
+    from trash.payouts import complete_batch
+
+    ctx.progress(0, 1, 'Completing claims')
+    actor = CustomUser.objects.filter(id=user_id).first() if user_id else None
+    batch = complete_batch(batch_id, actor)
+    return {
+        'reference_id': batch.reference_id,
+        'claims': batch.claim_count,
+        'points': batch.total_points,
+        'amount': str(batch.total_amount),
+    }
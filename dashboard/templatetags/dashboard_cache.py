@@ -0,0 +1,22 @@
+from django import template
+from django.conf import settings
+
+from dashboard.data_versions import get_data_version
+
+register = template.Library()
+
+
+@register.simple_tag
+def data_version(*names):
+    """Version key of the given data domains, for use in {% cache %} fragment keys
+
+    {% data_version 'users' 'submissions' as version %}
+    {% cache fragment_timeout 'admin_analytics_summary' version period %}...{% endcache %}
+    """
+    return get_data_version(*names)
+
+
+@register.simple_tag
+def fragment_cache_timeout():
+    """Upper bound on how long a fragment may stay cached"""
+    return getattr(settings, 'TEMPLATE_FRAGMENT_CACHE_TIMEOUT', 300)
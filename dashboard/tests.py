@@ -1,3 +1,174 @@
+from datetime import timedelta
+
+from django.core.paginator import Paginator
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from trash.models import CollectionRecord, RewardPointHistory, SubmissionEvent, TrashSubmission
+from .archive import archive, point_history
+from .deletion import delete_in_chunks
+from .models import HistoryArchive
+from .search import search_service
+
+FILTERS = [
+    (type_filter, date_filter)
+    for type_filter in ('', 'earned', 'spent')
+    for date_filter in ('', 'week', 'month')
+]
+
+
+class HistoryArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='ayesha', password='x', reward_points=480)
+        cls.other = CustomUser.objects.create_user(username='bilal', password='x')
+        now = timezone.now()
+        # 90 days of history, one row a day; every third row spends points
+        for user in (cls.user, cls.other):
+            for day in range(90):
+                row = RewardPointHistory.objects.create(
+                    user=user, points=-4 if day % 3 == 0 else 10, reason=f'day {day}'
+                )
+                RewardPointHistory.objects.filter(id=row.id).update(created_at=now - timedelta(days=day, hours=1))
+
+    def rows(self, history):
+        return [(row.id, row.points, row.reason, row.created_at) for row in history]
+
+    def snapshot(self):
+        """Every filter's full list, pages of two sizes and totals"""
+        snapshot = {}
+        for type_filter, date_filter in FILTERS:
+            history = point_history(self.user, type_filter, date_filter)
+            pages = []
+            for per_page in (7, 11):
+                paginator = Paginator(history, per_page)
+                pages += [self.rows(paginator.page(number).object_list) for number in paginator.page_range]
+            snapshot[(type_filter, date_filter)] = {
+                'count': history.count(),
+                'rows': self.rows(history[0:history.count()]),
+                'pages': pages,
+                'totals': history.totals(),
+            }
+        return snapshot
+
+    def test_archived_history_reads_like_hot_history(self):
+        before = self.snapshot()
+        rows, blocks = archive('points', timezone.now() - timedelta(days=20))
+        self.assertEqual(rows, 2 * 70)
+        self.assertTrue(blocks)
+
+        # The month filter's cutoff falls inside an archived block
+        history = point_history(self.user, '', 'month')
+        self.assertTrue(history.hot_count())
+        self.assertTrue(any(block.period_start < history.since for block, _ in history.blocks()))
+
+        after = self.snapshot()
+        for key in before:
+            with self.subTest(filters=key):
+                self.assertEqual(after[key], before[key])
+
+    def test_totals(self):
+        history = point_history(self.user)
+        self.assertEqual(history.totals(), (60 * 10, 30 * 4))
+        archive('points', timezone.now() - timedelta(days=20))
+        self.assertEqual(point_history(self.user).totals(), (60 * 10, 30 * 4))
+        self.assertEqual(point_history(self.user, 'earned').totals(), (600, 0))
+        self.assertEqual(point_history(self.user, 'spent').totals(), (0, 120))
+
+    def test_archiving_moves_rows_and_keeps_balances(self):
+        archive('points', timezone.now() - timedelta(days=20))
+        self.assertEqual(RewardPointHistory.objects.filter(user=self.user).count(), 20)
+        self.assertEqual(
+            sum(block.row_count for block in HistoryArchive.objects.filter(user=self.user, kind='points')), 70
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.reward_points, 480)
+
+    def test_archiving_twice_changes_nothing(self):
+        cutoff = timezone.now() - timedelta(days=20)
+        archive('points', cutoff)
+        before = self.snapshot()
+        self.assertEqual(archive('points', cutoff), (0, 0))
+        self.assertEqual(self.snapshot(), before)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ChunkedDeletionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(username='admin', password='x', user_type='admin')
+        cls.rider = CustomUser.objects.create_user(username='rider', password='x', user_type='rider')
+        for index in range(3):
+            user = CustomUser.objects.create_user(username=f'user{index}', password='x')
+            for number in range(4):
+                submission = TrashSubmission.objects.create(user=user, location=f'{number} B UET society')
+                SubmissionEvent.objects.create(submission=submission, to_status='pending', actor=user)
+                CollectionRecord.objects.create(
+                    submission=submission, rider=cls.rider, trash_type='plastic', actual_quantity=2, verified_by=cls.admin
+                )
+                RewardPointHistory.objects.create(
+                    user=user, submission=submission, points=10, reason='collected', awarded_by=cls.rider
+                )
+            RewardPointHistory.objects.create(user=cls.admin, points=5, reason='bonus', awarded_by=user)
+
+    def assertNoOrphans(self):
+        users = CustomUser.objects.all()
+        submissions = TrashSubmission.objects.all()
+        self.assertFalse(TrashSubmission.objects.exclude(user__in=users).exists())
+        self.assertFalse(SubmissionEvent.objects.exclude(submission__in=submissions).exists())
+        self.assertFalse(CollectionRecord.objects.exclude(submission__in=submissions).exists())
+        self.assertFalse(CollectionRecord.objects.exclude(rider__in=users).exclude(rider=None).exists())
+        self.assertFalse(RewardPointHistory.objects.exclude(user__in=users).exists())
+        self.assertFalse(
+            RewardPointHistory.objects.exclude(submission__in=submissions).exclude(submission=None).exists()
+        )
+        self.assertFalse(
+            RewardPointHistory.objects.exclude(awarded_by__in=users).exclude(awarded_by=None).exists()
+        )
+
+    def test_cascades_and_set_null(self):
+        deleted = delete_in_chunks(TrashSubmission.objects.all(), chunk_size=5, pause=0)
+        self.assertEqual(deleted, 12)
+        self.assertFalse(SubmissionEvent.objects.exists())
+        self.assertFalse(CollectionRecord.objects.exists())
+        # Point history outlives its submission, like with QuerySet.delete()
+        self.assertEqual(RewardPointHistory.objects.count(), 15)
+        self.assertFalse(RewardPointHistory.objects.exclude(submission=None).exists())
+        self.assertNoOrphans()
+
+    def test_deleting_users_leaves_no_orphans(self):
+        users = CustomUser.objects.exclude(user_type='admin')
+        deleted = delete_in_chunks(users, chunk_size=1, pause=0)
+        self.assertEqual(deleted, 4)
+        self.assertEqual(list(CustomUser.objects.all()), [self.admin])
+        self.assertFalse(TrashSubmission.objects.exists())
+        self.assertFalse(CollectionRecord.objects.exists())
+        # The admin's rows stay, without the deleted users who awarded them
+        self.assertEqual(RewardPointHistory.objects.filter(user=self.admin, awarded_by=None).count(), 3)
+        self.assertNoOrphans()
+        self.assertEqual(search_service.search('user', 'user0'), [])
+        self.assertEqual(search_service.search('submission', 'uet'), [])
+
+    def test_resumes_after_interruption(self):
+        users = CustomUser.objects.filter(user_type='user')
+
+        def crash(deleted):
+            raise Interrupted
+
+        with self.assertRaises(Interrupted):
+            delete_in_chunks(users, on_chunk=crash, chunk_size=2, pause=0)
+        # The first chunk is committed and consistent, the rest untouched
+        self.assertEqual(users.count(), 1)
+        self.assertEqual(TrashSubmission.objects.count(), 4)
+        self.assertNoOrphans()
 
-# Create your tests here.
+        progress = []
+        self.assertEqual(delete_in_chunks(users, on_chunk=progress.append, chunk_size=2, pause=0), 1)
+        self.assertEqual(progress, [1])
+        self.assertFalse(users.exists())
+        self.assertFalse(TrashSubmission.objects.exists())
+        self.assertNoOrphans()
@@ -23,6 +23,7 @@ urlpatterns = [
     
     # Admin Dashboard
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin-dashboard/widgets/<str:widget>/', views.admin_dashboard_widget, name='admin_dashboard_widget'),
     path('admin-analytics/', views.admin_analytics, name='admin_analytics'),
     path('admin-settings/', views.admin_settings, name='admin_settings'),
     path('manage-users/', views.manage_users, name='manage_users'),
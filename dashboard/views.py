@@ -3,13 +3,20 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth.models import User
+from accounts.activity import log_activity
 from accounts.models import CustomUser
 from trash.models import TrashSubmission, CollectionRecord, RewardPointHistory
-from django.db.models import Count, Q, Sum
+from trash import state_machine
+from django.db.models import Count, Min, Sum
 from datetime import datetime, timedelta
 from django.core.paginator import Paginator
 from django.utils import timezone
 from django.http import JsonResponse
+from .search import search_service
+from .replica import replica_reads
+from django.utils.functional import SimpleLazyObject
+from functools import partial
+import operator
 
 def is_rider(user):
     return user.is_authenticated and user.user_type == 'rider'
@@ -198,10 +205,7 @@ def user_submissions(request):
             user_submissions = user_submissions.filter(created_at__date__gte=month_ago)
     
     if search_query:
-        user_submissions = user_submissions.filter(
-            Q(trash_description__icontains=search_query) |
-            Q(location__icontains=search_query)
-        )
+        user_submissions = user_submissions.filter(search_service.filter('submission', search_query))
     
     # Pagination
     paginator = Paginator(user_submissions, per_page)
@@ -231,30 +235,15 @@ def user_submissions(request):
 @login_required
 @user_passes_test(lambda u: u.user_type == 'user')
 def user_points(request):
-    # Get user's point history
-    point_history = RewardPointHistory.objects.filter(user=request.user).order_by('-created_at')
+    from .archive import point_history as archived_point_history
     
     # Apply filters
     type_filter = request.GET.get('type', '')
     date_filter = request.GET.get('date', '')
     per_page = int(request.GET.get('per_page', 10))
     
-    if type_filter:
-        if type_filter == 'earned':
-            point_history = point_history.filter(points__gt=0)
-        elif type_filter == 'spent':
-            point_history = point_history.filter(points__lt=0)
-    
-    if date_filter:
-        today = timezone.now().date()
-        if date_filter == 'today':
-            point_history = point_history.filter(created_at__date=today)
-        elif date_filter == 'week':
-            week_ago = today - timedelta(days=7)
-            point_history = point_history.filter(created_at__date__gte=week_ago)
-        elif date_filter == 'month':
-            month_ago = today - timedelta(days=30)
-            point_history = point_history.filter(created_at__date__gte=month_ago)
+    # Get user's point history; pages past the recent rows come from the archive
+    point_history = archived_point_history(request.user, type_filter, date_filter)
     
     # Pagination
     paginator = Paginator(point_history, per_page)
@@ -263,8 +252,7 @@ def user_points(request):
     
     # Calculate statistics
     total_points = request.user.reward_points
-    total_earned = point_history.filter(points__gt=0).aggregate(Sum('points'))['points__sum'] or 0
-    total_spent = abs(point_history.filter(points__lt=0).aggregate(Sum('points'))['points__sum'] or 0)
+    total_earned, total_spent = point_history.totals()
     submissions_count = TrashSubmission.objects.filter(user=request.user).count()
     completed_count = TrashSubmission.objects.filter(user=request.user, status='collected').count()
     
@@ -310,6 +298,7 @@ def rider_dashboard(request):
         'total_assignments': total_assignments,
         'pending_collections': pending_collections,
         'total_completed': total_completed,
+        'status_transitions': state_machine.next_statuses(),
     }
     return render(request, 'dashboard/rider_dashboard.html', context)
 
@@ -336,8 +325,7 @@ def rider_earnings(request):
     
     if search_query:
         collection_history = collection_history.filter(
-            Q(submission__location__icontains=search_query) |
-            Q(trash_type__icontains=search_query)
+            search_service.filter('submission', search_query, path='submission_id')
         )
     
     # Pagination
@@ -391,10 +379,8 @@ def rider_assigned_collections(request):
     search_query = request.GET.get('search', '')
     if search_query:
         assigned_submissions = assigned_submissions.filter(
-            Q(user__username__icontains=search_query) |
-            Q(user__email__icontains=search_query) |
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query)
+            search_service.filter('user', search_query, path='user_id') |
+            search_service.filter('submission', search_query)
         )
     
     # Apply status filter if provided
@@ -411,6 +397,16 @@ def rider_assigned_collections(request):
         assigned_submissions = assigned_submissions.order_by('-updated_at')
     elif sort_order == 'location':
         assigned_submissions = assigned_submissions.order_by('location')
+    elif sort_order == 'route':
+        # Open pickups in driving order, finished ones after them
+        from trash.routing import route_order
+        from trash.dispatch import OPEN_STATUSES
+        route = route_order(assigned_submissions.filter(status__in=OPEN_STATUSES))
+        for stop, submission in enumerate(route, 1):
+            submission.route_stop = stop
+        assigned_submissions = route + list(
+            assigned_submissions.exclude(status__in=OPEN_STATUSES).order_by('-updated_at')
+        )
     else:  # Default: updated_at
         assigned_submissions = assigned_submissions.order_by('-updated_at')
     
@@ -428,173 +424,66 @@ def rider_assigned_collections(request):
         'per_page': per_page,
         'is_paginated': paginator.num_pages > 1,
         'page_obj': page_obj,
+        'status_transitions': state_machine.next_statuses(),
     }
     
     return render(request, 'dashboard/rider_assigned_collections_rider.html', context)
 
 @login_required
 @user_passes_test(is_admin)
+@replica_reads()
 def admin_dashboard(request):
-    total_users = CustomUser.objects.count()
-    total_submissions = TrashSubmission.objects.count()
-    pending_submissions = TrashSubmission.objects.filter(status='pending').count()
-    active_riders = CustomUser.objects.filter(user_type='rider', status='active').count()
-    active_riders_list = CustomUser.objects.filter(user_type='rider', status='active')
-    total_points = sum([user.reward_points for user in CustomUser.objects.all()])
-    
-    # Recent submissions with pagination
-    recent_submissions_query = TrashSubmission.objects.all().order_by('-created_at')
-    recent_per_page = int(request.GET.get('per_page', 10))
-    recent_paginator = Paginator(recent_submissions_query, recent_per_page)
-    recent_page_number = request.GET.get('page', 1)
-    recent_submissions = recent_paginator.get_page(recent_page_number)
-    
-    # Weekly collections data with proper date calculations
-    now = timezone.now()
-    
-    # Get start of current week (Monday)
-    days_since_monday = now.weekday()
-    start_of_week = now - timedelta(days=days_since_monday)
-    start_of_week = start_of_week.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # Get start of previous week
-    start_of_prev_week = start_of_week - timedelta(days=7)
-    end_of_prev_week = start_of_week - timedelta(seconds=1)
-    
-    # Count collections for current and previous week
-    this_week_collections = CollectionRecord.objects.filter(
-        collected_at__gte=start_of_week
-    ).count()
-    
-    last_week_collections = CollectionRecord.objects.filter(
-        collected_at__gte=start_of_prev_week,
-        collected_at__lte=end_of_prev_week
-    ).count()
-    
-    # Calculate weekly growth
-    weekly_growth = 0
-    if last_week_collections > 0:
-        weekly_growth = round(((this_week_collections - last_week_collections) / last_week_collections) * 100)
-    elif this_week_collections > 0:
-        weekly_growth = 100  # If last week was 0 but this week has collections
-    
-    # Monthly progress with dynamic goal based on total submissions
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    monthly_collections = CollectionRecord.objects.filter(collected_at__gte=month_start).count()
-    
-    # Set monthly goal based on total submissions (more realistic goal)
-    monthly_goal = max(10, total_submissions // 12)  # At least 10, or 1/12th of total submissions
-    monthly_progress = min(round((monthly_collections / monthly_goal) * 100), 100) if monthly_goal > 0 else 0
-    
-    # Get daily collection data for the chart
-    daily_collections = []
-    daily_labels = []
-    
-    for i in range(7):
-        date = start_of_week + timedelta(days=i)
-        count = CollectionRecord.objects.filter(
-            collected_at__date=date.date()
-        ).count()
-        daily_collections.append(count)
-        daily_labels.append(date.strftime('%a'))
-    
-    # Additional metrics for enhanced dashboard
-    # Calculate system health metrics
-    total_collections = CollectionRecord.objects.count()
-    completion_rate = round((total_collections / total_submissions * 100), 1) if total_submissions > 0 else 0
-    
-    # Get recent activity (last 24 hours)
-    yesterday = now - timedelta(days=1)
-    new_submissions_24h = TrashSubmission.objects.filter(created_at__gte=yesterday).count()
-    new_collections_24h = CollectionRecord.objects.filter(collected_at__gte=yesterday).count()
-    new_users_24h = CustomUser.objects.filter(created_at__gte=yesterday).count()
-    
-    # Calculate average response time (time from submission to assignment)
-    response_times = []
-    submissions_with_riders = TrashSubmission.objects.filter(
-        rider__isnull=False,
-        assigned_at__isnull=False
-    )
-    
-    for submission in submissions_with_riders:
-        if submission.assigned_at and submission.created_at:
-            time_diff = submission.assigned_at - submission.created_at
-            response_times.append(time_diff.total_seconds() / 3600)  # Convert to hours
-    
-    avg_response_time = round(sum(response_times) / len(response_times), 1) if response_times else 0
-    
-    # Get top performing riders
-    top_riders = CustomUser.objects.filter(user_type='rider').annotate(
-        collection_count=Count('collections')
-    ).order_by('-collection_count')[:5]
+    """Dashboard shell; the widgets are loaded separately by admin_dashboard_widget"""
+    from .widgets import WIDGETS
     
-    user_submissions = TrashSubmission.objects.all().order_by('-created_at')
-    completed_submissions_weight = user_submissions.filter(status='collected').aggregate(Sum('quantity_kg'))['quantity_kg__sum'] or 0
-    # Calculate efficiency metrics
-    total_weight_collected = CollectionRecord.objects.aggregate(Sum('actual_quantity'))['actual_quantity__sum'] or 0
-    avg_collections_per_day = round(total_collections / 30, 1) if total_collections > 0 else 0
+    # Riders for the assign-rider modal
+    active_riders_list = CustomUser.objects.filter(user_type='rider', status='active')
     
-    # Get system status indicators
-    system_status = 'Operational'
-    if pending_submissions > total_submissions * 0.3:  # If more than 30% are pending
-        system_status = 'High Load'
-    elif avg_response_time > 24:  # If average response time > 24 hours
-        system_status = 'Slow Response'
+    # Rendered into the page's script, so only ever numbers
+    try:
+        recent_per_page = min(max(int(request.GET.get('per_page', 10)), 1), 100)
+    except ValueError:
+        recent_per_page = 10
+    try:
+        recent_page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        recent_page = 1
     
     context = {
-        'total_users': total_users,
-        'total_submissions': total_submissions,
-        'pending_submissions': pending_submissions,
-        'active_riders': active_riders,
         'active_riders_list': active_riders_list,
-        'total_points': total_points,
-        'recent_submissions': recent_submissions,
-        'this_week_collections': this_week_collections,
-        'last_week_collections': last_week_collections,
-        'weekly_growth': weekly_growth,
-        'monthly_progress': monthly_progress,
-        'monthly_goal': monthly_goal,
-        'monthly_collections': monthly_collections,
-        'daily_collections': daily_collections,
-        'daily_labels': daily_labels,
-        'completion_rate': completion_rate,
-        'new_submissions_24h': new_submissions_24h,
-        'new_collections_24h': new_collections_24h,
-        'new_users_24h': new_users_24h,
-        'avg_response_time': avg_response_time,
-        'top_riders': top_riders,
-        'completed_submissions_weight': completed_submissions_weight,
-        'total_weight_collected': total_weight_collected,
-        'avg_collections_per_day': avg_collections_per_day,
-        'system_status': system_status,
+        'widget_names': list(WIDGETS),
         'recent_per_page': recent_per_page,
-        'recent_paginator': recent_paginator,
-        'recent_page_obj': recent_submissions,
-        'recent_is_paginated': recent_paginator.num_pages > 1,
+        'recent_page': recent_page,
     }
     return render(request, 'dashboard/admin_dashboard.html', context)
 
 @login_required
 @user_passes_test(is_admin)
-def admin_analytics(request):
-    # Get filter type and parameters
-    filter_type = request.GET.get('filter_type', 'period')
-    period = int(request.GET.get('period', 30))
-    start_date = request.GET.get('start_date', '')
-    end_date = request.GET.get('end_date', '')
+@replica_reads()
+def admin_dashboard_widget(request, widget):
+    """JSON data for a single admin dashboard widget"""
+    from .widgets import WIDGETS, get_widget_data
     
-    # Calculate date range based on filter type
-    if filter_type == 'date' and start_date and end_date:
-        start = datetime.strptime(start_date, '%Y-%m-%d')
-        end = datetime.strptime(end_date, '%Y-%m-%d')
-        # Add time to end date to include the entire day
-        end = end.replace(hour=23, minute=59, second=59)
-        is_custom_date_range = True
-    else:
-        end = timezone.now()
-        start = end - timedelta(days=period)
-        is_custom_date_range = False
+    if widget not in WIDGETS:
+        return JsonResponse({'success': False, 'error': 'Unknown widget'}, status=404)
     
+    try:
+        return JsonResponse({
+            'success': True,
+            'widget': widget,
+            'data': get_widget_data(widget, request),
+        })
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+def _lazy_context(builder, keys):
+    """Context entries that only run builder once a template reads one of them,
+    so fragments served from the cache skip the queries entirely"""
+    data = SimpleLazyObject(builder)
+    return {key: partial(operator.getitem, data, key) for key in keys}
+
+def _build_admin_analytics(period, start, end, is_custom_date_range):
+    """Compute the admin analytics page data"""
     # Get current period data
     current_users = CustomUser.objects.filter(created_at__gte=start).count()
     current_submissions = TrashSubmission.objects.filter(created_at__gte=start).count()
@@ -708,11 +597,13 @@ def admin_analytics(request):
     total_distance_covered = total_collections * 5.2  # Mock data - in real app, calculate actual distance
     avg_collections_per_day = round(total_collections / period, 1) if period > 0 else 0
     
-    # Get top performing locations
+    # Get top performing locations, grouped on the normalized location key so
+    # spellings of the same address count together
     top_locations = TrashSubmission.objects.filter(
         created_at__gte=start
-    ).values('location').annotate(
-        submission_count=Count('id')
+    ).values('location_key').annotate(
+        submission_count=Count('id'),
+        location=Min('location')
     ).order_by('-submission_count')[:5]
     
     location_labels = []
@@ -793,12 +684,7 @@ def admin_analytics(request):
         custom_daily_labels = daily_activity_labels
         custom_daily_activity = daily_activity
     
-    context = {
-        'period': period,
-        'start_date': start_date,
-        'end_date': end_date,
-        'filter_type': filter_type,
-        'is_custom_date_range': is_custom_date_range,
+    return {
         'total_users': current_users,
         'total_submissions': current_submissions,
         'collected_trash_weight': current_collected_trash_weight,
@@ -835,6 +721,78 @@ def admin_analytics(request):
         'custom_daily_labels': custom_daily_labels,
         'custom_daily_activity': custom_daily_activity,
     }
+
+# Context entries of admin_analytics that come from _build_admin_analytics
+ADMIN_ANALYTICS_KEYS = (
+    'total_users',
+    'total_submissions',
+    'collected_trash_weight',
+    'total_points',
+    'user_growth',
+    'submission_growth',
+    'collected_trash_growth',
+    'points_growth',
+    'avg_daily_registrations',
+    'avg_response_time',
+    'total_weight',
+    'completion_ratio',
+    'monthly_submissions',
+    'monthly_labels',
+    'user_type_labels',
+    'user_type_counts',
+    'rider_names',
+    'rider_performance',
+    'avg_collection_time',
+    'total_distance_covered',
+    'avg_collections_per_day',
+    'location_labels',
+    'location_counts',
+    'pending_ratio',
+    'active_user_ratio',
+    'daily_activity',
+    'daily_activity_labels',
+    'submission_trend',
+    'custom_date_labels',
+    'custom_submission_data',
+    'custom_user_type_labels',
+    'custom_user_type_counts',
+    'custom_daily_labels',
+    'custom_daily_activity',
+)
+
+@login_required
+@user_passes_test(is_admin)
+@replica_reads()
+def admin_analytics(request):
+    # Get filter type and parameters
+    filter_type = request.GET.get('filter_type', 'period')
+    period = int(request.GET.get('period', 30))
+    start_date = request.GET.get('start_date', '')
+    end_date = request.GET.get('end_date', '')
+    
+    # Calculate date range based on filter type
+    if filter_type == 'date' and start_date and end_date:
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        # Add time to end date to include the entire day
+        end = end.replace(hour=23, minute=59, second=59)
+        is_custom_date_range = True
+    else:
+        end = timezone.now()
+        start = end - timedelta(days=period)
+        is_custom_date_range = False
+    
+    context = {
+        'period': period,
+        'start_date': start_date,
+        'end_date': end_date,
+        'filter_type': filter_type,
+        'is_custom_date_range': is_custom_date_range,
+    }
+    context.update(_lazy_context(
+        lambda: _build_admin_analytics(period, start, end, is_custom_date_range),
+        ADMIN_ANALYTICS_KEYS
+    ))
     return render(request, 'dashboard/admin_analytics.html', context)
 
 @login_required
@@ -851,21 +809,9 @@ def admin_settings(request):
         
         if action == 'clear_data':
             try:
-                # Clear all data from all tables
-                RewardPointHistory.objects.all().delete()
-                CollectionRecord.objects.all().delete()
-                TrashSubmission.objects.all().delete()
-                
-                # Clear all non-admin users
-                CustomUser.objects.exclude(user_type='admin').delete()
-                
-                # Reset admin reward points
-                admin_users = CustomUser.objects.filter(user_type='admin')
-                for admin in admin_users:
-                    admin.reward_points = 0
-                    admin.save()
-                
-                messages.success(request, 'All data has been cleared successfully!')
+                from .jobs import enqueue
+                job = enqueue('clear_system_data', created_by=request.user)
+                messages.success(request, f'Clearing all data in the background (job #{job.id}). Follow its progress under Jobs in the admin.')
             except Exception as e:
                 messages.error(request, f'Error clearing data: {str(e)}')
             return redirect('dashboard:admin_settings')
@@ -975,22 +921,18 @@ def manage_users(request):
     users = CustomUser.objects.exclude(user_type='admin')
     
     # Apply filters
-    if search_query:
-        users = users.filter(
-            Q(username__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query)
-        )
-    
     if user_type_filter:
         users = users.filter(user_type=user_type_filter)
     
     if status_filter:
         users = users.filter(status=status_filter)
     
-    # Order by creation date
-    users = users.order_by('-created_at')
+    if search_query:
+        # Best matches first
+        users = search_service.ranked(users, 'user', search_query)
+    else:
+        # Order by creation date
+        users = users.order_by('-created_at')
     
     # Pagination
     paginator = Paginator(users, per_page)
@@ -1067,17 +1009,13 @@ def toggle_user_status(request, user_id):
         user.save()
         
         # Log the action
-        # ActivityLog.objects.create(
-        #     user=request.user,
-        #     action='toggled_user_status',
-        #     details={
-        #         'target_user_id': user.id,
-        #         'target_username': user.username,
-        #         'old_status': 'suspended' if action == 'activated' else 'active',
-        #         'new_status': action,
-        #         'admin_user': request.user.username
-        #     }
-        # )
+        log_activity(request.user, 'toggled_user_status', {
+            'target_user_id': user.id,
+            'target_username': user.username,
+            'old_status': 'suspended' if action == 'activated' else 'active',
+            'new_status': action,
+            'admin_user': request.user.username
+        })
         
         messages.success(request, f'User {user.username} has been {action}.')
         
@@ -1105,17 +1043,13 @@ def clear_user_points(request, user_id):
             user.save()
             
             # Log the action
-            # ActivityLog.objects.create(
-            #     user=request.user,
-            #     action='cleared_user_points',
-            #     details={
-            #         'target_user_id': user.id,
-            #         'target_username': user.username,
-            #         'old_points': old_points,
-            #         'new_points': 0,
-            #         'admin_user': request.user.username
-            #     }
-            # )
+            log_activity(request.user, 'cleared_user_points', {
+                'target_user_id': user.id,
+                'target_username': user.username,
+                'old_points': old_points,
+                'new_points': 0,
+                'admin_user': request.user.username
+            })
             
             return JsonResponse({
                 'success': True,
@@ -1131,6 +1065,8 @@ def clear_user_points(request, user_id):
 @user_passes_test(lambda u: u.user_type == 'admin')
 def award_bonus_points(request):
     """Award bonus points to a user with reason"""
+    from .bonuses import award_bonus
+    
     if request.method == 'POST':
         try:
             user_id = request.POST.get('user_id')
@@ -1151,32 +1087,20 @@ def award_bonus_points(request):
             # Store the old points value
             old_points = user.reward_points
             
-            # Add bonus points
-            user.reward_points += points
-            user.save()
-            
-            # Create reward point history entry
-            RewardPointHistory.objects.create(
-                user=user,
-                points=points,
-                reason=f"Bonus: {reason}",
-                awarded_by=request.user
-            )
+            # Add bonus points and the history entry
+            award_bonus(CustomUser.objects.filter(id=user.id), points, reason, awarded_by=request.user)
+            user.refresh_from_db(fields=['reward_points'])
             
             # Log the action
-            # ActivityLog.objects.create(
-            #     user=request.user,
-            #     action='awarded_bonus_points',
-            #     details={
-            #         'target_user_id': user.id,
-            #         'target_username': user.username,
-            #         'points_awarded': points,
-            #         'old_points': old_points,
-            #         'new_points': user.reward_points,
-            #         'reason': reason,
-            #         'admin_user': request.user.username
-            #     }
-            # )
+            log_activity(request.user, 'awarded_bonus_points', {
+                'target_user_id': user.id,
+                'target_username': user.username,
+                'points_awarded': points,
+                'old_points': old_points,
+                'new_points': user.reward_points,
+                'reason': reason,
+                'admin_user': request.user.username
+            })
             
             return JsonResponse({
                 'success': True,
@@ -0,0 +1,258 @@
+"""
+Admin dashboard widgets.
+
+The admin dashboard page is rendered as a light shell; each widget below is
+fetched independently by the page from ``admin_dashboard_widget`` and cached
+on its own TTL and the data versions it depends on, so one slow aggregate no
+longer holds up the whole page and updates show up immediately.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from .aggregates import run_aggregates
+from .data_versions import get_data_version
+from trash.models import TrashSubmission, CollectionRecord
+
+CACHE_KEY_PREFIX = 'dashboard_widget'
+
+
+def _start_of_week(now):
+    start_of_week = now - timedelta(days=now.weekday())
+    return start_of_week.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _avg_hours(queryset, start_field, end_field):
+    """Average of end_field - start_field in hours, computed in the database"""
+    duration = ExpressionWrapper(F(end_field) - F(start_field), output_field=DurationField())
+    avg = queryset.aggregate(avg=Avg(duration))['avg']
+    return round(avg.total_seconds() / 3600, 1) if avg else 0
+
+
+def weekly_stats(request):
+    """Collections this week vs last week, monthly goal and the daily chart"""
+    now = timezone.now()
+    start_of_week = _start_of_week(now)
+    start_of_prev_week = start_of_week - timedelta(days=7)
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    collections = CollectionRecord.objects.all()
+    counts = run_aggregates({
+        'this_week': lambda: collections.filter(collected_at__gte=start_of_week).count(),
+        'last_week': lambda: collections.filter(
+            collected_at__gte=start_of_prev_week,
+            collected_at__lt=start_of_week
+        ).count(),
+        'monthly': lambda: collections.filter(collected_at__gte=month_start).count(),
+        'submissions': lambda: TrashSubmission.objects.count(),
+        # One grouped query instead of a count per day
+        'per_day': lambda: dict(
+            collections.filter(collected_at__gte=start_of_week)
+            .annotate(day=TruncDate('collected_at'))
+            .values_list('day')
+            .annotate(count=Count('id'))
+        ),
+    })
+    this_week_collections = counts['this_week']
+    last_week_collections = counts['last_week']
+
+    weekly_growth = 0
+    if last_week_collections > 0:
+        weekly_growth = round(((this_week_collections - last_week_collections) / last_week_collections) * 100)
+    elif this_week_collections > 0:
+        weekly_growth = 100
+
+    monthly_collections = counts['monthly']
+    monthly_goal = max(10, counts['submissions'] // 12)
+    monthly_progress = min(round((monthly_collections / monthly_goal) * 100), 100) if monthly_goal > 0 else 0
+
+    per_day = counts['per_day']
+    daily_labels = []
+    daily_collections = []
+    for i in range(7):
+        date = start_of_week + timedelta(days=i)
+        daily_labels.append(date.strftime('%a'))
+        daily_collections.append(per_day.get(date.date(), 0))
+
+    return {
+        'this_week_collections': this_week_collections,
+        'last_week_collections': last_week_collections,
+        'weekly_growth': weekly_growth,
+        'monthly_collections': monthly_collections,
+        'monthly_goal': monthly_goal,
+        'monthly_progress': monthly_progress,
+        'daily_labels': daily_labels,
+        'daily_collections': daily_collections,
+    }
+
+
+def system_health(request):
+    """Headline counts, last 24h activity and the overall system status"""
+    now = timezone.now()
+    yesterday = now - timedelta(days=1)
+
+    counts = run_aggregates({
+        'users': lambda: CustomUser.objects.aggregate(
+            total=Count('id'),
+            active_riders=Count('id', filter=Q(user_type='rider', status='active')),
+            new_24h=Count('id', filter=Q(created_at__gte=yesterday)),
+        ),
+        'submissions': lambda: TrashSubmission.objects.aggregate(
+            total=Count('id'),
+            pending=Count('id', filter=Q(status='pending')),
+            new_24h=Count('id', filter=Q(created_at__gte=yesterday)),
+        ),
+        'collections': lambda: CollectionRecord.objects.aggregate(
+            total=Count('id'),
+            new_24h=Count('id', filter=Q(collected_at__gte=yesterday)),
+        ),
+        'avg_response_time': lambda: _avg_hours(
+            TrashSubmission.objects.filter(rider__isnull=False, assigned_at__isnull=False),
+            'created_at', 'assigned_at'
+        ),
+    })
+    users = counts['users']
+    submissions = counts['submissions']
+    collections = counts['collections']
+
+    total_submissions = submissions['total']
+    pending_submissions = submissions['pending']
+    completion_rate = round((collections['total'] / total_submissions * 100), 1) if total_submissions > 0 else 0
+    avg_response_time = counts['avg_response_time']
+
+    system_status = 'Operational'
+    if pending_submissions > total_submissions * 0.3:
+        system_status = 'High Load'
+    elif avg_response_time > 24:
+        system_status = 'Slow Response'
+
+    return {
+        'total_users': users['total'],
+        'total_submissions': total_submissions,
+        'pending_submissions': pending_submissions,
+        'active_riders': users['active_riders'],
+        'completion_rate': completion_rate,
+        'new_submissions_24h': submissions['new_24h'],
+        'new_collections_24h': collections['new_24h'],
+        'new_users_24h': users['new_24h'],
+        'avg_response_time': avg_response_time,
+        'system_status': system_status,
+    }
+
+
+def top_riders(request):
+    """Riders with the most completed collections"""
+    riders = CustomUser.objects.filter(user_type='rider').annotate(
+        collection_count=Count('collections')
+    ).order_by('-collection_count')[:5]
+    return {
+        'riders': [{
+            'id': rider.id,
+            'username': rider.username,
+            'first_name': rider.first_name,
+            'last_name': rider.last_name,
+            'profile_image': rider.profile_image.url if rider.profile_image else None,
+            'collection_count': rider.collection_count,
+        } for rider in riders]
+    }
+
+
+def recent_submissions(request):
+    """Latest submissions, paginated"""
+    try:
+        per_page = min(max(int(request.GET.get('per_page', 10)), 1), 100)
+    except ValueError:
+        per_page = 10
+
+    queryset = TrashSubmission.objects.select_related('user', 'rider').order_by('-created_at')
+    paginator = Paginator(queryset, per_page)
+    page_obj = paginator.get_page(request.GET.get('page', 1))
+
+    return {
+        'submissions': [{
+            'id': submission.id,
+            'track_id': submission.track_id,
+            'location': submission.location,
+            'quantity_kg': str(submission.quantity_kg) if submission.quantity_kg is not None else None,
+            'status': submission.status,
+            'status_display': submission.get_status_display(),
+            'created_at': submission.created_at.isoformat(),
+            'user': {
+                'username': submission.user.username,
+                'email': submission.user.email,
+                'profile_image': submission.user.profile_image.url if submission.user.profile_image else None,
+            },
+            'rider': {
+                'username': submission.rider.username,
+                'profile_image': submission.rider.profile_image.url if submission.rider.profile_image else None,
+            } if submission.rider else None,
+        } for submission in page_obj],
+        'pagination': {
+            'current_page': page_obj.number,
+            'total_pages': paginator.num_pages,
+            'total_count': paginator.count,
+            'start_index': page_obj.start_index(),
+            'end_index': page_obj.end_index(),
+            'per_page': per_page,
+        },
+    }
+
+
+def efficiency(request):
+    """Collected weight and throughput"""
+    results = run_aggregates({
+        'collections': lambda: CollectionRecord.objects.aggregate(
+            count=Count('id'), weight=Sum('actual_quantity')
+        ),
+        'completed_weight': lambda: TrashSubmission.objects.filter(
+            status='collected'
+        ).aggregate(Sum('quantity_kg'))['quantity_kg__sum'] or 0,
+        'total_points': lambda: CustomUser.objects.aggregate(Sum('reward_points'))['reward_points__sum'] or 0,
+    })
+    total_collections = results['collections']['count']
+    completed_weight = results['completed_weight']
+    total_weight = results['collections']['weight'] or 0
+    total_points = results['total_points']
+
+    return {
+        'completed_submissions_weight': float(completed_weight),
+        'total_weight_collected': round(float(total_weight), 1),
+        'avg_collections_per_day': round(total_collections / 30, 1) if total_collections > 0 else 0,
+        'total_points': total_points,
+    }
+
+
+# name -> (builder, default cache TTL in seconds, cache varies on these GET params,
+#          data domains whose changes invalidate the cached payload)
+WIDGETS = {
+    'weekly_stats': (weekly_stats, 300, (), ('submissions', 'collections')),
+    'system_health': (system_health, 60, (), ('users', 'submissions', 'collections')),
+    'top_riders': (top_riders, 600, (), ('users', 'collections')),
+    'recent_submissions': (recent_submissions, 30, ('page', 'per_page'), ('users', 'submissions')),
+    'efficiency': (efficiency, 300, (), ('users', 'submissions', 'collections')),
+}
+
+
+def get_widget_ttl(name):
+    overrides = getattr(settings, 'DASHBOARD_WIDGET_TTLS', {})
+    return overrides.get(name, WIDGETS[name][1])
+
+
+def get_widget_data(name, request):
+    """Return the (cached) payload of one widget; raises KeyError for unknown widgets"""
+    builder, _, vary_on, depends_on = WIDGETS[name]
+    key_parts = [CACHE_KEY_PREFIX, name, get_data_version(*depends_on)]
+    key_parts += [request.GET.get(param, '') for param in vary_on]
+    cache_key = ':'.join(str(part) for part in key_parts)
+
+    data = cache.get(cache_key)
+    if data is None:
+        data = builder(request)
+        cache.set(cache_key, data, get_widget_ttl(name))
+    return data
@@ -7,6 +7,7 @@ urlpatterns = [
     
     # Submission endpoints
     path('submit/', api_views.submit_trash, name='api_submit_trash'),
+    path('slots/', api_views.pickup_slots, name='api_pickup_slots'),
     path('submissions/', api_views.get_user_submissions, name='api_user_submissions'),
     path('track/<str:track_id>/', api_views.track_submission, name='api_track_submission'),
     path('submissions/<int:submission_id>/', api_views.submission_detail, name='api_submission_detail'),
@@ -15,10 +16,15 @@ urlpatterns = [
     path('submissions/<int:submission_id>/update-status/', api_views.update_submission_status, name='api_update_status'),
     path('submissions/<int:submission_id>/complete/', api_views.complete_collection, name='api_complete_collection'),
     path('rider/collections/', api_views.rider_collections, name='api_rider_collections'),
+    path('rider/location/', api_views.rider_location_ping, name='api_rider_location_ping'),
     
     # Admin endpoints
+    path('submissions/auto-dispatch/', api_views.auto_dispatch, name='api_auto_dispatch'),
+    path('submissions/transitions/', api_views.apply_transitions, name='api_apply_transitions'),
     path('submissions/<int:submission_id>/assign/', api_views.assign_rider, name='api_assign_rider'),
     path('submissions/<int:submission_id>/verify/', api_views.verify_collection, name='api_verify_collection'),
+    path('riders/nearest/', api_views.nearest_riders, name='api_nearest_riders'),
+    path('riders/<int:rider_id>/location/', api_views.rider_location, name='api_rider_location'),
     
     # Points history
     path('points/history/', api_views.user_points_history, name='api_points_history'),
@@ -29,8 +35,18 @@ urlpatterns = [
     path('claims/history/', api_views.get_claim_history, name='api_claim_history'),
     path('claims/manage/', api_views.get_manage_claims, name='api_manage_claims'),
     path('claims/<int:claim_id>/update-status/', api_views.update_claim_status, name='api_update_claim_status'),
+    path('claims/bulk-update-status/', api_views.bulk_update_claim_status, name='api_bulk_update_claim_status'),
+    
+    # Payout batches
+    path('payouts/', api_views.payout_batches, name='api_payout_batches'),
+    path('payouts/<int:batch_id>/', api_views.payout_batch_detail, name='api_payout_batch_detail'),
+    path('payouts/<int:batch_id>/settlement/', api_views.payout_settlement_file, name='api_payout_settlement_file'),
+    path('payouts/<int:batch_id>/complete/', api_views.complete_payout_batch, name='api_complete_payout_batch'),
     
     # Rider status and weight updates
     path('update-status/<int:submission_id>/', api_views.update_submission_status, name='api_update_submission_status'),
     path('update-weight/<int:submission_id>/', api_views.update_submission_weight, name='api_update_submission_weight'),
+    
+    # Exports (admin)
+    path('export/<str:dataset>/', api_views.export_data, name='api_export_data'),
 ]
@@ -19,11 +19,19 @@ from .serializers import (
     RewardClaimSerializer,
     RewardClaimCreateSerializer,
     RewardClaimUpdateSerializer,
-    TrashSubmissionStatusUpdateSerializer,
     RiderAssignmentSerializer,
-    CollectionVerificationSerializer
+    AutoDispatchSerializer,
+    RiderLocationPingSerializer,
+    CollectionVerificationSerializer,
+    ClaimBulkStatusSerializer,
+    PayoutBatchCreateSerializer
 )
 from accounts.utils import token_required, get_user_id_by_token
+from dashboard.search import search_service
+from .events import record_event
+from .idempotency import idempotent
+from . import state_machine
+from .claims import ClaimTransitionError, transition_claim, transition_claims
 
 @api_view(['GET'])
 @authentication_classes([SessionAuthentication])
@@ -40,13 +48,46 @@ def check_user_location(request):
         'user_id': user.id
     })
 
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def pickup_slots(request):
+    """Bookable pickup slots for the user's location (or ?location=)"""
+    from .locations import location_key
+    from .scheduling import schedule, slot_area
+    
+    location = (request.GET.get('location') or request.user.location or '').strip()
+    if not location:
+        return Response({
+            'success': False,
+            'error': 'Please set your location in profile settings first'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        area = slot_area(location_key(location))
+        return Response({
+            'success': True,
+            'area': area,
+            'slots': schedule.availability(area)
+        })
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['POST'])
 @authentication_classes([SessionAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent
 def submit_trash(request):
     """Submit new trash collection request"""
+    from .locations import location_key
+    from .scheduling import schedule, slot_area
+    
     serializer = TrashSubmissionCreateSerializer(data=request.data)
     if serializer.is_valid():
+        reserved = None
         try:
             with transaction.atomic():
                 # Always use user's saved location for trash submissions
@@ -60,8 +101,21 @@ def submit_trash(request):
                 location = request.user.location.strip()
                 serializer.validated_data['location'] = location
                 serializer.validated_data['rider_notes'] = None  # Explicitly set to None
+                
+                # Book the requested pickup slot against the area's capacity
+                pickup_slot = serializer.validated_data.get('pickup_slot')
+                if pickup_slot:
+                    area = slot_area(location_key(location))
+                    if not schedule.reserve(area, pickup_slot):
+                        return Response({
+                            'success': False,
+                            'error': 'The selected pickup slot is full or no longer available'
+                        }, status=status.HTTP_400_BAD_REQUEST)
+                    reserved = (area, pickup_slot)
+                    serializer.validated_data['pickup_area'] = area
 
                 submission = serializer.save(user=request.user)
+                record_event(submission, '', actor=request.user)
 
                 full_serializer = TrashSubmissionSerializer(submission)
                 return Response({
@@ -70,6 +124,8 @@ def submit_trash(request):
                     'submission': full_serializer.data
                 }, status=status.HTTP_201_CREATED)
         except Exception as e:
+            if reserved:
+                schedule.release(*reserved)
             return Response({
                 'success': False,
                 'error': str(e)
@@ -108,9 +164,7 @@ def get_user_submissions(request):
             submissions = submissions.filter(created_at__date__gte=month_ago)
     
     if search_query:
-        submissions = submissions.filter(
-            Q(location__icontains=search_query)
-        )
+        submissions = submissions.filter(search_service.filter('submission', search_query))
     
     # Pagination
     paginator = Paginator(submissions, per_page)
@@ -180,54 +234,7 @@ def submission_detail(request, submission_id):
 
 @api_view(['POST'])
 @token_required(['rider'])
-def update_submission_status(request, submission_id):
-    """Update submission status (rider only)"""
-    serializer = TrashSubmissionStatusUpdateSerializer(data=request.data)
-    if not serializer.is_valid():
-        return Response({
-            'success': False,
-            'error': 'Invalid data',
-            'details': serializer.errors
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    try:
-        submission = TrashSubmission.objects.get(id=submission_id, rider=request.user)
-        new_status = serializer.validated_data['status']
-        notes = serializer.validated_data.get('notes', '')
-        
-        if new_status not in ['on_the_way', 'arrived', 'picked']:
-            return Response({
-                'success': False,
-                'error': 'Invalid status'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        with transaction.atomic():
-            submission.status = new_status
-            if new_status == 'on_the_way':
-                submission.assigned_at = timezone.now()
-            elif new_status == 'picked':
-                submission.pickup_time = timezone.now()
-            
-            if notes:
-                submission.rider_notes = notes
-            
-            submission.save()
-        
-        result_serializer = TrashSubmissionSerializer(submission)
-        return Response({
-            'success': True,
-            'message': f'Status updated to {new_status} successfully',
-            'submission': result_serializer.data
-        })
-        
-    except TrashSubmission.DoesNotExist:
-        return Response({
-            'success': False,
-            'error': 'Submission not found'
-        }, status=status.HTTP_404_NOT_FOUND)
-
-@api_view(['POST'])
-@token_required(['rider'])
+@idempotent
 def complete_collection(request, submission_id):
     """Complete a trash collection (rider only)"""
     serializer = CollectionRecordCreateSerializer(data=request.data)
@@ -247,36 +254,26 @@ def complete_collection(request, submission_id):
                 'error': 'Submission must be in picked status'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        with transaction.atomic():
-            collection = CollectionRecord.objects.create(
-                submission=submission,
-                rider=request.user,
-                trash_type=serializer.validated_data['trash_type'],
-                actual_quantity=serializer.validated_data['actual_quantity'],
-                points_awarded=serializer.validated_data['points_awarded']
-            )
-            
-            # Update submission status
-            submission.status = 'collected'
-            submission.completion_time = timezone.now()
-            submission.save()
-            
-            # Create reward point history
-            RewardPointHistory.objects.create(
-                user=submission.user,
-                points=collection.points_awarded,
-                reason=f"Collected {collection.actual_quantity}kg of {collection.trash_type}",
-                submission=submission,
-                awarded_by=request.user
-            )
+        result = state_machine.apply(
+            submission.id, 'collected', request.user,
+            trash_type=serializer.validated_data['trash_type'],
+            actual_quantity=serializer.validated_data['actual_quantity'],
+            points=serializer.validated_data['points_awarded'],
+        )
         
+        collection = CollectionRecord.objects.select_related('submission', 'rider').get(submission=submission)
         result_serializer = CollectionRecordSerializer(collection)
         return Response({
             'success': True,
-            'message': f'Collection completed successfully! {collection.points_awarded} points awarded.',
+            'message': f'Collection completed successfully! {result["points"]} points awarded.',
             'collection': result_serializer.data
         }, status=status.HTTP_201_CREATED)
         
+    except state_machine.TransitionError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
     except TrashSubmission.DoesNotExist:
         return Response({
             'success': False,
@@ -285,6 +282,7 @@ def complete_collection(request, submission_id):
 
 @api_view(['POST'])
 @token_required(['admin'])
+@idempotent
 def assign_rider(request, submission_id):
     """Assign rider to submission (admin only)"""
     serializer = RiderAssignmentSerializer(data=request.data)
@@ -306,27 +304,21 @@ def assign_rider(request, submission_id):
                 'error': 'Submission is not in pending status'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        from accounts.models import CustomUser
-        rider = CustomUser.objects.filter(id=rider_id, user_type='rider').first()
-        if not rider:
-            return Response({
-                'success': False,
-                'error': 'Invalid rider'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        with transaction.atomic():
-            submission.rider = rider
-            submission.status = 'assigned'
-            submission.assigned_at = timezone.now()
-            submission.rider_notes = notes
-            submission.save()
+        state_machine.apply(submission.id, 'assigned', request.user, rider=rider_id, notes=notes)
+        submission.refresh_from_db()
         
         result_serializer = TrashSubmissionSerializer(submission)
         return Response({
             'success': True,
-            'message': f'Rider {rider.username} assigned successfully to submission #{submission.track_id}',
+            'message': f'Rider {submission.rider.username} assigned successfully to submission #{submission.track_id}',
             'submission': result_serializer.data
         })
         
+    except state_machine.TransitionError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
     except TrashSubmission.DoesNotExist:
         return Response({
             'success': False,
@@ -335,8 +327,137 @@ def assign_rider(request, submission_id):
 
 @api_view(['POST'])
 @token_required(['admin'])
+def auto_dispatch(request):
+    """Assign pending submissions to riders by area and open load (admin only)"""
+    serializer = AutoDispatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        from .dispatch import auto_dispatch as run_auto_dispatch
+        result = run_auto_dispatch(
+            dry_run=serializer.validated_data['dry_run'],
+            area=serializer.validated_data.get('area') or None,
+            max_per_rider=serializer.validated_data.get('max_per_rider'),
+            assigned_by=request.user,
+        )
+        return Response({
+            'success': True,
+            **result
+        })
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@token_required(['rider'])
+def rider_location_ping(request):
+    """Record the rider's current location; accepts one ping or {"pings": [...]}"""
+    from .tracking import tracker
+    
+    pings = request.data.get('pings') if isinstance(request.data, dict) and 'pings' in request.data else [request.data]
+    serializer = RiderLocationPingSerializer(data=pings, many=True)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        for ping in serializer.validated_data:
+            tracker.record(request.user.id, ping['latitude'], ping['longitude'], ping.get('recorded_at'))
+        return Response({
+            'success': True,
+            'recorded': len(serializer.validated_data)
+        })
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@token_required(['admin'])
+def nearest_riders(request):
+    """Active riders closest to a point, by their last location ping (admin only)"""
+    from accounts.models import CustomUser
+    from .dispatch import rider_loads
+    from .tracking import tracker
+    
+    try:
+        latitude = float(request.GET['latitude'])
+        longitude = float(request.GET['longitude'])
+        limit = int(request.GET.get('limit', 5))
+        max_km = float(request.GET['max_km']) if request.GET.get('max_km') else None
+    except (KeyError, ValueError):
+        return Response({
+            'success': False,
+            'error': 'latitude and longitude are required numbers'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        active_riders = set(CustomUser.objects.filter(user_type='rider', status='active').values_list('id', flat=True))
+        nearest = tracker.nearest(latitude, longitude, rider_ids=active_riders, limit=limit, max_distance_km=max_km)
+        loads = rider_loads(CustomUser.objects.filter(id__in=[rider_id for rider_id, _, _ in nearest]))
+        usernames = dict(CustomUser.objects.filter(id__in=loads).values_list('id', 'username'))
+        return Response({
+            'success': True,
+            'riders': [{
+                'rider_id': rider_id,
+                'rider': usernames.get(rider_id, ''),
+                'distance_km': round(distance, 3),
+                'latitude': ping[0],
+                'longitude': ping[1],
+                'recorded_at': ping[2],
+                'open_load': loads.get(rider_id, 0),
+            } for rider_id, distance, ping in nearest]
+        })
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@token_required(['admin'])
+def rider_location(request, rider_id):
+    """Last known location and recent track of a rider (admin only)"""
+    from .tracking import tracker
+    
+    try:
+        latest = tracker.latest(rider_id)
+        return Response({
+            'success': True,
+            'rider_id': rider_id,
+            'latest': {
+                'latitude': latest[0],
+                'longitude': latest[1],
+                'recorded_at': latest[2],
+            } if latest else None,
+            'track': [{
+                'latitude': latitude,
+                'longitude': longitude,
+                'recorded_at': recorded_at,
+            } for latitude, longitude, recorded_at in tracker.recent(rider_id)]
+        })
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@token_required(['admin'])
+@idempotent
 def verify_collection(request, submission_id):
-    """Verify collection and award points (admin only)"""
+    """Verify collection and settle its points (admin only)"""
     serializer = CollectionVerificationSerializer(data=request.data)
     if not serializer.is_valid():
         return Response({
@@ -346,71 +467,58 @@ def verify_collection(request, submission_id):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        submission = TrashSubmission.objects.get(id=submission_id)
+        submission = TrashSubmission.objects.select_related('user').get(id=submission_id)
         points = serializer.validated_data['points']
         notes = serializer.validated_data.get('notes', '')
-        admin_notes = serializer.validated_data.get('admin_notes', '')
         
-        if submission.status != 'collected':
-            return Response({
-                'success': False,
-                'error': 'Submission is not in collected status'
-            }, status=status.HTTP_400_BAD_REQUEST)
+        collection_record = state_machine.verify(submission.id, request.user, points, notes)
         
-        with transaction.atomic():
-            # Get or create collection record
-            collection_record, created = CollectionRecord.objects.get_or_create(
-                submission=submission,
-                defaults={
-                    'rider': submission.rider,
-                    'trash_type': 'Mixed Waste',
-                    'actual_quantity': submission.quantity_kg or 0,
-                    'points_awarded': points,
-                    'admin_verified': True,
-                    'verified_by': request.user,
-                    'verified_at': timezone.now()
-                }
-            )
-            
-            if not created:
-                # Update existing record
-                collection_record.points_awarded = points
-                collection_record.admin_verified = True
-                collection_record.verified_by = request.user
-                collection_record.verified_at = timezone.now()
-                collection_record.save()
-            
-            # Update user's points
-            user = submission.user
-            user.reward_points += points
-            user.save()
-            
-            # Change submission status to 'verified'
-            submission.status = 'verified'
-            submission.save()
-            
-            # Create reward point history entry
-            RewardPointHistory.objects.create(
-                user=user,
-                points=points,
-                reason=f'Collection verified by admin - {notes}' if notes else 'Collection verified by admin',
-                submission=submission,
-                awarded_by=request.user
-            )
-            
         result_serializer = CollectionRecordSerializer(collection_record)
         return Response({
             'success': True,
-            'message': f'Collection verified successfully. {points} points awarded to {user.username}',
+            'message': f'Collection verified successfully. {points} points awarded to {submission.user.username}',
             'collection': result_serializer.data
         })
         
+    except state_machine.TransitionError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
     except TrashSubmission.DoesNotExist:
         return Response({
             'success': False,
             'error': 'Submission not found'
         }, status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['POST'])
+@token_required(['admin', 'rider'])
+@idempotent
+def apply_transitions(request):
+    """Apply a batch of submission status changes
+
+    Body: {"transitions": [{"submission": id, "status": "...", ...parameters}]}
+    """
+    transitions = request.data.get('transitions') if isinstance(request.data, dict) else None
+    if not isinstance(transitions, list) or not all(isinstance(item, dict) for item in transitions):
+        return Response({
+            'success': False,
+            'error': 'transitions must be a list of objects'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        results = state_machine.apply_many(transitions, request.user)
+        return Response({
+            'success': True,
+            'applied': sum(1 for result in results if result['success']),
+            'results': results
+        })
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET'])
 @token_required(['rider'])
 def rider_collections(request):
@@ -436,8 +544,7 @@ def rider_collections(request):
     
     if search_query:
         collections = collections.filter(
-            Q(submission__location__icontains=search_query) |
-            Q(trash_type__icontains=search_query)
+            search_service.filter('submission', search_query, path='submission_id')
         )
     
     # Pagination
@@ -465,8 +572,8 @@ def rider_collections(request):
 @api_view(['GET'])
 @token_required()
 def user_points_history(request):
-    """Get user's point history with filtering and pagination"""
-    history = RewardPointHistory.objects.filter(user=request.user).order_by('-created_at')
+    """Get user's point history with filtering and pagination; older pages come from the archive"""
+    from dashboard.archive import point_history
     
     # Apply filters
     type_filter = request.GET.get('type', '')
@@ -474,22 +581,7 @@ def user_points_history(request):
     page = request.GET.get('page', 1)
     per_page = int(request.GET.get('per_page', 10))
     
-    if type_filter:
-        if type_filter == 'earned':
-            history = history.filter(points__gt=0)
-        elif type_filter == 'spent':
-            history = history.filter(points__lt=0)
-    
-    if date_filter:
-        today = timezone.now().date()
-        if date_filter == 'today':
-            history = history.filter(created_at__date=today)
-        elif date_filter == 'week':
-            week_ago = today - timezone.timedelta(days=7)
-            history = history.filter(created_at__date__gte=week_ago)
-        elif date_filter == 'month':
-            month_ago = today - timezone.timedelta(days=30)
-            history = history.filter(created_at__date__gte=month_ago)
+    history = point_history(request.user, type_filter, date_filter)
     
     # Pagination
     paginator = Paginator(history, per_page)
@@ -537,6 +629,7 @@ def get_claim_rewards_info(request):
 
 @api_view(['POST'])
 @token_required()
+@idempotent
 def submit_claim(request):
     """Process a new reward claim submission"""
     serializer = RewardClaimCreateSerializer(data=request.data)
@@ -613,11 +706,7 @@ def get_claim_history(request):
         claims = claims.filter(status=status_filter)
     
     if search_query:
-        claims = claims.filter(
-            Q(reference_id__icontains=search_query) |
-            Q(claim_type__icontains=search_query) |
-            Q(notes__icontains=search_query)
-        )
+        claims = claims.filter(search_service.filter('claim', search_query))
     
     # Pagination
     paginator = Paginator(claims, per_page)
@@ -663,10 +752,8 @@ def get_manage_claims(request):
     
     if search_query:
         claims = claims.filter(
-            Q(user__username__icontains=search_query) |
-            Q(reference_id__icontains=search_query) |
-            Q(notes__icontains=search_query) |
-            Q(donation_hospital__icontains=search_query)
+            search_service.filter('claim', search_query) |
+            search_service.filter('user', search_query, path='user_id')
         )
     
     # Pagination
@@ -702,72 +789,20 @@ def get_manage_claims(request):
 
 @api_view(['POST'])
 @token_required(['admin'])
+@idempotent
 def update_claim_status(request, claim_id):
     """API endpoint to update claim status"""
     try:
         claim = RewardClaim.objects.get(id=claim_id)
         new_status = request.data.get('status')
-        
-        if new_status not in ['processing', 'completed', 'cancelled']:
-            return Response({
-                'success': False,
-                'error': 'Invalid status'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Validate status transitions
-        if new_status == 'completed' and claim.claim_amount < 500:
-            return Response({
-                'success': False,
-                'error': 'Claims below 500 points cannot be completed'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        if new_status == 'completed' and claim.status != 'processing':
-            return Response({
-                'success': False,
-                'error': 'Only processing claims can be completed'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        if new_status == 'completed' and claim.status == 'completed':
+        try:
+            transition_claim(claim.id, new_status, request.user, notes=request.data.get('notes'))
+        except ClaimTransitionError as e:
             return Response({
                 'success': False,
-                'error': 'Claim is already completed'
+                'error': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
-        
-        with transaction.atomic():
-            # Update status
-            claim.status = new_status
-            claim.processed_by = request.user
-            claim.processed_at = timezone.now()
-            
-            # Handle completed claims - deduct points when claim is completed
-            if new_status == 'completed':
-                # Deduct points from user when claim is completed
-                user = claim.user
-                user.reward_points -= claim.claim_amount
-                user.save()
-                
-                # Log the point deduction
-                RewardPointHistory.objects.create(
-                    user=user,
-                    points=-claim.claim_amount,  # Negative points for deduction
-                    reason=f"Claim {claim.reference_id} completed - points deducted",
-                    awarded_by=request.user
-                )
-            elif new_status == 'cancelled' and claim.status in ['pending', 'processing']:
-                # Refund points if cancelling
-                user = claim.user
-                user.reward_points += claim.claim_amount
-                user.save()
-                
-                RewardPointHistory.objects.create(
-                    user=user,
-                    points=claim.claim_amount,
-                    reason=f"Claim {claim.reference_id} cancelled - points refunded",
-                    awarded_by=request.user
-                )
-            
-            claim.save()
-        
+        claim.refresh_from_db()
         result_serializer = RewardClaimSerializer(claim)
         
         # Prepare success message
@@ -794,9 +829,185 @@ def update_claim_status(request, claim_id):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@token_required(['admin'])
+@idempotent
+def bulk_update_claim_status(request):
+    """Move many claims to one status in a single transaction (admin only)"""
+    serializer = ClaimBulkStatusSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        results = transition_claims(
+            serializer.validated_data['claims'],
+            serializer.validated_data['status'],
+            request.user,
+            notes=serializer.validated_data.get('notes'),
+        )
+        return Response({
+            'success': True,
+            'updated': sum(result['success'] for result in results),
+            'results': results
+        })
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET', 'POST'])
+@token_required(['admin'])
+@idempotent
+def payout_batches(request):
+    """List payout batches, or batch the processing claims (admin only)"""
+    from .models import PayoutBatch
+    from .payouts import batch_summary, create_batch
+    
+    try:
+        if request.method == 'GET':
+            batches = PayoutBatch.objects.order_by('-created_at')
+            if request.GET.get('status'):
+                batches = batches.filter(status=request.GET['status'])
+            paginator = Paginator(batches, 20)
+            page_obj = paginator.get_page(request.GET.get('page', 1))
+            return Response({
+                'success': True,
+                'batches': [{
+                    'id': batch.id,
+                    'reference_id': batch.reference_id,
+                    'status': batch.status,
+                    'created_at': batch.created_at,
+                    'completed_at': batch.completed_at,
+                    'claim_count': batch.claim_count,
+                    'total_points': batch.total_points,
+                    'total_amount': batch.total_amount,
+                } for batch in page_obj],
+                'pagination': {
+                    'current_page': page_obj.number,
+                    'total_pages': paginator.num_pages,
+                    'total_count': paginator.count,
+                }
+            })
+        
+        serializer = PayoutBatchCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'error': 'Invalid data',
+                'details': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        batch = create_batch(request.user, **serializer.validated_data)
+        if batch is None:
+            return Response({
+                'success': False,
+                'error': 'No processing claims to batch'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'success': True,
+            'batch_id': batch.id,
+            'batch': batch_summary(batch)
+        }, status=status.HTTP_201_CREATED)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@token_required(['admin'])
+def payout_batch_detail(request, batch_id):
+    """Totals of a payout batch per settlement file (admin only)"""
+    from .models import PayoutBatch
+    from .payouts import batch_summary
+    
+    try:
+        batch = PayoutBatch.objects.get(id=batch_id)
+        return Response({
+            'success': True,
+            'batch_id': batch.id,
+            'batch': batch_summary(batch)
+        })
+    except PayoutBatch.DoesNotExist:
+        return Response({
+            'success': False,
+            'error': 'Payout batch not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@token_required(['admin'])
+def payout_settlement_file(request, batch_id):
+    """Stream the settlement CSV of a batch: ?group=payment, or ?group=donation&donation_hospital= (admin only)"""
+    from django.http import StreamingHttpResponse
+    from .models import PayoutBatch
+    from .payouts import PayoutError, settlement_claims, settlement_filename, stream_settlement
+    
+    try:
+        batch = PayoutBatch.objects.get(id=batch_id)
+        group = request.GET.get('group', 'payment')
+        donation_hospital = request.GET.get('donation_hospital')
+        # Validate the arguments before the response starts streaming
+        settlement_claims(batch, group, donation_hospital)
+        response = StreamingHttpResponse(
+            stream_settlement(batch, group, donation_hospital),
+            content_type='text/csv; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{settlement_filename(batch, group, donation_hospital)}"'
+        return response
+    except PayoutBatch.DoesNotExist:
+        return Response({
+            'success': False,
+            'error': 'Payout batch not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except PayoutError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@token_required(['admin'])
+@idempotent
+def complete_payout_batch(request, batch_id):
+    """Complete every claim of a payout batch and deduct the points (admin only)"""
+    from .payouts import PayoutError, batch_summary, complete_batch
+    
+    try:
+        batch = complete_batch(batch_id, request.user)
+        return Response({
+            'success': True,
+            'message': f'Payout batch {batch.reference_id} completed: {batch.claim_count} claims, {batch.total_points} points deducted.',
+            'batch': batch_summary(batch)
+        })
+    except PayoutError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['POST'])
 @authentication_classes([SessionAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent
 def update_submission_status(request, submission_id):
     """Update submission status (for riders)"""
     try:
@@ -816,83 +1027,18 @@ def update_submission_status(request, submission_id):
                 'error': 'Status is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Validate status transition
-        valid_transitions = {
-            'assigned': ['on_the_way'],
-            'on_the_way': ['arrived'],
-            'arrived': ['picked'],
-            'picked': ['collected']
-        }
-        
-        if submission.status not in valid_transitions:
-            return Response({
-                'success': False,
-                'error': f'Cannot update status from {submission.status}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        if new_status not in valid_transitions[submission.status]:
+        try:
+            result = state_machine.apply(submission.id, new_status, request.user, notes=request.data.get('notes'))
+        except state_machine.TransitionError as e:
             return Response({
                 'success': False,
-                'error': f'Invalid status transition from {submission.status} to {new_status}'
+                'error': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Update status
-        submission.status = new_status
-        submission.updated_at = timezone.now()
-        
-        # Set pickup time when status becomes 'picked'
-        if new_status == 'picked' and not submission.pickup_time:
-            submission.pickup_time = timezone.now()
-        
-        # Set completion time when status becomes 'collected'
-        if new_status == 'collected' and not submission.completion_time:
-            submission.completion_time = timezone.now()
-        
-        submission.save()
-        
-        # Award points and create CollectionRecord when status becomes 'collected'
-        if new_status == 'collected':
-            # Use the current quantity_kg for points calculation
-            weight_kg = float(submission.quantity_kg or 0)
-            points_to_award = int(weight_kg * 10)  # 10 points per kg
-
-            # Create or update the CollectionRecord for this submission
-            collection_record, created = CollectionRecord.objects.get_or_create(
-                submission=submission,
-                defaults={
-                    'rider': submission.rider or request.user,
-                    'trash_type': 'Mixed Waste',
-                    'actual_quantity': weight_kg,
-                    'points_awarded': max(points_to_award, 0),
-                }
-            )
-
-            if not created:
-                # Ensure it reflects latest values
-                collection_record.rider = submission.rider or request.user
-                collection_record.trash_type = collection_record.trash_type or 'Mixed Waste'
-                collection_record.actual_quantity = weight_kg
-                collection_record.points_awarded = max(points_to_award, 0)
-                collection_record.save()
-
-            if points_to_award > 0:
-                # Update user's reward points
-                submission.user.reward_points += points_to_award
-                submission.user.save()
-                
-                # Create point history record
-                RewardPointHistory.objects.create(
-                    user=submission.user,
-                    points=points_to_award,
-                    reason=f"Trash collection completed - {weight_kg}kg (Track ID: {submission.track_id})",
-                    submission=submission,
-                    awarded_by=request.user  # The rider who completed it
-                )
+        submission.refresh_from_db()
         
         message = f'Status updated to {new_status}'
         if new_status == 'collected':
-            points_awarded = int(weight_kg * 10)
-            message += f'. Points awarded to user: {points_awarded} points'
+            message += f'. Points awarded to user: {result["points"]} points'
         
         return Response({
             'success': True,
@@ -909,6 +1055,7 @@ def update_submission_status(request, submission_id):
 @api_view(['POST'])
 @authentication_classes([SessionAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent
 def update_submission_weight(request, submission_id):
     """Update submission weight and status (for riders when picking up)"""
     try:
@@ -944,42 +1091,34 @@ def update_submission_weight(request, submission_id):
                 'error': 'Invalid weight value'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Update submission
-        submission.quantity_kg = quantity_kg
-        submission.rider_notes = rider_notes
-        submission.status = new_status
-        submission.updated_at = timezone.now()
-        
-        # Set pickup time when status becomes 'picked'
-        if new_status == 'picked' and not submission.pickup_time:
-            submission.pickup_time = timezone.now()
-        
-        # Set completion time when status becomes 'collected'
-        if new_status == 'collected' and not submission.completion_time:
-            submission.completion_time = timezone.now()
-        
-        submission.save()
-        
-        # Award points to user when status becomes 'collected'
-        if new_status == 'collected':
-            points_to_award = int(quantity_kg * 10)  # 10 points per kg
-            if points_to_award > 0:
-                # Update user's reward points
-                submission.user.reward_points += points_to_award
-                submission.user.save()
-                
-                # Create point history record
-                RewardPointHistory.objects.create(
-                    user=submission.user,
-                    points=points_to_award,
-                    reason=f"Trash collection completed - {quantity_kg}kg (Track ID: {submission.track_id})",
-                    submission=submission,
-                    awarded_by=request.user  # The rider who completed it
+        points_awarded = None
+        if new_status == submission.status:
+            # Correcting the weight without moving on, only until the points are awarded
+            with transaction.atomic():
+                submission = TrashSubmission.objects.select_for_update().get(id=submission.id)
+                if submission.status != 'picked':
+                    return Response({
+                        'success': False,
+                        'error': f'The weight can no longer be changed once the submission is {submission.status}'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                submission.quantity_kg = quantity_kg
+                submission.rider_notes = rider_notes
+                submission.save(update_fields=['quantity_kg', 'rider_notes', 'updated_at'])
+        else:
+            try:
+                result = state_machine.apply(
+                    submission.id, new_status, request.user, quantity_kg=quantity_kg, notes=rider_notes
                 )
+            except state_machine.TransitionError as e:
+                return Response({
+                    'success': False,
+                    'error': str(e)
+                }, status=status.HTTP_400_BAD_REQUEST)
+            points_awarded = result.get('points')
+            submission.refresh_from_db()
         
         message = f'Weight updated to {quantity_kg} kg and status updated to {new_status}'
-        if new_status == 'collected':
-            points_awarded = int(quantity_kg * 10)
+        if points_awarded is not None:
             message += f'. Points awarded to user: {points_awarded} points'
         
         return Response({
@@ -993,3 +1132,22 @@ def update_submission_weight(request, submission_id):
             'success': False,
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@token_required(['admin'])
+def export_data(request, dataset):
+    """Stream an export of submissions, collections, points or claims as CSV or JSONL"""
+    from .exports import export_response
+    
+    try:
+        return export_response(dataset, request.GET)
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
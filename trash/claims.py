@@ -0,0 +1,127 @@
+"""
+Reward claim transitions.
+
+Claims move pending -> processing -> completed, and pending or processing
+claims can be cancelled. Points are only taken from the user when a claim is
+completed; cancelling a completed claim gives them back:
+
+    pending -> processing -> completed
+    pending / processing / completed -> cancelled
+
+``transition_claims`` applies one status change to a batch of claims: it
+loads and validates them in one query, moves the accepted ones with one
+UPDATE, applies the deductions and refunds with one grouped F() UPDATE of
+the users' balances and bulk_creates the RewardPointHistory rows.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RewardClaim, RewardPointHistory
+from .state_machine import add_points
+
+CLAIM_TRANSITIONS = {
+    'pending': {'processing', 'cancelled'},
+    'processing': {'completed', 'cancelled'},
+    'completed': {'cancelled'},
+    'cancelled': set(),
+}
+
+MIN_CLAIM_POINTS = 500
+
+
+class ClaimTransitionError(Exception):
+    pass
+
+
+def transition_claim(claim_id, to_status, actor, notes=None):
+    """Change one claim's status; raises ClaimTransitionError if not allowed"""
+    result = transition_claims([claim_id], to_status, actor, notes)[0]
+    if not result['success']:
+        raise ClaimTransitionError(result['error'])
+    return result
+
+
+def transition_claims(claim_ids, to_status, actor, notes=None):
+    """Move the claims to to_status; invalid ones are skipped
+
+    Returns one result dict per claim id. notes, if given, replaces the
+    notes of every claim that is moved.
+    """
+    if to_status not in ('processing', 'completed', 'cancelled'):
+        return [{'claim': claim_id, 'success': False, 'error': 'Invalid status'} for claim_id in claim_ids]
+
+    now = timezone.now()
+    with transaction.atomic():
+        claims = RewardClaim.objects.select_for_update().select_related('user').in_bulk(claim_ids)
+
+        results = []
+        accepted = []
+        balances = {}
+        seen = set()
+        for claim_id in claim_ids:
+            claim = claims.get(claim_id)
+            try:
+                if claim is None:
+                    raise ClaimTransitionError('Claim not found')
+                if claim.id in seen:
+                    raise ClaimTransitionError('Claim appears more than once in the batch')
+                balances.setdefault(claim.user_id, claim.user.reward_points)
+                _check(claim, to_status, balances)
+            except ClaimTransitionError as e:
+                results.append({'claim': claim_id, 'success': False, 'error': str(e)})
+                continue
+            seen.add(claim.id)
+            accepted.append(claim)
+            results.append({'claim': claim.id, 'success': True, 'from_status': claim.status, 'status': to_status})
+
+        if accepted:
+            _write(accepted, to_status, actor, notes, now)
+    return results
+
+
+def _check(claim, to_status, balances):
+    """Validate one claim; reserves the points of completions in balances"""
+    if to_status == 'completed':
+        if claim.claim_amount < MIN_CLAIM_POINTS:
+            raise ClaimTransitionError(f'Claims below {MIN_CLAIM_POINTS} points cannot be completed')
+        if claim.status == 'completed':
+            raise ClaimTransitionError('Claim is already completed')
+        if claim.status != 'processing':
+            raise ClaimTransitionError('Only processing claims can be completed')
+        if balances[claim.user_id] < claim.claim_amount:
+            raise ClaimTransitionError('User does not have enough points for this claim')
+        balances[claim.user_id] -= claim.claim_amount
+    elif to_status not in CLAIM_TRANSITIONS[claim.status]:
+        raise ClaimTransitionError(f'Cannot change a {claim.status} claim to {to_status}')
+
+
+def _write(accepted, to_status, actor, notes, now):
+    changes = {'status': to_status, 'processed_by': actor, 'processed_at': now, 'updated_at': now}
+    if notes:
+        changes['notes'] = notes
+    RewardClaim.objects.filter(id__in=[claim.id for claim in accepted]).update(**changes)
+
+    deltas = defaultdict(int)
+    history = []
+    for claim in accepted:
+        if to_status == 'completed':
+            points = -claim.claim_amount
+            reason = f'Claim {claim.reference_id} completed - points deducted'
+        elif claim.status == 'completed':
+            points = claim.claim_amount
+            reason = f'Claim {claim.reference_id} cancelled - points refunded'
+        else:
+            points = 0
+        if points:
+            deltas[claim.user_id] += points
+            history.append(RewardPointHistory(user_id=claim.user_id, points=points, reason=reason, awarded_by=actor))
+        for field, value in changes.items():
+            setattr(claim, field, value)
+
+    add_points(deltas)
+    RewardPointHistory.objects.bulk_create(history, batch_size=1000)
+
+    from dashboard.data_versions import bump_data_version
+    bump_data_version(*(('claims', 'users', 'rewards') if history else ('claims',)))
@@ -0,0 +1,129 @@
+"""
+Automatic dispatch of pending submissions to riders.
+
+Pending submissions are clustered by area (society and block of their
+location_key) and handed out to active riders so that every rider ends up
+with roughly the same open load (submissions in assigned..picked). A min-heap
+keyed on open load picks the least busy rider; that rider takes a contiguous
+chunk of one area up to the even-share target, which keeps each rider's
+pickups close together.
+
+Planning works on plain tuples and the assignments go through the state
+machine's batch apply_many in one transaction, so a run over thousands of
+pending rows stays well under a second.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from accounts.models import CustomUser
+from .state_machine import apply_many
+from .locations import location_area, location_key
+from .models import TrashSubmission
+
+OPEN_STATUSES = ('assigned', 'on_the_way', 'arrived', 'picked')
+
+
+def area_of(key):
+    """Area of a location key: "society:block" for known societies, else the key itself"""
+    return location_area(key) or key
+
+
+def pending_by_area(area=None):
+    """Pending, unassigned submission ids grouped by area, oldest first"""
+    pending = TrashSubmission.objects.filter(
+        status='pending', rider__isnull=True
+    ).order_by('created_at').values_list('id', 'location_key', 'location')
+
+    clusters = defaultdict(list)
+    for submission_id, key, location in pending.iterator(chunk_size=2000):
+        submission_area = area_of(key or location_key(location))
+        if area and not submission_area.startswith(area):
+            continue
+        clusters[submission_area].append(submission_id)
+    return clusters
+
+
+def rider_loads(riders=None):
+    """{rider_id: open load} for the given (default: all active) riders"""
+    if riders is None:
+        riders = CustomUser.objects.filter(user_type='rider', status='active')
+    return dict(riders.annotate(
+        open_load=Count('assigned_collections', filter=Q(assigned_collections__status__in=OPEN_STATUSES))
+    ).values_list('id', 'open_load'))
+
+
+def plan_dispatch(clusters, loads, max_per_rider=None):
+    """Split area clusters across riders, least loaded first
+
+    Returns ({rider_id: [(area, [submission ids])]}, [unassigned submission ids]).
+    """
+    plan = defaultdict(list)
+    if not loads:
+        return plan, [submission_id for ids in clusters.values() for submission_id in ids]
+
+    total = sum(loads.values()) + sum(len(ids) for ids in clusters.values())
+    target = math.ceil(total / len(loads))
+    heap = [(load, rider_id) for rider_id, load in loads.items()
+            if max_per_rider is None or load < max_per_rider]
+    heapq.heapify(heap)
+
+    unassigned = []
+    # Walk the areas in key order so neighbouring blocks of a society go out together
+    for area in sorted(clusters):
+        remaining = clusters[area]
+        while remaining:
+            if not heap:
+                unassigned.extend(remaining)
+                break
+            load, rider_id = heapq.heappop(heap)
+            take = max(1, target - load)
+            if max_per_rider is not None:
+                take = min(take, max_per_rider - load)
+            chunk, remaining = remaining[:take], remaining[take:]
+            plan[rider_id].append((area, chunk))
+            load += len(chunk)
+            if max_per_rider is None or load < max_per_rider:
+                heapq.heappush(heap, (load, rider_id))
+    return plan, unassigned
+
+
+def auto_dispatch(dry_run=False, area=None, max_per_rider=None, assigned_by=None):
+    """Plan and (unless dry_run) apply an automatic dispatch run"""
+    clusters = pending_by_area(area)
+    loads = rider_loads()
+    plan, unassigned = plan_dispatch(clusters, loads, max_per_rider)
+
+    assigned_count = 0
+    if not dry_run and plan:
+        with transaction.atomic():
+            results = apply_many([
+                {'submission': submission_id, 'status': 'assigned', 'rider': rider_id}
+                for rider_id, chunks in plan.items()
+                for _, ids in chunks
+                for submission_id in ids
+            ], assigned_by)
+            # Rows assigned by someone else since planning are skipped
+            assigned_count = sum(1 for result in results if result['success'])
+
+            if assigned_by is not None:
+                from accounts.activity import log_activity
+                log_activity(assigned_by, 'auto_dispatch', {'assigned': assigned_count, 'riders': len(plan), 'area': area or ''})
+
+    usernames = dict(CustomUser.objects.filter(id__in=list(plan)).values_list('id', 'username'))
+    return {
+        'dry_run': dry_run,
+        'pending_count': sum(len(ids) for ids in clusters.values()),
+        'planned_count': sum(len(ids) for chunks in plan.values() for _, ids in chunks),
+        'assigned_count': assigned_count,
+        'unassigned': unassigned,
+        'assignments': [{
+            'rider_id': rider_id,
+            'rider': usernames.get(rider_id, ''),
+            'open_load_before': loads[rider_id],
+            'areas': [{'area': chunk_area, 'submission_ids': ids} for chunk_area, ids in chunks],
+        } for rider_id, chunks in plan.items()],
+    }
@@ -0,0 +1,90 @@
+"""
+Submission status events.
+
+Every status change appends a SubmissionEvent (from, to, actor, time), so the
+time spent in each stage can be measured instead of guessed from the
+timestamps that later saves overwrite. ``stage_durations`` computes the
+duration statistics of every stage in one aggregate query.
+"""
+from django.db.models import Avg, Case, Count, DurationField, ExpressionWrapper, F, Max, Min, Q, When
+from django.utils import timezone
+
+from .models import SubmissionEvent
+
+# stage -> (status it starts at, status it ends at); "created" is the submission's creation
+STAGES = {
+    'time_to_assign': ('created', 'assigned'),
+    'time_to_start': ('assigned', 'on_the_way'),
+    'time_to_arrive': ('on_the_way', 'arrived'),
+    'time_on_site': ('arrived', 'picked'),
+    'time_to_complete': ('picked', 'collected'),
+    'end_to_end': ('created', 'collected'),
+}
+
+STAGE_STATUSES = ('assigned', 'on_the_way', 'arrived', 'picked', 'collected')
+
+
+def record_event(submission, from_status, actor=None, at=None):
+    """Append the move of a submission from from_status to its current status"""
+    return SubmissionEvent.objects.create(
+        submission=submission,
+        from_status=from_status or '',
+        to_status=submission.status,
+        actor=actor,
+        created_at=at or timezone.now(),
+    )
+
+
+def record_events(transitions, actor=None, at=None):
+    """Append events for [(submission_id, from_status, to_status)] in bulk"""
+    at = at or timezone.now()
+    return SubmissionEvent.objects.bulk_create([
+        SubmissionEvent(
+            submission_id=submission_id,
+            from_status=from_status or '',
+            to_status=to_status,
+            actor=actor,
+            created_at=at,
+        ) for submission_id, from_status, to_status in transitions
+    ], batch_size=1000)
+
+
+def stage_durations(submissions=None):
+    """Count, average, min and max seconds of every stage, in one query
+
+    Each submission contributes the time between its first event of the
+    stage's start status and its first event of the end status. submissions
+    optionally restricts the statistics to a TrashSubmission queryset.
+    """
+    events = SubmissionEvent.objects.all()
+    if submissions is not None:
+        events = events.filter(submission__in=submissions)
+
+    per_submission = events.values('submission').annotate(
+        created=Min('submission__created_at'),
+        **{status: Min(Case(When(to_status=status, then='created_at'))) for status in STAGE_STATUSES}
+    ).order_by()
+
+    aggregates = {}
+    for stage, (start, end) in STAGES.items():
+        duration = ExpressionWrapper(F(end) - F(start), output_field=DurationField())
+        aggregates[f'{stage}_count'] = Count(end, filter=_both_set(start, end))
+        aggregates[f'{stage}_avg'] = Avg(duration, filter=_both_set(start, end))
+        aggregates[f'{stage}_min'] = Min(duration, filter=_both_set(start, end))
+        aggregates[f'{stage}_max'] = Max(duration, filter=_both_set(start, end))
+    totals = per_submission.aggregate(**aggregates)
+
+    return {stage: {
+        'count': totals[f'{stage}_count'],
+        'avg_seconds': _seconds(totals[f'{stage}_avg']),
+        'min_seconds': _seconds(totals[f'{stage}_min']),
+        'max_seconds': _seconds(totals[f'{stage}_max']),
+    } for stage in STAGES}
+
+
+def _both_set(start, end):
+    return Q(**{f'{start}__isnull': False, f'{end}__isnull': False})
+
+
+def _seconds(value):
+    return round(value.total_seconds(), 1) if value is not None else None
@@ -0,0 +1,230 @@
+"""
+Streaming exports of submissions, collections, point history and claims.
+
+Rows are read with ``.values_list(...).iterator(chunk_size=...)`` and written
+out one line at a time, so memory use stays flat no matter how many rows are
+exported. Filters take the same GET parameters as the matching list views.
+"""
+import csv
+import json
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import TrashSubmission, CollectionRecord, RewardPointHistory, RewardClaim
+from dashboard.search import search_service
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def _filter_date(queryset, field, date_filter):
+    """Apply the today/week/month filter used by the list views"""
+    today = timezone.now().date()
+    if date_filter == 'today':
+        return queryset.filter(**{f'{field}__date': today})
+    elif date_filter == 'week':
+        return queryset.filter(**{f'{field}__date__gte': today - timedelta(days=7)})
+    elif date_filter == 'month':
+        return queryset.filter(**{f'{field}__date__gte': today - timedelta(days=30)})
+    return queryset
+
+
+def _filter_range(queryset, field, params):
+    """Optional inclusive start_date/end_date (YYYY-MM-DD) range"""
+    if params.get('start_date'):
+        queryset = queryset.filter(**{f'{field}__date__gte': params['start_date']})
+    if params.get('end_date'):
+        queryset = queryset.filter(**{f'{field}__date__lte': params['end_date']})
+    return queryset
+
+
+def filter_submissions(params):
+    submissions = TrashSubmission.objects.all()
+
+    if params.get('status'):
+        submissions = submissions.filter(status=params['status'])
+    if params.get('user'):
+        submissions = submissions.filter(user_id=params['user'])
+    if params.get('rider'):
+        submissions = submissions.filter(rider_id=params['rider'])
+    if params.get('search'):
+        search_query = params['search']
+        submissions = submissions.filter(
+            search_service.filter('submission', search_query) |
+            search_service.filter('user', search_query, path='user_id')
+        )
+
+    submissions = _filter_date(submissions, 'created_at', params.get('date'))
+    return _filter_range(submissions, 'created_at', params)
+
+
+def filter_collections(params):
+    collections = CollectionRecord.objects.all()
+
+    if params.get('rider'):
+        collections = collections.filter(rider_id=params['rider'])
+    if params.get('search'):
+        search_query = params['search']
+        collections = collections.filter(
+            search_service.filter('submission', search_query, path='submission_id')
+        )
+
+    collections = _filter_date(collections, 'collected_at', params.get('date'))
+    return _filter_range(collections, 'collected_at', params)
+
+
+def filter_points(params):
+    history = RewardPointHistory.objects.all()
+
+    if params.get('user'):
+        history = history.filter(user_id=params['user'])
+    if params.get('type') == 'earned':
+        history = history.filter(points__gt=0)
+    elif params.get('type') == 'spent':
+        history = history.filter(points__lt=0)
+
+    history = _filter_date(history, 'created_at', params.get('date'))
+    return _filter_range(history, 'created_at', params)
+
+
+def filter_claims(params):
+    claims = RewardClaim.objects.all()
+
+    if params.get('status'):
+        claims = claims.filter(status=params['status'])
+    if params.get('claim_type'):
+        claims = claims.filter(claim_type=params['claim_type'])
+    if params.get('search'):
+        search_query = params['search']
+        claims = claims.filter(
+            search_service.filter('claim', search_query) |
+            search_service.filter('user', search_query, path='user_id')
+        )
+
+    claims = _filter_date(claims, 'created_at', params.get('date'))
+    return _filter_range(claims, 'created_at', params)
+
+
+# dataset -> (filter function, ordering, [(column, field lookup), ...])
+EXPORTS = {
+    'submissions': (filter_submissions, 'id', [
+        ('id', 'id'),
+        ('track_id', 'track_id'),
+        ('user', 'user__username'),
+        ('user_email', 'user__email'),
+        ('location', 'location'),
+        ('quantity_kg', 'quantity_kg'),
+        ('status', 'status'),
+        ('rider', 'rider__username'),
+        ('created_at', 'created_at'),
+        ('assigned_at', 'assigned_at'),
+        ('pickup_time', 'pickup_time'),
+        ('completion_time', 'completion_time'),
+    ]),
+    'collections': (filter_collections, 'id', [
+        ('id', 'id'),
+        ('track_id', 'submission__track_id'),
+        ('location', 'submission__location'),
+        ('rider', 'rider__username'),
+        ('trash_type', 'trash_type'),
+        ('actual_quantity', 'actual_quantity'),
+        ('points_awarded', 'points_awarded'),
+        ('collected_at', 'collected_at'),
+        ('admin_verified', 'admin_verified'),
+        ('verified_by', 'verified_by__username'),
+        ('verified_at', 'verified_at'),
+    ]),
+    'points': (filter_points, 'id', [
+        ('id', 'id'),
+        ('user', 'user__username'),
+        ('points', 'points'),
+        ('reason', 'reason'),
+        ('track_id', 'submission__track_id'),
+        ('awarded_by', 'awarded_by__username'),
+        ('created_at', 'created_at'),
+    ]),
+    'claims': (filter_claims, 'id', [
+        ('id', 'id'),
+        ('reference_id', 'reference_id'),
+        ('user', 'user__username'),
+        ('claim_type', 'claim_type'),
+        ('claim_amount', 'claim_amount'),
+        ('monetary_amount', 'monetary_amount'),
+        ('donation_hospital', 'donation_hospital'),
+        ('status', 'status'),
+        ('created_at', 'created_at'),
+        ('processed_by', 'processed_by__username'),
+        ('processed_at', 'processed_at'),
+        ('notes', 'notes'),
+    ]),
+}
+
+
+class _Echo:
+    """File-like object whose write() just returns the line, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value) if not isinstance(value, (int, float, bool)) else value
+
+
+def export_rows(dataset, params, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the header and then every matching row as a tuple"""
+    filter_func, ordering, columns = EXPORTS[dataset]
+    queryset = filter_func(params).order_by(ordering).values_list(*[field for _, field in columns])
+
+    yield tuple(column for column, _ in columns)
+    for row in queryset.iterator(chunk_size=chunk_size):
+        yield tuple(_format_value(value) for value in row)
+
+
+def stream_export(dataset, params, export_format='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the export one encoded line at a time"""
+    rows = export_rows(dataset, params, chunk_size)
+
+    if export_format == 'jsonl':
+        header = next(rows)
+        for row in rows:
+            yield json.dumps(dict(zip(header, row))) + '\n'
+    else:
+        writer = csv.writer(_Echo())
+        for row in rows:
+            yield writer.writerow(row)
+
+
+def export_filename(dataset, export_format):
+    return f"{dataset}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+
+
+def export_response(dataset, params):
+    """StreamingHttpResponse for an export request; raises ValueError for bad arguments"""
+    from django.http import StreamingHttpResponse
+
+    from dashboard.replica import iterate_on_replica
+
+    if dataset not in EXPORTS:
+        raise ValueError(f'Unknown export: {dataset}')
+    export_format = params.get('output', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unsupported export format: {export_format}')
+
+    response = StreamingHttpResponse(
+        # Streamed after the view returns, so the replica scope goes with the iterator
+        iterate_on_replica(stream_export(dataset, params, export_format)),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(dataset, export_format)}"'
+    return response
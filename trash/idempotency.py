@@ -0,0 +1,184 @@
+"""
+Idempotency keys for mutating endpoints.
+
+Clients that may retry a request (the mobile apps on flaky connections) send
+an ``Idempotency-Key`` header. The first request with a key runs the view and
+its response is stored in IdempotencyKey for IDEMPOTENCY_KEY_TTL seconds;
+a retry with the same key gets the stored response back (marked with an
+``Idempotent-Replayed`` header) without running the view again, so points,
+claims and submissions are never applied twice.
+
+Keys are scoped to the user. A key reused for a different request is
+rejected, and a retry that arrives while the first request is still running
+gets a 409. Stored responses are also cached, so a replay usually costs no
+query and otherwise one lookup on the (user, key) unique index.
+Server errors are not stored: the client may retry them with the same key.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import JsonResponse, RawPostDataException
+from django.utils import timezone
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 100
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+CACHE_KEY = 'idempotency:{user}:{key}'
+# A key still marked running after this long belongs to a request that died
+STALE_CLAIM_SECONDS = 300
+
+
+def idempotency_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+
+def request_fingerprint(request):
+    """Hash of the method, path and body of a request"""
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    try:
+        digest.update(request.body)
+    except RawPostDataException:
+        # Multipart bodies are consumed by the parser; hash the parsed fields instead
+        digest.update(json.dumps(sorted(request.POST.lists())).encode())
+    return digest.hexdigest()
+
+
+def idempotent(view_func):
+    """Replay the stored response when a request's Idempotency-Key was seen before
+
+    Goes below the authentication decorators, as keys belong to request.user.
+    Works for DRF views and for Django views returning JsonResponse.
+    """
+    @wraps(view_func)
+    def wrapped_view(request, *args, **kwargs):
+        key = request.headers.get(HEADER, '').strip()
+        if not key or request.method in SAFE_METHODS or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _respond(request, 400, {
+                'success': False,
+                'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'
+            })
+
+        fingerprint = request_fingerprint(request)
+        stored = _lookup(request.user.id, key)
+        if stored is None:
+            stored = _claim(request.user.id, key, fingerprint)
+        if stored is not None:
+            stored_fingerprint, status_code, data = stored
+            if stored_fingerprint != fingerprint:
+                return _respond(request, 422, {
+                    'success': False,
+                    'error': f'This {HEADER} was already used for a different request'
+                })
+            if status_code is None:
+                return _respond(request, 409, {
+                    'success': False,
+                    'error': f'A request with this {HEADER} is still being processed'
+                })
+            response = _respond(request, status_code, data)
+            response[REPLAYED_HEADER] = 'true'
+            return response
+
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            _forget(request.user.id, key)
+            raise
+        _store(request.user.id, key, fingerprint, response)
+        return response
+
+    return wrapped_view
+
+
+def _lookup(user_id, key):
+    """(fingerprint, status_code, data) stored for the key, or None"""
+    from .models import IdempotencyKey
+
+    stored = cache.get(CACHE_KEY.format(user=user_id, key=key))
+    if stored is not None:
+        return stored
+    now = timezone.now()
+    record = IdempotencyKey.objects.filter(user_id=user_id, key=key, expires_at__gt=now).exclude(
+        status_code__isnull=True, created_at__lte=now - timedelta(seconds=STALE_CLAIM_SECONDS)
+    ).values_list('fingerprint', 'status_code', 'response', 'expires_at').first()
+    if record is None:
+        return None
+    if record[1] is not None:
+        cache.set(CACHE_KEY.format(user=user_id, key=key), record[:3], (record[3] - now).total_seconds())
+    return record[:3]
+
+
+def _claim(user_id, key, fingerprint):
+    """Reserve the key for this request; returns the competing entry if another request got it first"""
+    from .models import IdempotencyKey
+
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=idempotency_ttl())
+    try:
+        with transaction.atomic():
+            # Expired entries wait here until they are purged, abandoned ones until they go stale
+            IdempotencyKey.objects.filter(user_id=user_id, key=key).filter(
+                Q(expires_at__lte=now)
+                | Q(status_code__isnull=True, created_at__lte=now - timedelta(seconds=STALE_CLAIM_SECONDS))
+            ).delete()
+            IdempotencyKey.objects.create(
+                user_id=user_id, key=key, fingerprint=fingerprint, created_at=now, expires_at=expires_at
+            )
+    except IntegrityError:
+        return _lookup(user_id, key)
+    return None
+
+
+def _store(user_id, key, fingerprint, response):
+    """Keep the response for replays, or free the key if it should not be replayed"""
+    from .models import IdempotencyKey
+
+    data = _response_data(response)
+    if response.status_code >= 500 or data is None:
+        _forget(user_id, key)
+        return
+    # Round trip through JSON so replays match what the client originally received
+    data = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+    IdempotencyKey.objects.filter(user_id=user_id, key=key).update(status_code=response.status_code, response=data)
+    cache.set(CACHE_KEY.format(user=user_id, key=key), (fingerprint, response.status_code, data), idempotency_ttl())
+
+
+def _forget(user_id, key):
+    from .models import IdempotencyKey
+
+    IdempotencyKey.objects.filter(user_id=user_id, key=key).delete()
+    cache.delete(CACHE_KEY.format(user=user_id, key=key))
+
+
+def _response_data(response):
+    if hasattr(response, 'data'):
+        return response.data
+    if isinstance(response, JsonResponse):
+        return json.loads(response.content)
+    return None
+
+
+def _respond(request, status_code, data):
+    from rest_framework.request import Request
+    from rest_framework.response import Response
+
+    if isinstance(request, Request):
+        return Response(data, status=status_code)
+    return JsonResponse(data, status=status_code, safe=False)
+
+
+def purge_expired():
+    """Delete expired keys; returns how many were removed"""
+    from .models import IdempotencyKey
+
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
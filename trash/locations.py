@@ -0,0 +1,96 @@
+"""
+Address normalization shared by the customer import commands and submissions.
+
+``location_key`` turns a free-text address such as "108 B UET society" into
+"uet:b:108" (society, block, house number) so near-duplicate spellings of the
+same address group together in analytics.
+"""
+import re
+
+# Canonical society name -> spellings seen in the imported addresses
+KNOWN_SOCIETIES = {
+    'uet': ['uet'],
+    'nfc': ['nfc'],
+    'valencia': ['valencia', 'valancia', 'varancia'],
+    'wapda town': ['wapda town'],
+    'tariq garden': ['tariq garden'],
+    'military account': ['military account', 'millitary account'],
+    'punjab university housing scheme': ['punjab university housing scheme', 'puehs'],
+    'nasheman iqbal': ['nasheman iqbal', 'nishemen iqbal', 'nishamen iqbal'],
+}
+
+LOCATION_KEY_MAX_LENGTH = 255
+
+# Spellings only match as whole words, so "quetta" or "unfcd" name no society
+SOCIETY_PATTERNS = {
+    society: re.compile(r'\b(?:' + '|'.join(re.escape(spelling) for spelling in spellings) + r')\b')
+    for society, spellings in KNOWN_SOCIETIES.items()
+}
+
+_BLOCK_PATTERNS = [
+    re.compile(r'\b([a-z]\d?)\s*blk'),    # "b blk", "ablk", "k2 blk"
+    re.compile(r'\bblk\s*([a-z]\d?)\b'),  # "blk c", "blk c1"
+]
+
+
+def normalize_address(address):
+    """Normalize address for better matching"""
+    if not address:
+        return ""
+    # Convert to lowercase and remove extra spaces
+    normalized = re.sub(r'\s+', ' ', address.lower().strip())
+    # Remove common variations
+    normalized = normalized.replace('street', 'st').replace('block', 'blk')
+    return normalized
+
+
+def extract_house_number(address):
+    """Extract house number from address"""
+    # Look for numbers at the beginning of the address
+    match = re.match(r'^(\d+)', address.strip())
+    if match:
+        return match.group(1)
+    return None
+
+
+def extract_society(normalized):
+    for society, pattern in SOCIETY_PATTERNS.items():
+        if pattern.search(normalized):
+            return society
+    return None
+
+
+def extract_block(normalized):
+    """Block letter from "b blk" / "blk b", else a lone letter right after the house number"""
+    for pattern in _BLOCK_PATTERNS:
+        match = pattern.search(normalized)
+        if match:
+            return match.group(1)
+    match = re.match(r'^\d+\S*\s+([a-z]\d?)\b', normalized)
+    if match:
+        return match.group(1)
+    return None
+
+
+def location_key(address):
+    """Grouping key for an address: "society:block:house" when the society is known"""
+    normalized = normalize_address(address)
+    society = extract_society(normalized)
+    if not society:
+        # Unknown area: group on the normalized text itself
+        return re.sub(r'[^\w ]', '', normalized)[:LOCATION_KEY_MAX_LENGTH]
+    return ':'.join([
+        society,
+        extract_block(normalized) or '',
+        extract_house_number(normalized) or '',
+    ])
+
+
+def location_area(key, blocks=True):
+    """Area of a location key: "society:block" (just the society without a block
+    or with blocks=False), or None for the key of an unknown address"""
+    parts = key.split(':')
+    if len(parts) != 3 or not parts[0]:
+        return None
+    society, block, _ = parts
+    return f'{society}:{block}' if blocks and block else society
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trash', '0008_remove_trashsubmission_actual_weight_kg_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trashsubmission',
+            name='location_key',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='trashsubmission',
+            index=models.Index(fields=['location_key', 'created_at'], name='trash_location_key_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trash', '0010_rider_location'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trashsubmission',
+            name='pickup_area',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='trashsubmission',
+            name='pickup_slot',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Pickup Slot'),
+        ),
+        migrations.AddIndex(
+            model_name='trashsubmission',
+            index=models.Index(fields=['pickup_area', 'pickup_slot'], name='trash_pickup_slot_idx'),
+        ),
+    ]
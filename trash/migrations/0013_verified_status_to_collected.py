@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def verified_to_collected(apps, schema_editor):
+    """'verified' was never a valid status; verification lives on the collection record"""
+    TrashSubmission = apps.get_model('trash', 'TrashSubmission')
+    CollectionRecord = apps.get_model('trash', 'CollectionRecord')
+
+    verified = TrashSubmission.objects.filter(status='verified')
+    CollectionRecord.objects.filter(submission__in=verified).update(admin_verified=True)
+    verified.update(status='collected')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trash', '0012_submission_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(verified_to_collected, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 from accounts.models import CustomUser
+from .locations import location_key, LOCATION_KEY_MAX_LENGTH
 
 # Create your models here.
 
@@ -19,6 +22,8 @@ class TrashSubmission(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='submissions')
     quantity_kg = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True, verbose_name="Estimated Weight (kg)")
     location = models.CharField(max_length=255)
+    # Normalized society:block:house of location, for grouping near-duplicate addresses
+    location_key = models.CharField(max_length=LOCATION_KEY_MAX_LENGTH, blank=True, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -30,10 +35,25 @@ class TrashSubmission(models.Model):
     pickup_time = models.DateTimeField(null=True, blank=True)
     completion_time = models.DateTimeField(null=True, blank=True)
     rider_notes = models.TextField(blank=True, null=True, verbose_name="Rider's Notes")
+    # Pickup window booked at submission (trash.scheduling) and the capacity area it counts against
+    pickup_slot = models.DateTimeField(null=True, blank=True, verbose_name="Pickup Slot")
+    pickup_area = models.CharField(max_length=50, blank=True, editable=False)
+    
+    class Meta:
+        indexes = [
+            # Area analytics group by location_key within a created_at window
+            models.Index(fields=['location_key', 'created_at'], name='trash_location_key_idx'),
+            # Slot capacity counts bookings per area and slot
+            models.Index(fields=['pickup_area', 'pickup_slot'], name='trash_pickup_slot_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.track_id:
             self.track_id = self.generate_track_id()
+        self.location_key = location_key(self.location)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'location' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'location_key'}
         super().save(*args, **kwargs)
     
     def generate_track_id(self):
@@ -104,6 +124,14 @@ class RewardClaim(models.Model):
     processed_at = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True)
     reference_id = models.CharField(max_length=20, blank=True, unique=True, editable=False)
+    # Settlement batch the claim is paid out in (trash.payouts)
+    payout_batch = models.ForeignKey('PayoutBatch', null=True, blank=True, on_delete=models.SET_NULL, related_name='claims')
+    
+    class Meta:
+        indexes = [
+            # Completing a batch sums each user's claims in the batch
+            models.Index(fields=['payout_batch', 'user'], name='trash_claim_batch_user_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.reference_id:
@@ -119,3 +147,82 @@ class RewardClaim(models.Model):
     
     def __str__(self):
         return f"{self.user.username}: {self.claim_amount} points - {self.get_status_display()}"
+
+class PayoutBatch(models.Model):
+    """Processing claims grouped for one settlement run, completed together by trash.payouts"""
+    STATUS_CHOICES = (
+        ('open', 'Open'),
+        ('completed', 'Completed'),
+    )
+    
+    reference_id = models.CharField(max_length=20, unique=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    created_by = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_by = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    completed_at = models.DateTimeField(null=True, blank=True)
+    # Totals of the claims paid out, filled in on completion
+    claim_count = models.PositiveIntegerField(default=0)
+    total_points = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def save(self, *args, **kwargs):
+        if not self.reference_id:
+            self.reference_id = f"PB{get_random_string(10, allowed_chars='0123456789ABCDEFGHJKLMNPQRSTUVWXYZ')}"
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.reference_id} - {self.get_status_display()}"
+
+class RiderLocation(models.Model):
+    """Location ping sent by a rider's app; written in batches by trash.tracking"""
+    rider = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='locations')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    recorded_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['rider', 'recorded_at'], name='trash_rider_location_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.rider_id} at ({self.latitude}, {self.longitude})"
+
+class SubmissionEvent(models.Model):
+    """One status transition of a submission, appended by trash.events"""
+    submission = models.ForeignKey(TrashSubmission, on_delete=models.CASCADE, related_name='events')
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20)
+    actor = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            # Stage durations take each submission's first event per status
+            models.Index(fields=['submission', 'to_status', 'created_at'], name='trash_event_stage_idx'),
+            models.Index(fields=['to_status', 'created_at'], name='trash_event_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.submission_id}: {self.from_status or '-'} -> {self.to_status}"
+
+class IdempotencyKey(models.Model):
+    """Stored response of a request sent with an Idempotency-Key, replayed by trash.idempotency"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=100)
+    # Hash of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    # Empty while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='trash_idempotency_key_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.key}"
@@ -0,0 +1,195 @@
+"""
+Payout batches.
+
+A payout batch collects processing claims for one settlement run.
+``create_batch`` attaches the claims with a single UPDATE. The settlement
+files are one CSV for the payments and one per donation hospital; they are
+streamed from ``.iterator()`` with their totals computed by the database, so
+a batch of any size is exported in constant memory. ``complete_batch``
+completes every claim of the batch in one transaction: one UPDATE deducts
+each user's batch total from their balance, the ledger rows are inserted
+chunk by chunk and one UPDATE marks the claims completed. If any user lacks
+the points for their claims, nothing is completed.
+"""
+import csv
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from .claims import MIN_CLAIM_POINTS
+from .exports import DEFAULT_CHUNK_SIZE, _Echo, _format_value
+from .models import PayoutBatch, RewardClaim, RewardPointHistory
+
+PAYMENT_GROUP = 'payment'
+DONATION_GROUP = 'donation'
+
+PAYMENT_COLUMNS = [
+    ('reference_id', 'reference_id'),
+    ('user', 'user__username'),
+    ('first_name', 'user__first_name'),
+    ('last_name', 'user__last_name'),
+    ('phone', 'user__phone'),
+    ('email', 'user__email'),
+    ('claim_amount', 'claim_amount'),
+    ('monetary_amount', 'monetary_amount'),
+    ('created_at', 'created_at'),
+]
+
+DONATION_COLUMNS = [
+    ('reference_id', 'reference_id'),
+    ('user', 'user__username'),
+    ('donation_hospital', 'donation_hospital'),
+    ('claim_amount', 'claim_amount'),
+    ('monetary_amount', 'monetary_amount'),
+    ('created_at', 'created_at'),
+]
+
+
+class PayoutError(Exception):
+    pass
+
+
+def create_batch(actor, claim_type=None, donation_hospital=None, limit=None):
+    """Batch the processing claims not in a batch yet; returns the batch, or None if there are none"""
+    claims = RewardClaim.objects.filter(
+        status='processing', payout_batch__isnull=True, claim_amount__gte=MIN_CLAIM_POINTS
+    )
+    if claim_type:
+        claims = claims.filter(claim_type=claim_type)
+    if donation_hospital:
+        claims = claims.filter(donation_hospital=donation_hospital)
+    if limit:
+        claims = RewardClaim.objects.filter(id__in=Subquery(claims.order_by('id').values('id')[:limit]))
+
+    with transaction.atomic():
+        batch = PayoutBatch.objects.create(created_by=actor)
+        if not claims.update(payout_batch=batch):
+            transaction.set_rollback(True)
+            return None
+    return batch
+
+
+def batch_claims(batch):
+    """The claims a batch pays out: its processing claims, or once completed its completed ones"""
+    return batch.claims.filter(status='completed' if batch.status == 'completed' else 'processing')
+
+
+def batch_summary(batch):
+    """Counts and totals of the batch per settlement file, computed in the database"""
+    groups = []
+    for claim_type, hospital, claims, points, amount in batch_claims(batch).values_list(
+        'claim_type', 'donation_hospital'
+    ).annotate(
+        claims=Count('id'), points=Sum('claim_amount'), amount=Sum('monetary_amount')
+    ).order_by('claim_type', 'donation_hospital'):
+        groups.append({
+            'group': claim_type,
+            'donation_hospital': hospital if claim_type == DONATION_GROUP else None,
+            'claims': claims,
+            'points': points,
+            'amount': amount,
+        })
+    return {
+        'reference_id': batch.reference_id,
+        'status': batch.status,
+        'created_at': batch.created_at,
+        'completed_at': batch.completed_at,
+        'claims': sum(group['claims'] for group in groups),
+        'points': sum(group['points'] for group in groups),
+        'amount': sum(group['amount'] for group in groups),
+        'groups': groups,
+    }
+
+
+def settlement_claims(batch, group, donation_hospital=None):
+    """(claims, columns) of one settlement file; raises PayoutError for an unknown file"""
+    claims = batch_claims(batch)
+    if group == PAYMENT_GROUP:
+        return claims.filter(claim_type=PAYMENT_GROUP), PAYMENT_COLUMNS
+    if group == DONATION_GROUP:
+        if not donation_hospital:
+            raise PayoutError('donation_hospital is required for the donation file')
+        return claims.filter(claim_type=DONATION_GROUP, donation_hospital=donation_hospital), DONATION_COLUMNS
+    raise PayoutError(f'Unknown settlement group: {group}')
+
+
+def stream_settlement(batch, group, donation_hospital=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the CSV lines of one settlement file, ending with a TOTAL row"""
+    claims, columns = settlement_claims(batch, group, donation_hospital)
+    writer = csv.writer(_Echo())
+
+    yield writer.writerow([column for column, _ in columns])
+    for row in claims.order_by('id').values_list(*[field for _, field in columns]).iterator(chunk_size=chunk_size):
+        yield writer.writerow([_format_value(value) for value in row])
+
+    totals = claims.aggregate(claims=Count('id'), points=Sum('claim_amount'), amount=Sum('monetary_amount'))
+    total_row = [''] * len(columns)
+    total_row[0] = 'TOTAL'
+    total_row[1] = f"{totals['claims']} claims"
+    total_row[-3] = totals['points'] or 0
+    total_row[-2] = totals['amount'] or 0
+    yield writer.writerow([_format_value(value) for value in total_row])
+
+
+def settlement_filename(batch, group, donation_hospital=None):
+    name = f'{batch.reference_id}_{group}'
+    if donation_hospital:
+        name += '_' + ''.join(char if char.isalnum() else '_' for char in donation_hospital)
+    return f'{name}.csv'
+
+
+def complete_batch(batch_id, actor, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Complete every processing claim of an open batch, all or nothing"""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = PayoutBatch.objects.select_for_update().filter(id=batch_id).first()
+        if batch is None:
+            raise PayoutError('Payout batch not found')
+        if batch.status != 'open':
+            raise PayoutError('Payout batch is already completed')
+
+        # Claims completed or cancelled on their own since batching are not part of this payout
+        batch.claims.exclude(status='processing').update(payout_batch=None)
+        claims = batch_claims(batch)
+        owed = Subquery(
+            claims.filter(user=OuterRef('pk')).order_by().values('user').annotate(total=Sum('claim_amount')).values('total')
+        )
+        users = CustomUser.objects.filter(id__in=claims.values('user'))
+        short = list(users.annotate(owed=owed).filter(reward_points__lt=F('owed')).values_list('username', flat=True)[:10])
+        if short:
+            raise PayoutError(f'Users without enough points for their claims: {", ".join(short)}')
+
+        users.update(reward_points=F('reward_points') - Coalesce(owed, Value(0)))
+
+        history = []
+        for user_id, reference_id, points in claims.order_by('id').values_list(
+            'user_id', 'reference_id', 'claim_amount'
+        ).iterator(chunk_size=chunk_size):
+            history.append(RewardPointHistory(
+                user_id=user_id,
+                points=-points,
+                reason=f'Claim {reference_id} completed - points deducted',
+                awarded_by=actor,
+            ))
+            if len(history) >= chunk_size:
+                RewardPointHistory.objects.bulk_create(history)
+                history = []
+        RewardPointHistory.objects.bulk_create(history)
+
+        totals = claims.aggregate(claims=Count('id'), points=Sum('claim_amount'), amount=Sum('monetary_amount'))
+        claims.update(status='completed', processed_by=actor, processed_at=now, updated_at=now)
+
+        batch.status = 'completed'
+        batch.completed_by = actor
+        batch.completed_at = now
+        batch.claim_count = totals['claims']
+        batch.total_points = totals['points'] or 0
+        batch.total_amount = totals['amount'] or 0
+        batch.save()
+
+    from dashboard.data_versions import bump_data_version
+    bump_data_version('claims', 'users', 'rewards')
+    return batch
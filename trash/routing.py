@@ -0,0 +1,104 @@
+"""
+Route ordering for a rider's open pickups.
+
+There are no coordinates for submissions, so stops are placed on the grid
+their location_key describes: society, then block letter, then house number.
+Stops in different societies are far apart, blocks within a society are
+closer and neighbouring house numbers closest. The route is built with a
+nearest-neighbour pass and tightened with 2-opt, which takes a few
+milliseconds for a day's queue so it can run on every request.
+"""
+from .locations import location_key
+
+# Cost of moving between societies and between blocks, in "house numbers"
+SOCIETY_DISTANCE = 100000
+BLOCK_DISTANCE = 1000
+
+# 2-opt is quadratic per pass; longer queues keep the nearest-neighbour order
+MAX_TWO_OPT_STOPS = 250
+MAX_TWO_OPT_PASSES = 20
+
+
+def stop_position(key):
+    """(area, block, house) grid position of a location key"""
+    parts = key.split(':')
+    if len(parts) != 3:
+        # Unknown society: each distinct address is its own area
+        return key, 0, 0
+    society, block, house = parts
+    block_number = 0
+    if block:
+        block_number = (ord(block[0]) - ord('a') + 1) * 10 + (int(block[1:]) if block[1:].isdigit() else 0)
+    return society, block_number, int(house) if house.isdigit() else 0
+
+
+def distance(a, b):
+    if a[0] != b[0]:
+        return SOCIETY_DISTANCE
+    return abs(a[1] - b[1]) * BLOCK_DISTANCE + abs(a[2] - b[2])
+
+
+def nearest_neighbour(matrix, start=0):
+    """Greedy path visiting every stop, always moving to the closest unvisited one"""
+    unvisited = set(range(len(matrix))) - {start}
+    path = [start]
+    while unvisited:
+        row = matrix[path[-1]]
+        nearest = min(unvisited, key=row.__getitem__)
+        unvisited.remove(nearest)
+        path.append(nearest)
+    return path
+
+
+def two_opt(path, matrix):
+    """Reverse segments of an open path while that shortens it; path[0] stays first"""
+    n = len(path)
+    for _ in range(MAX_TWO_OPT_PASSES):
+        improved = False
+        for i in range(n - 2):
+            a, b = path[i], path[i + 1]
+            row_a, row_b = matrix[a], matrix[b]
+            removed_ab = row_a[b]
+            for j in range(i + 2, n):
+                c = path[j]
+                if j + 1 < n:
+                    d = path[j + 1]
+                    delta = row_a[c] + row_b[d] - removed_ab - matrix[c][d]
+                else:
+                    # Last stop: the path is open, so there is no edge after it
+                    delta = row_a[c] - removed_ab
+                if delta < 0:
+                    path[i + 1:j + 1] = reversed(path[i + 1:j + 1])
+                    b = path[i + 1]
+                    row_b = matrix[b]
+                    removed_ab = row_a[b]
+                    improved = True
+        if not improved:
+            break
+    return path
+
+
+def plan_route(keys, start=0):
+    """Visiting order (indexes into keys) for stops with the given location keys"""
+    if len(keys) < 3:
+        return list(range(len(keys)))
+    positions = [stop_position(key) for key in keys]
+    matrix = [[distance(a, b) for b in positions] for a in positions]
+    path = nearest_neighbour(matrix, start)
+    if len(path) <= MAX_TWO_OPT_STOPS:
+        path = two_opt(path, matrix)
+    return path
+
+
+def route_order(submissions):
+    """Submissions in route order, starting from the one the rider is already working on
+
+    Submissions already on the way or arrived come first, otherwise the
+    route starts at the earliest assigned one.
+    """
+    submissions = sorted(submissions, key=lambda s: (
+        s.status not in ('on_the_way', 'arrived'),
+        s.assigned_at or s.created_at,
+    ))
+    keys = [submission.location_key or location_key(submission.location) for submission in submissions]
+    return [submissions[index] for index in plan_route(keys)]
@@ -0,0 +1,162 @@
+"""
+Pickup time slots.
+
+Users book a pickup window (PICKUP_SLOT_HOURS on each of the next
+PICKUP_SLOT_DAYS_AHEAD days) when they submit trash. Each area (the society
+of the submission's location_key, or "other") gets a share of the slot
+capacity, which is the number of active riders times
+PICKUP_SLOT_RIDER_CAPACITY, in proportion to the area's submissions over the
+last DEMAND_WINDOW_DAYS. No area gets less than PICKUP_SLOT_MIN_AREA_CAPACITY.
+
+``schedule`` holds the capacity and booking counts in memory, so availability
+checks cost no query. Each committed change to a booked submission re-counts
+its slot from the database, and the whole table is rebuilt every
+PICKUP_SLOT_REFRESH_INTERVAL seconds. That also picks up bookings made by
+other workers and changes in the rider count.
+
+The in-memory counts are only a hint for showing availability. ``reserve``
+counts the slot's bookings in the database inside the transaction that saves
+the booking. On SQLite, transactions start IMMEDIATE (see DATABASES), so the
+bookings of all workers take turns and a slot is never overbooked.
+"""
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .locations import location_area
+
+OTHER_AREA = 'other'
+DEMAND_WINDOW_DAYS = 30
+
+
+def slot_area(key):
+    """Capacity area of a location key: its society, or "other" for unknown addresses"""
+    return location_area(key, blocks=False) or OTHER_AREA
+
+
+def slot_windows(now=None):
+    """[(start, end)] of the slots that can still be booked, earliest first"""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    current_timezone = timezone.get_current_timezone()
+    windows = []
+    for day in range(getattr(settings, 'PICKUP_SLOT_DAYS_AHEAD', 7)):
+        date = today + timedelta(days=day)
+        for start_hour, end_hour in getattr(settings, 'PICKUP_SLOT_HOURS', [(9, 12), (12, 15), (15, 18)]):
+            start = timezone.make_aware(datetime(date.year, date.month, date.day, start_hour), current_timezone)
+            if start > now:
+                end = timezone.make_aware(datetime(date.year, date.month, date.day, end_hour), current_timezone)
+                windows.append((start, end))
+    return windows
+
+
+class SlotCapacityTable:
+    """In-memory capacity and booking counts per (area, slot start)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._capacity = {}      # area -> bookings allowed per slot
+        self._booked = Counter()  # (area, slot start) -> bookings
+        self._built_at = None
+
+    @property
+    def min_area_capacity(self):
+        return getattr(settings, 'PICKUP_SLOT_MIN_AREA_CAPACITY', 2)
+
+    def refresh(self):
+        """Rebuild capacity from rider counts and bookings from the database"""
+        from accounts.models import CustomUser
+        from .models import TrashSubmission
+
+        now = timezone.now()
+        riders = CustomUser.objects.filter(user_type='rider', status='active').count()
+        total = riders * getattr(settings, 'PICKUP_SLOT_RIDER_CAPACITY', 6)
+
+        demand = Counter()
+        for key, submissions in TrashSubmission.objects.filter(
+            created_at__gte=now - timedelta(days=DEMAND_WINDOW_DAYS)
+        ).values_list('location_key').annotate(n=Count('id')).order_by():
+            demand[slot_area(key)] += submissions
+        all_demand = sum(demand.values())
+        capacity = {
+            area: max(self.min_area_capacity, math.floor(total * submissions / all_demand))
+            for area, submissions in demand.items()
+        }
+
+        booked = Counter()
+        for area, start, bookings in TrashSubmission.objects.filter(
+            pickup_slot__gte=now
+        ).exclude(status='cancelled').values_list('pickup_area', 'pickup_slot').annotate(n=Count('id')).order_by():
+            booked[(area, start)] = bookings
+
+        with self._lock:
+            self._capacity = capacity
+            self._booked = booked
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        interval = getattr(settings, 'PICKUP_SLOT_REFRESH_INTERVAL', 300)
+        if self._built_at is None or time.monotonic() - self._built_at >= interval:
+            self.refresh()
+
+    def capacity(self, area):
+        return self._capacity.get(area, self.min_area_capacity)
+
+    def availability(self, area):
+        """Bookable slots of an area with their capacity and remaining places"""
+        self._ensure_fresh()
+        capacity = self.capacity(area)
+        with self._lock:
+            return [{
+                'start': start,
+                'end': end,
+                'capacity': capacity,
+                'booked': self._booked[(area, start)],
+                'remaining': max(capacity - self._booked[(area, start)], 0),
+            } for start, end in slot_windows()]
+
+    def reserve(self, area, start):
+        """Take a place in a slot; False if the slot is full or not bookable
+
+        Call it inside the transaction that saves the booking: the decision is
+        made on the slot's bookings in the database, not the in-memory count.
+        """
+        from .models import TrashSubmission
+
+        self._ensure_fresh()
+        if start not in {window_start for window_start, _ in slot_windows()}:
+            return False
+        bookings = TrashSubmission.objects.filter(
+            pickup_area=area, pickup_slot=start
+        ).exclude(status='cancelled').count()
+        with self._lock:
+            if bookings >= self.capacity(area):
+                self._booked[(area, start)] = bookings
+                return False
+            self._booked[(area, start)] = bookings + 1
+            return True
+
+    def release(self, area, start):
+        """Give back a place taken by reserve() whose booking was not saved"""
+        with self._lock:
+            if self._booked[(area, start)] > 0:
+                self._booked[(area, start)] -= 1
+
+    def sync_slot(self, area, start):
+        """Re-count one slot's bookings from the database"""
+        from .models import TrashSubmission
+
+        bookings = TrashSubmission.objects.filter(
+            pickup_area=area, pickup_slot=start
+        ).exclude(status='cancelled').count()
+        with self._lock:
+            self._booked[(area, start)] = bookings
+
+
+schedule = SlotCapacityTable()
@@ -16,7 +16,7 @@ class TrashSubmissionSerializer(serializers.ModelSerializer):
 class TrashSubmissionCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = TrashSubmission
-        fields = ('quantity_kg', 'rider_notes')
+        fields = ('quantity_kg', 'rider_notes', 'pickup_slot')
 
 class CollectionRecordSerializer(serializers.ModelSerializer):
     submission = TrashSubmissionSerializer(read_only=True)
@@ -73,7 +73,27 @@ class RiderAssignmentSerializer(serializers.Serializer):
     rider = serializers.IntegerField()
     notes = serializers.CharField(required=False, allow_blank=True)
 
+class AutoDispatchSerializer(serializers.Serializer):
+    dry_run = serializers.BooleanField(default=False)
+    area = serializers.CharField(required=False, allow_blank=True)
+    max_per_rider = serializers.IntegerField(required=False, min_value=1)
+
+class RiderLocationPingSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    recorded_at = serializers.DateTimeField(required=False)
+
 class CollectionVerificationSerializer(serializers.Serializer):
     points = serializers.IntegerField(min_value=1)
     notes = serializers.CharField(required=False, allow_blank=True)
     admin_notes = serializers.CharField(required=False, allow_blank=True)
+
+class ClaimBulkStatusSerializer(serializers.Serializer):
+    claims = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=5000)
+    status = serializers.ChoiceField(choices=['processing', 'completed', 'cancelled'])
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+class PayoutBatchCreateSerializer(serializers.Serializer):
+    claim_type = serializers.ChoiceField(choices=RewardClaim.CLAIM_TYPE_CHOICES, required=False)
+    donation_hospital = serializers.CharField(required=False, allow_blank=True)
+    limit = serializers.IntegerField(required=False, min_value=1)
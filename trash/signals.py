@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .scheduling import schedule
+
+
+def booking_changed(sender, instance, raw=False, **kwargs):
+    """Re-count the slot of a booked submission once the change is committed"""
+    if raw or not instance.pickup_slot:
+        return
+    area, start = instance.pickup_area, instance.pickup_slot
+    transaction.on_commit(lambda: schedule.sync_slot(area, start))
+
+
+def connect_signals():
+    from .models import TrashSubmission
+
+    post_save.connect(booking_changed, sender=TrashSubmission, dispatch_uid='pickup_slot_save')
+    post_delete.connect(booking_changed, sender=TrashSubmission, dispatch_uid='pickup_slot_delete')
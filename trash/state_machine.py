@@ -0,0 +1,342 @@
+"""
+Submission state machine.
+
+Every status change of a TrashSubmission goes through ``apply_many`` (or
+``apply`` for a single submission). It checks the transition and who is
+allowed to make it, then applies the change and its side effects:
+
+    pending -> assigned -> on_the_way -> arrived -> picked -> collected
+    pending / assigned -> cancelled
+
+* assigned: sets the rider, assigned_at and the rider notes
+* picked: sets pickup_time and, if given, the measured quantity_kg
+* collected: sets completion_time, creates or updates the CollectionRecord
+  and awards the points (balance and RewardPointHistory)
+
+Admin verification does not change the status. ``verify`` marks the
+collection record verified and corrects the points already awarded to the
+amount the admin settled on.
+
+A batch is applied with set-based writes: one UPDATE per target status (and
+per rider for assignments), bulk writes of collection records, point history
+and events, and one UPDATE of all affected point balances.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from .events import record_events
+from .models import TrashSubmission, CollectionRecord, RewardPointHistory
+
+TRANSITIONS = {
+    'pending': {'assigned', 'cancelled'},
+    'assigned': {'on_the_way', 'cancelled'},
+    'on_the_way': {'arrived'},
+    'arrived': {'picked'},
+    'picked': {'collected'},
+    'collected': set(),
+    'cancelled': set(),
+}
+
+# Transitions a rider may make on submissions assigned to them; admins may make any
+RIDER_TRANSITIONS = {'on_the_way', 'arrived', 'picked', 'collected'}
+
+POINTS_PER_KG = 10
+DEFAULT_TRASH_TYPE = 'Mixed Waste'
+
+class TransitionError(Exception):
+    pass
+
+
+def allowed(from_status, to_status):
+    return to_status in TRANSITIONS.get(from_status, ())
+
+
+def next_statuses(targets=RIDER_TRANSITIONS):
+    """{status: sorted statuses it may move to}, limited to targets; for the rider pages' buttons"""
+    return {status: sorted(TRANSITIONS[status] & targets) for status in TRANSITIONS}
+
+
+def apply(submission_id, to_status, actor, **params):
+    """Apply one transition; raises TransitionError if it is not allowed"""
+    result = apply_many([{'submission': submission_id, 'status': to_status, **params}], actor)[0]
+    if not result['success']:
+        raise TransitionError(result['error'])
+    return result
+
+
+def apply_many(transitions, actor):
+    """Apply a batch of transitions made by actor (None for the system)
+
+    transitions is a list of dicts with 'submission' (id), 'status' and the
+    transition's parameters: 'rider' for assigned, 'quantity_kg' for picked,
+    'trash_type', 'actual_quantity' and 'points' for collected, 'notes' for
+    any. Invalid entries are skipped; returns one result dict per entry.
+    """
+    now = timezone.now()
+    transitions = [{**transition, 'submission': _as_id(transition.get('submission')),
+                    'rider': _as_id(transition.get('rider'))} for transition in transitions]
+    with transaction.atomic():
+        submissions = TrashSubmission.objects.select_for_update().in_bulk(
+            [transition['submission'] for transition in transitions if transition['submission'] is not None]
+        )
+        rider_ids = {transition['rider'] for transition in transitions if transition.get('status') == 'assigned'}
+        riders = set(CustomUser.objects.filter(id__in=rider_ids - {None}, user_type='rider').values_list('id', flat=True))
+
+        results = []
+        accepted = []
+        seen = set()
+        for transition in transitions:
+            submission = submissions.get(transition.get('submission'))
+            try:
+                if submission is None:
+                    raise TransitionError('Submission not found')
+                if submission.id in seen:
+                    raise TransitionError('Submission appears more than once in the batch')
+                params = _check(submission, transition, actor, riders)
+            except TransitionError as e:
+                results.append({'submission': transition.get('submission'), 'success': False, 'error': str(e)})
+                continue
+            seen.add(submission.id)
+            accepted.append((submission, submission.status, params))
+            result = {'submission': submission.id, 'success': True,
+                      'from_status': submission.status, 'status': params['status']}
+            if 'points' in params:
+                result['points'] = params['points']
+            results.append(result)
+
+        if accepted:
+            _write(accepted, actor, now)
+    return results
+
+
+def _check(submission, transition, actor, riders):
+    """Validate one transition and return its cleaned parameters"""
+    to_status = transition.get('status')
+    if to_status not in TRANSITIONS:
+        raise TransitionError(f'Invalid status: {to_status}')
+    if not allowed(submission.status, to_status):
+        raise TransitionError(f'Invalid status transition from {submission.status} to {to_status}')
+
+    if actor is not None and actor.user_type == 'rider':
+        if to_status not in RIDER_TRANSITIONS:
+            raise TransitionError('Permission denied')
+        if submission.rider_id != actor.id:
+            raise TransitionError('You are not assigned to this submission')
+    elif actor is not None and actor.user_type != 'admin':
+        raise TransitionError('Permission denied')
+
+    params = {'status': to_status, 'notes': transition.get('notes')}
+    if to_status == 'assigned':
+        if transition.get('rider') not in riders:
+            raise TransitionError('Invalid rider')
+        params['rider'] = transition['rider']
+    if to_status in ('picked', 'collected') and transition.get('quantity_kg') not in (None, ''):
+        params['quantity_kg'] = _positive_decimal(transition['quantity_kg'], 'Weight')
+    if to_status == 'collected':
+        quantity = transition.get('actual_quantity')
+        if quantity in (None, ''):
+            quantity = params.get('quantity_kg', submission.quantity_kg or 0)
+        params['actual_quantity'] = _positive_decimal(quantity, 'Weight', allow_zero=True)
+        params['trash_type'] = transition.get('trash_type') or DEFAULT_TRASH_TYPE
+        points = transition.get('points')
+        try:
+            params['points'] = int(points) if points not in (None, '') else int(params['actual_quantity'] * POINTS_PER_KG)
+        except (TypeError, ValueError):
+            raise TransitionError('Invalid points value')
+        if params['points'] < 0:
+            raise TransitionError('Points cannot be negative')
+    return params
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _positive_decimal(value, label, allow_zero=False):
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise TransitionError(f'Invalid {label.lower()} value')
+    if number < 0 or (number == 0 and not allow_zero):
+        raise TransitionError(f'{label} must be greater than 0')
+    return number.quantize(Decimal('0.01'))
+
+
+def _write(accepted, actor, now):
+    """Set-based writes for validated transitions"""
+    by_status = defaultdict(list)
+    by_rider = defaultdict(list)
+    first_pickup = []
+    first_completion = []
+    per_row = []
+    collected = []
+    for submission, _, params in accepted:
+        to_status = params['status']
+        submission.status = to_status
+        submission.updated_at = now
+        by_status[to_status].append(submission.id)
+        if to_status == 'assigned':
+            submission.rider_id = params['rider']
+            submission.assigned_at = now
+            by_rider[params['rider']].append(submission.id)
+        elif to_status == 'picked' and submission.pickup_time is None:
+            submission.pickup_time = now
+            first_pickup.append(submission.id)
+        elif to_status == 'collected':
+            if submission.completion_time is None:
+                submission.completion_time = now
+                first_completion.append(submission.id)
+            collected.append((submission, params))
+        if params.get('notes') or 'quantity_kg' in params:
+            submission.rider_notes = params.get('notes') or submission.rider_notes
+            submission.quantity_kg = params.get('quantity_kg', submission.quantity_kg)
+            per_row.append(submission)
+
+    # Values shared by many rows are written with one UPDATE per value; only the
+    # weights and notes differ from row to row
+    submissions = TrashSubmission.objects.all()
+    for to_status, ids in by_status.items():
+        submissions.filter(id__in=ids).update(status=to_status, updated_at=now)
+    for rider_id, ids in by_rider.items():
+        submissions.filter(id__in=ids).update(rider_id=rider_id, assigned_at=now)
+    if first_pickup:
+        submissions.filter(id__in=first_pickup).update(pickup_time=now)
+    if first_completion:
+        submissions.filter(id__in=first_completion).update(completion_time=now)
+    if per_row:
+        TrashSubmission.objects.bulk_update(per_row, ['rider_notes', 'quantity_kg'], batch_size=500)
+    record_events([(submission.id, from_status, params['status']) for submission, from_status, params in accepted],
+                  actor=actor, at=now)
+    if collected:
+        _collect(collected, actor)
+
+    cancelled_slots = {(submission.pickup_area, submission.pickup_slot) for submission, _, params in accepted
+                       if params['status'] == 'cancelled' and submission.pickup_slot}
+    transaction.on_commit(lambda: _after_commit(
+        [submission.id for submission, _ in collected], cancelled_slots
+    ))
+
+
+def _collect(collected, actor):
+    """Collection records and points for submissions that reached collected"""
+    existing = {record.submission_id: record for record in CollectionRecord.objects.filter(
+        submission__in=[submission.id for submission, _ in collected]
+    )}
+    new_records = []
+    updated_records = []
+    history = []
+    awards = defaultdict(int)
+    for submission, params in collected:
+        record = existing.get(submission.id)
+        if record is None:
+            record = CollectionRecord(submission=submission)
+            new_records.append(record)
+        else:
+            updated_records.append(record)
+        record.rider_id = submission.rider_id or (actor.id if actor else None)
+        record.trash_type = params['trash_type']
+        record.actual_quantity = params['actual_quantity']
+        record.points_awarded = params['points']
+
+        if params['points'] > 0:
+            awards[submission.user_id] += params['points']
+            history.append(RewardPointHistory(
+                user_id=submission.user_id,
+                points=params['points'],
+                reason=f"Collected {params['actual_quantity']}kg of {params['trash_type']} (Track ID: {submission.track_id})",
+                submission=submission,
+                awarded_by=actor,
+            ))
+
+    CollectionRecord.objects.bulk_create(new_records, batch_size=500)
+    CollectionRecord.objects.bulk_update(updated_records, ['rider', 'trash_type', 'actual_quantity', 'points_awarded'], batch_size=500)
+    RewardPointHistory.objects.bulk_create(history, batch_size=500)
+    add_points(awards)
+
+
+def add_points(awards):
+    """Add {user_id: points} to the users' balances in one UPDATE"""
+    if not awards:
+        return
+    CustomUser.objects.filter(id__in=list(awards)).update(reward_points=F('reward_points') + Case(
+        *[When(id=user_id, then=points) for user_id, points in awards.items()],
+        default=0,
+        output_field=IntegerField(),
+    ))
+
+
+def _after_commit(collected_ids, cancelled_slots):
+    """Update what model signals would have, as bulk writes skip them"""
+    from dashboard.data_versions import bump_data_version
+    from dashboard.search import search_service
+    from .scheduling import schedule
+
+    if collected_ids:
+        bump_data_version('submissions', 'collections', 'rewards', 'users')
+        # The collected trash type is part of the submission's search document
+        search_service.index_objects('submission', collected_ids)
+    else:
+        bump_data_version('submissions')
+    for area, start in cancelled_slots:
+        schedule.sync_slot(area, start)
+
+
+def verify(submission_id, actor, points, notes=''):
+    """Admin verification of a collected submission
+
+    Marks the collection record verified and corrects the points awarded at
+    collection to `points`. The submission stays collected.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        try:
+            submission = TrashSubmission.objects.select_for_update().select_related('user').get(id=submission_id)
+        except TrashSubmission.DoesNotExist:
+            raise TransitionError('Submission not found')
+        if submission.status != 'collected':
+            raise TransitionError('Submission is not in collected status')
+
+        record, created = CollectionRecord.objects.get_or_create(
+            submission=submission,
+            defaults={
+                'rider': submission.rider,
+                'trash_type': DEFAULT_TRASH_TYPE,
+                'actual_quantity': submission.quantity_kg or 0,
+                'points_awarded': 0,
+            }
+        )
+        if record.admin_verified:
+            raise TransitionError('Collection is already verified')
+
+        difference = points - record.points_awarded
+        record.points_awarded = points
+        record.admin_verified = True
+        record.verified_by = actor
+        record.verified_at = now
+        record.save()
+
+        if difference:
+            add_points({submission.user_id: difference})
+            RewardPointHistory.objects.create(
+                user=submission.user,
+                points=difference,
+                reason=f'Collection verified by admin - {notes}' if notes else 'Collection verified by admin',
+                submission=submission,
+                awarded_by=actor,
+            )
+
+        # Verification is logged as a lifecycle event; the status itself stays collected
+        record_events([(submission.id, 'collected', 'verified')], actor=actor, at=now)
+
+    from dashboard.data_versions import bump_data_version
+    bump_data_version('users', 'rewards')
+    submission.user.refresh_from_db(fields=['reward_points'])
+    return record
@@ -1,3 +1,288 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from accounts.models import CustomUser
+from dashboard.forecasting import demand_area
+from . import state_machine
+from .claims import ClaimTransitionError, transition_claim, transition_claims
+from .dispatch import area_of
+from .locations import extract_society, location_area, location_key, normalize_address
+from .models import CollectionRecord, RewardClaim, RewardPointHistory, SubmissionEvent, TrashSubmission
+from .payouts import PayoutError, batch_summary, complete_batch, create_batch, stream_settlement
+from .scheduling import slot_area
+
+
+class ExtractSocietyTests(SimpleTestCase):
+    def society(self, address):
+        return extract_society(normalize_address(address))
+
+    def test_whole_word_spellings(self):
+        self.assertEqual(self.society('108 B UET society'), 'uet')
+        self.assertEqual(self.society('12-A, NFC Phase 1'), 'nfc')
+        self.assertEqual(self.society('House 5 Valancia Town'), 'valencia')
+        self.assertEqual(self.society('22  Wapda   Town'), 'wapda town')
+
+    def test_spelling_inside_a_longer_word(self):
+        self.assertIsNone(self.society('Quetta Road 5'))
+        self.assertIsNone(self.society('5 Unfcd Lane'))
+        self.assertIsNone(self.society('14 Suetta Street'))
+        self.assertIsNone(self.society('3 Wapda Townhouses'))
+
+    def test_location_key_of_unknown_area(self):
+        self.assertEqual(location_key('Quetta Road 5'), 'quetta road 5')
+        self.assertEqual(location_key('108 B UET society'), 'uet:b:108')
+
+    def test_location_area(self):
+        self.assertEqual(location_area('uet:b:108'), 'uet:b')
+        self.assertEqual(location_area('uet:b:108', blocks=False), 'uet')
+        self.assertEqual(location_area('wapda town::22'), 'wapda town')
+        self.assertIsNone(location_area(location_key('Quetta Road 5')))
+        for key, areas in (('uet:b:108', ('uet:b', 'uet', 'uet:b')), ('quetta road 5', ('other', 'other', 'quetta road 5'))):
+            with self.subTest(key=key):
+                self.assertEqual((demand_area(key), slot_area(key), area_of(key)), areas)
+
+
+class StateMachineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(username='admin', password='x', user_type='admin')
+        cls.rider = CustomUser.objects.create_user(username='rider', password='x', user_type='rider')
+        cls.user = CustomUser.objects.create_user(username='ayesha', password='x', reward_points=100)
+
+    def submission(self, status='picked', quantity_kg='2.5'):
+        return TrashSubmission.objects.create(
+            user=self.user, rider=self.rider, status=status, quantity_kg=quantity_kg, location='108 B UET society'
+        )
+
+    def balance(self):
+        self.user.refresh_from_db()
+        return self.user.reward_points
+
+    def test_collect_credits_points(self):
+        submission = self.submission()
+        result = state_machine.apply(submission.id, 'collected', self.rider)
+        self.assertEqual(result['points'], 25)
+        self.assertEqual(self.balance(), 125)
+        record = CollectionRecord.objects.get(submission=submission)
+        self.assertEqual((record.actual_quantity, record.points_awarded), (Decimal('2.50'), 25))
+        self.assertEqual(
+            list(RewardPointHistory.objects.filter(submission=submission).values_list('points', flat=True)), [25]
+        )
+
+    def test_verify_settles_the_difference(self):
+        submission = self.submission()
+        state_machine.apply(submission.id, 'collected', self.rider)
+        state_machine.verify(submission.id, self.admin, 30)
+        self.assertEqual(self.balance(), 130)
+        self.assertEqual(
+            sorted(RewardPointHistory.objects.filter(submission=submission).values_list('points', flat=True)), [5, 25]
+        )
+        with self.assertRaises(state_machine.TransitionError):
+            state_machine.verify(submission.id, self.admin, 40)
+        self.assertEqual(self.balance(), 130)
+
+    def test_repeated_or_invalid_transition_is_rejected(self):
+        submission = self.submission()
+        state_machine.apply(submission.id, 'collected', self.rider)
+        for status in ('collected', 'picked', 'cancelled', 'bogus'):
+            with self.subTest(status=status), self.assertRaises(state_machine.TransitionError):
+                state_machine.apply(submission.id, status, self.rider)
+        with self.assertRaises(state_machine.TransitionError):
+            state_machine.apply(self.submission('assigned').id, 'picked', self.rider)
+        self.assertEqual(self.balance(), 125)
+        self.assertEqual(RewardPointHistory.objects.count(), 1)
+
+    def test_apply_many_partial_success(self):
+        picked, arrived, assigned = self.submission(), self.submission('arrived'), self.submission('assigned')
+        results = state_machine.apply_many([
+            {'submission': picked.id, 'status': 'collected'},
+            {'submission': arrived.id, 'status': 'collected'},
+            {'submission': assigned.id, 'status': 'on_the_way'},
+            {'submission': assigned.id, 'status': 'cancelled'},
+            {'submission': 0, 'status': 'collected'},
+        ], self.rider)
+        self.assertEqual([result['success'] for result in results], [True, False, True, False, False])
+        self.assertEqual(results[0]['points'], 25)
+        statuses = dict(TrashSubmission.objects.values_list('id', 'status'))
+        self.assertEqual(
+            [statuses[picked.id], statuses[arrived.id], statuses[assigned.id]], ['collected', 'arrived', 'on_the_way']
+        )
+        self.assertEqual(self.balance(), 125)
+        self.assertEqual(SubmissionEvent.objects.count(), 2)
+
+
+class RiderStatusEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = CustomUser.objects.create_user(username='rider', password='x', user_type='rider')
+        cls.user = CustomUser.objects.create_user(username='ayesha', password='x')
+
+    def setUp(self):
+        self.client.force_login(self.rider)
+
+    def submission(self, status):
+        return TrashSubmission.objects.create(
+            user=self.user, rider=self.rider, status=status, quantity_kg='2', location='108 B UET society'
+        )
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json').json()
+
+    def test_update_status_accepts_only_the_next_status(self):
+        # The statuses the rider dashboard's select offers
+        offered = ('on_the_way', 'arrived', 'picked')
+        next_statuses = state_machine.next_statuses()
+        for current in ('assigned', 'on_the_way', 'arrived'):
+            for status in offered:
+                with self.subTest(current=current, status=status):
+                    submission = self.submission(current)
+                    response = self.post(f'/trash/update-status/{submission.id}/', {'status': status})
+                    submission.refresh_from_db()
+                    if status in next_statuses[current]:
+                        self.assertTrue(response['success'])
+                        self.assertEqual(submission.status, status)
+                    else:
+                        self.assertFalse(response['success'])
+                        self.assertEqual(submission.status, current)
+
+    def test_update_weight_picks_up_only_after_arriving(self):
+        submission = self.submission('on_the_way')
+        response = self.post(f'/api/trash/update-weight/{submission.id}/', {'quantity_kg': 3, 'status': 'picked'})
+        self.assertFalse(response['success'])
+        submission.refresh_from_db()
+        self.assertEqual((submission.status, submission.quantity_kg), ('on_the_way', Decimal('2.00')))
+
+        state_machine.apply(submission.id, 'arrived', self.rider)
+        response = self.post(f'/api/trash/update-weight/{submission.id}/', {'quantity_kg': 3, 'status': 'picked'})
+        self.assertTrue(response['success'])
+        submission.refresh_from_db()
+        self.assertEqual((submission.status, submission.quantity_kg), ('picked', Decimal('3.00')))
+
+    def test_update_weight_corrects_only_until_collected(self):
+        submission = self.submission('picked')
+        response = self.post(f'/api/trash/update-weight/{submission.id}/', {'quantity_kg': 3, 'status': 'picked'})
+        self.assertTrue(response['success'])
+
+        state_machine.apply(submission.id, 'collected', self.rider)
+        events = SubmissionEvent.objects.count()
+        response = self.post(f'/api/trash/update-weight/{submission.id}/', {'quantity_kg': 9, 'status': 'collected'})
+        self.assertFalse(response['success'])
+        submission.refresh_from_db()
+        self.assertEqual(submission.quantity_kg, Decimal('3.00'))
+        self.assertEqual(SubmissionEvent.objects.count(), events)
+
+
+class ClaimTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(username='admin', password='x', user_type='admin')
+        cls.user = CustomUser.objects.create_user(username='ayesha', password='x', reward_points=1500)
+
+    def claim(self, amount, status='processing'):
+        return RewardClaim.objects.create(user=self.user, claim_amount=amount, claim_type='payment', status=status)
+
+    def balance(self):
+        self.user.refresh_from_db()
+        return self.user.reward_points
+
+    def statuses(self, claims):
+        return [RewardClaim.objects.get(id=claim.id).status for claim in claims]
+
+    def test_completions_of_one_user_beyond_the_balance(self):
+        claims = [self.claim(600), self.claim(700), self.claim(500)]
+        results = transition_claims([claim.id for claim in claims], 'completed', self.admin)
+        # 600 + 700 fit in 1500; the last 500 no longer does
+        self.assertEqual([result['success'] for result in results], [True, True, False])
+        self.assertEqual(self.balance(), 200)
+        self.assertEqual(self.statuses(claims), ['completed', 'completed', 'processing'])
+        self.assertEqual(
+            sorted(RewardPointHistory.objects.filter(user=self.user).values_list('points', flat=True)), [-700, -600]
+        )
+
+    def test_cancelling_a_completed_claim_refunds(self):
+        completed, processing = self.claim(600), self.claim(700)
+        transition_claim(completed.id, 'completed', self.admin)
+        self.assertEqual(self.balance(), 900)
+        results = transition_claims([completed.id, processing.id], 'cancelled', self.admin)
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(self.balance(), 1500)
+        self.assertEqual(
+            sorted(RewardPointHistory.objects.filter(user=self.user).values_list('points', flat=True)), [-600, 600]
+        )
+        with self.assertRaises(ClaimTransitionError):
+            transition_claim(completed.id, 'cancelled', self.admin)
+        self.assertEqual(self.balance(), 1500)
+
+    def test_duplicate_ids_in_one_batch(self):
+        claim = self.claim(600)
+        results = transition_claims([claim.id, claim.id, claim.id], 'completed', self.admin)
+        self.assertEqual([result['success'] for result in results], [True, False, False])
+        self.assertEqual(results[1]['error'], 'Claim appears more than once in the batch')
+        self.assertEqual(self.balance(), 900)
+        self.assertEqual(RewardPointHistory.objects.filter(user=self.user).count(), 1)
+
+
+class PayoutBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(username='admin', password='x', user_type='admin')
+        cls.ayesha = CustomUser.objects.create_user(username='ayesha', password='x', reward_points=2000)
+        cls.bilal = CustomUser.objects.create_user(username='bilal', password='x', reward_points=1000)
+
+    def claim(self, user, amount, claim_type='payment', hospital=None):
+        return RewardClaim.objects.create(
+            user=user, claim_amount=amount, claim_type=claim_type, donation_hospital=hospital, status='processing'
+        )
+
+    def balances(self):
+        return dict(CustomUser.objects.values_list('username', 'reward_points'))
+
+    def test_one_user_short_rejects_the_whole_batch(self):
+        self.claim(self.ayesha, 600)
+        self.claim(self.bilal, 700)
+        self.claim(self.bilal, 500)
+        batch = create_batch(self.admin)
+        before = self.balances()
+        with self.assertRaisesMessage(PayoutError, 'bilal'):
+            complete_batch(batch.id, self.admin)
+        self.assertEqual(self.balances(), before)
+        self.assertEqual(set(RewardClaim.objects.values_list('status', flat=True)), {'processing'})
+        self.assertFalse(RewardPointHistory.objects.exists())
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, 'open')
+
+    def test_each_claim_is_deducted_once(self):
+        for amount in (500, 600, 700):
+            self.claim(self.ayesha, amount)
+        self.claim(self.bilal, 500)
+        batch = complete_batch(create_batch(self.admin).id, self.admin, chunk_size=2)
+        self.assertEqual(self.balances(), {'admin': 0, 'ayesha': 200, 'bilal': 500})
+        self.assertEqual(
+            sorted(RewardPointHistory.objects.filter(user=self.ayesha).values_list('points', flat=True)),
+            [-700, -600, -500],
+        )
+        self.assertEqual(RewardPointHistory.objects.count(), 4)
+        self.assertEqual((batch.claim_count, batch.total_points), (4, 2300))
+        with self.assertRaises(PayoutError):
+            complete_batch(batch.id, self.admin)
+        self.assertEqual(self.balances()['ayesha'], 200)
+
+    def test_settlement_total_rows_match_the_summary(self):
+        self.claim(self.ayesha, 500)
+        self.claim(self.ayesha, 600)
+        self.claim(self.bilal, 700, 'donation', 'Mayo Hospital')
+        self.claim(self.ayesha, 800, 'donation', 'Mayo Hospital')
+        batch = create_batch(self.admin)
+        for completed in (False, True):
+            if completed:
+                batch = complete_batch(batch.id, self.admin)
+            for group in batch_summary(batch)['groups']:
+                with self.subTest(completed=completed, group=group['group']):
+                    lines = ''.join(stream_settlement(batch, group['group'], group['donation_hospital']))
+                    total = list(csv.reader(io.StringIO(lines)))[-1]
+                    self.assertEqual(total[:2], ['TOTAL', f"{group['claims']} claims"])
+                    self.assertEqual(total[-3:-1], [str(group['points']), str(group['amount'])])
@@ -0,0 +1,274 @@
+"""
+Live rider locations.
+
+Riders' apps send frequent location pings. Each worker keeps the most recent
+pings of every rider in a bounded ring buffer (a deque) and writes the pings
+to RiderLocation in batches, once RIDER_LOCATION_FLUSH_SIZE of them have
+piled up or RIDER_LOCATION_FLUSH_INTERVAL seconds have passed, so a ping
+costs no query. A timer armed by the first pending ping writes the batch of
+a worker that receives no further ping.
+
+The latest position of every rider is also filed in a grid of
+GRID_CELL_DEGREES cells. Nearest-rider lookups search the query point's cell
+and then ever wider rings of cells, so they only measure the riders around
+the point. A worker that starts cold fills the grid with one query for the
+latest stored ping of each rider. After that, every
+RIDER_LOCATION_FLUSH_INTERVAL seconds it reads the pings stored since its last
+read. That picks up the riders whose pings other workers took: those are
+stored within one flush interval and read within the next, so at most two
+flush intervals late.
+"""
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+GRID_CELL_DEGREES = 0.01  # ~1.1 km of latitude
+# Beyond this many rings the remaining riders are scanned directly
+MAX_GRID_RINGS = 50
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def grid_cell(latitude, longitude):
+    return math.floor(latitude / GRID_CELL_DEGREES), math.floor(longitude / GRID_CELL_DEGREES)
+
+
+class RiderLocationTracker:
+    """Thread-safe per-worker store of rider location pings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffers = {}   # rider_id -> deque of (latitude, longitude, recorded_at)
+        self._latest = {}    # rider_id -> (latitude, longitude, recorded_at)
+        self._grid = {}      # cell -> set of rider_ids
+        self._cells = {}     # rider_id -> cell
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._synced_at = None  # monotonic time of the last read from the database
+        self._synced_id = 0     # highest RiderLocation id read so far
+
+    @property
+    def buffer_size(self):
+        return getattr(settings, 'RIDER_LOCATION_BUFFER_SIZE', 120)
+
+    @property
+    def flush_size(self):
+        return getattr(settings, 'RIDER_LOCATION_FLUSH_SIZE', 500)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'RIDER_LOCATION_FLUSH_INTERVAL', 30)
+
+    @property
+    def max_age(self):
+        return timedelta(seconds=getattr(settings, 'RIDER_LOCATION_MAX_AGE', 600))
+
+    def record(self, rider_id, latitude, longitude, recorded_at=None):
+        """Store one ping; writes the pending batch when it is due"""
+        ping = (latitude, longitude, recorded_at or timezone.now())
+        with self._lock:
+            buffer = self._buffers.get(rider_id)
+            if buffer is None:
+                buffer = self._buffers[rider_id] = deque(maxlen=self.buffer_size)
+            buffer.append(ping)
+            self._pending.append((rider_id, *ping))
+            self._place(rider_id, ping)
+            due = (len(self._pending) >= self.flush_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+            if not due:
+                self._arm_timer()
+        if due:
+            self.flush()
+
+    def _place(self, rider_id, ping):
+        """Move the rider to the ping's grid cell unless it is older than what we have"""
+        latest = self._latest.get(rider_id)
+        if latest is not None and latest[2] > ping[2]:
+            return
+        self._latest[rider_id] = ping
+        cell = grid_cell(ping[0], ping[1])
+        previous = self._cells.get(rider_id)
+        if previous == cell:
+            return
+        if previous is not None:
+            riders = self._grid[previous]
+            riders.discard(rider_id)
+            if not riders:
+                del self._grid[previous]
+        self._grid.setdefault(cell, set()).add(rider_id)
+        self._cells[rider_id] = cell
+
+    def _arm_timer(self):
+        """Start the flush timer unless it is running; called with the lock held"""
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write the pending pings to the database"""
+        from .models import RiderLocation
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+        try:
+            RiderLocation.objects.bulk_create([
+                RiderLocation(rider_id=rider_id, latitude=latitude, longitude=longitude, recorded_at=recorded_at)
+                for rider_id, latitude, longitude, recorded_at in pending
+            ], batch_size=self.flush_size)
+        except Exception:
+            # Keep the pings for the next flush
+            with self._lock:
+                self._pending[:0] = pending
+                self._arm_timer()
+            raise
+        return len(pending)
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not write rider location pings')
+        finally:
+            # The timer thread has its own database connection
+            connection.close()
+
+    def _sync(self):
+        """File the latest ping of every rider stored since the last read, when one is due"""
+        from .models import RiderLocation
+
+        with self._lock:
+            now = time.monotonic()
+            if self._synced_at is not None and now - self._synced_at < self.flush_interval:
+                return
+            self._synced_at = now
+            synced_id = self._synced_id
+        latest = {}
+        rows = RiderLocation.objects.filter(
+            id__gt=synced_id, recorded_at__gte=timezone.now() - self.max_age
+        ).order_by('rider_id', '-recorded_at').values_list('id', 'rider_id', 'latitude', 'longitude', 'recorded_at')
+        for row_id, rider_id, *ping in rows.iterator():
+            latest.setdefault(rider_id, tuple(ping))
+            synced_id = max(synced_id, row_id)
+        with self._lock:
+            for rider_id, ping in latest.items():
+                self._place(rider_id, ping)
+            self._synced_id = max(self._synced_id, synced_id)
+
+    def latest(self, rider_id):
+        """(latitude, longitude, recorded_at) of the rider's last ping, or None"""
+        self._sync()
+        with self._lock:
+            return self._latest.get(rider_id)
+
+    def recent(self, rider_id):
+        """Pings still held in the rider's ring buffer, oldest first"""
+        with self._lock:
+            return list(self._buffers.get(rider_id, ()))
+
+    def nearest(self, latitude, longitude, rider_ids=None, limit=1, max_distance_km=None):
+        """[(rider_id, distance_km, ping)] of the closest riders with a fresh position
+
+        rider_ids restricts the search to those riders (e.g. the available ones).
+        """
+        self._sync()
+        cutoff = timezone.now() - self.max_age
+        origin_row, origin_col = grid_cell(latitude, longitude)
+        # A ring of cells r steps away is at least this far from the point
+        cell_km = GRID_CELL_DEGREES * KM_PER_DEGREE * max(math.cos(math.radians(abs(latitude) + GRID_CELL_DEGREES)), 0.01)
+
+        found = []
+        with self._lock:
+            remaining = len(self._latest)
+            ring = 0
+            while remaining > 0:
+                if len(found) >= limit and found[limit - 1][1] <= (ring - 1) * cell_km:
+                    break
+                if max_distance_km is not None and (ring - 1) * cell_km > max_distance_km:
+                    break
+                if ring > MAX_GRID_RINGS:
+                    candidates = [
+                        rider_id for rider_id, (row, col) in self._cells.items()
+                        if max(abs(row - origin_row), abs(col - origin_col)) >= ring
+                    ]
+                    remaining = 0
+                else:
+                    candidates = [
+                        rider_id for cell in _ring_cells(origin_row, origin_col, ring)
+                        for rider_id in self._grid.get(cell, ())
+                    ]
+                    remaining -= len(candidates)
+                for rider_id in candidates:
+                    ping = self._latest[rider_id]
+                    if ping[2] < cutoff or (rider_ids is not None and rider_id not in rider_ids):
+                        continue
+                    distance = haversine_km(latitude, longitude, ping[0], ping[1])
+                    if max_distance_km is None or distance <= max_distance_km:
+                        found.append((rider_id, distance, ping))
+                found.sort(key=lambda item: item[1])
+                ring += 1
+        return found[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+            self._latest.clear()
+            self._grid.clear()
+            self._cells.clear()
+            self._pending = []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._synced_at = None
+            self._synced_id = 0
+
+
+def _ring_cells(row, col, ring):
+    """Cells exactly `ring` steps (Chebyshev distance) from (row, col)"""
+    if ring == 0:
+        yield row, col
+        return
+    for offset in range(-ring, ring + 1):
+        yield row - ring, col + offset
+        yield row + ring, col + offset
+    for offset in range(-ring + 1, ring):
+        yield row + offset, col - ring
+        yield row + offset, col + ring
+
+
+tracker = RiderLocationTracker()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        tracker.flush()
+    except Exception:
+        pass
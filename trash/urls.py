@@ -19,4 +19,7 @@ urlpatterns = [
     path('manage-claims/', views.manage_claims, name='manage_claims'),
     path('update-claim-status/<int:claim_id>/', views.update_claim_status, name='update_claim_status'),
     path('delete-claim/<int:claim_id>/', views.delete_claim, name='delete_claim'),
+    
+    # Exports
+    path('export/<str:dataset>/', views.export_data, name='export_data'),
 ]
@@ -2,14 +2,15 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.http import JsonResponse
-from django.utils import timezone
-from .models import TrashSubmission, CollectionRecord, RewardPointHistory, RewardClaim
+from .models import TrashSubmission, RewardClaim
 from accounts.models import CustomUser
+from dashboard.search import search_service
+from . import state_machine
+from .claims import ClaimTransitionError, transition_claim
 from django.views.decorators.csrf import csrf_exempt
 import json
 from django.views.decorators.http import require_http_methods
 from django.db import transaction
-from django.db.models import Q
 from django.core.paginator import Paginator
 
 def is_rider(user):
@@ -63,30 +64,17 @@ def update_status(request, submission_id):
         
         # Update submission status
         with transaction.atomic():
-            submission.status = new_status
-            if new_status == 'on_the_way':
-                submission.assigned_at = timezone.now()
-            elif new_status == 'picked':
-                submission.pickup_time = timezone.now()
-            
-            if notes:
-                submission.rider_notes = notes
-            
-            submission.save()
+            result = state_machine.apply(submission.id, new_status, request.user, notes=notes)
             
             # Log the action
-            from accounts.models import ActivityLog
-            ActivityLog.objects.create(
-                user=request.user,
-                action='updated_status',
-                details={
-                    'submission_id': submission.id,
-                    'track_id': submission.track_id,
-                    'old_status': submission.status,
-                    'new_status': new_status,
-                    'notes': notes
-                }
-            )
+            from accounts.activity import log_activity
+            log_activity(request.user, 'updated_status', {
+                'submission_id': submission.id,
+                'track_id': submission.track_id,
+                'old_status': result['from_status'],
+                'new_status': new_status,
+                'notes': notes
+            })
         
         return JsonResponse({
             'success': True,
@@ -127,47 +115,26 @@ def complete_collection(request, submission_id):
         except (ValueError, TypeError):
             return JsonResponse({'success': False, 'error': 'Invalid quantity or points format'})
         
-        # Create collection record
+        # Create collection record, award the points and mark the submission collected
         with transaction.atomic():
-            collection = CollectionRecord.objects.create(
-                submission=submission,
-                rider=request.user,
+            state_machine.apply(
+                submission.id, 'collected', request.user,
                 trash_type=trash_type,
                 actual_quantity=actual_quantity,
-                points_awarded=points_awarded
-                # Removed collected_image field
-            )
-            
-            # Update submission status
-            submission.status = 'collected'
-            submission.completion_time = timezone.now()
-            submission.rider_notes = rider_notes
-            submission.save()
-            
-            # Create reward point history
-            from .models import RewardPointHistory
-            RewardPointHistory.objects.create(
-                user=submission.user,
                 points=points_awarded,
-                reason=f"Collected {actual_quantity}kg of {trash_type}",
-                submission=submission,
-                awarded_by=request.user
+                notes=rider_notes,
             )
             
             # Log the action
-            from accounts.models import ActivityLog
-            ActivityLog.objects.create(
-                user=request.user,
-                action='completed_collection',
-                details={
-                    'submission_id': submission.id,
-                    'track_id': submission.track_id,
-                    'trash_type': trash_type,
-                    'actual_quantity': actual_quantity,
-                    'points_awarded': points_awarded,
-                    'notes': rider_notes
-                }
-            )
+            from accounts.activity import log_activity
+            log_activity(request.user, 'completed_collection', {
+                'submission_id': submission.id,
+                'track_id': submission.track_id,
+                'trash_type': trash_type,
+                'actual_quantity': actual_quantity,
+                'points_awarded': points_awarded,
+                'notes': rider_notes
+            })
         
         return JsonResponse({
             'success': True,
@@ -201,25 +168,17 @@ def assign_rider(request, submission_id):
         
         # Update submission
         with transaction.atomic():
-            submission.rider = rider
-            submission.status = 'assigned'
-            submission.assigned_at = timezone.now()
-            submission.rider_notes = notes
-            submission.save()
+            state_machine.apply(submission.id, 'assigned', request.user, rider=rider.id, notes=notes)
             
             # Log the action
-            from accounts.models import ActivityLog
-            ActivityLog.objects.create(
-                user=request.user,
-                action='assigned_rider',
-                details={
-                    'submission_id': submission.id,
-                    'track_id': submission.track_id,
-                    'rider_id': rider.id,
-                    'rider_username': rider.username,
-                    'notes': notes
-                }
-            )
+            from accounts.activity import log_activity
+            log_activity(request.user, 'assigned_rider', {
+                'submission_id': submission.id,
+                'track_id': submission.track_id,
+                'rider_id': rider.id,
+                'rider_username': rider.username,
+                'notes': notes
+            })
         
         return JsonResponse({
             'success': True,
@@ -235,7 +194,7 @@ def assign_rider(request, submission_id):
 @user_passes_test(lambda u: u.user_type == 'admin')
 @require_http_methods(["POST"])
 def verify_collection(request, submission_id):
-    """Verify a collection and award final points"""
+    """Verify a collection and settle its final points"""
     try:
         # Parse JSON data
         data = json.loads(request.body)
@@ -253,56 +212,18 @@ def verify_collection(request, submission_id):
             return JsonResponse({'success': False, 'error': 'Invalid points format'})
         
         # Get the submission
-        submission = get_object_or_404(TrashSubmission, id=submission_id)
+        submission = get_object_or_404(TrashSubmission.objects.select_related('user'), id=submission_id)
         
         # Check if submission is collected
         if submission.status != 'collected':
             return JsonResponse({'success': False, 'error': 'Submission is not in collected status'})
         
-        # Get or create collection record
-        collection_record, created = CollectionRecord.objects.get_or_create(
-            submission=submission,
-            defaults={
-                'rider': submission.rider,
-                'trash_type': submission.trash_description or 'Mixed Waste',
-                'actual_quantity': submission.quantity_kg or 0,
-                'points_awarded': points,
-                'admin_verified': True,
-                'verified_by': request.user,
-                'verified_at': timezone.now()
-            }
-        )
-        
-        if not created:
-            # Update existing record
-            collection_record.points_awarded = points
-            collection_record.admin_verified = True
-            collection_record.verified_by = request.user
-            collection_record.verified_at = timezone.now()
-            collection_record.save()
-        
-        # Update user's points
-        user = submission.user
-        user.reward_points += points
-        user.save()
-        
-        # Change submission status to 'verified' to prevent re-verification
-        submission.status = 'verified'
-        submission.save()
-        
-        # Create reward point history entry
-        from .models import RewardPointHistory
-        RewardPointHistory.objects.create(
-            user=user,
-            points=points,
-            reason=f'Collection verified by admin - {notes}' if notes else 'Collection verified by admin',
-            submission=submission,
-            awarded_by=request.user
-        )
+        # Marks the collection record verified so it cannot be verified twice
+        state_machine.verify(submission.id, request.user, points, notes)
         
         return JsonResponse({
             'success': True,
-            'message': f'Collection verified successfully. {points} points awarded to {user.username}'
+            'message': f'Collection verified successfully. {points} points awarded to {submission.user.username}'
         })
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
@@ -445,11 +366,7 @@ def claim_history(request):
         claims = claims.filter(status=status_filter)
     
     if search_query:
-        claims = claims.filter(
-            Q(reference_id__icontains=search_query) |
-            Q(claim_type__icontains=search_query) |
-            Q(notes__icontains=search_query)
-        )
+        claims = claims.filter(search_service.filter('claim', search_query))
     
     # Pagination
     paginator = Paginator(claims, per_page)
@@ -489,10 +406,8 @@ def manage_claims(request):
     
     if search_query:
         claims = claims.filter(
-            Q(user__username__icontains=search_query) |
-            Q(reference_id__icontains=search_query) |
-            Q(notes__icontains=search_query) |
-            Q(donation_hospital__icontains=search_query)
+            search_service.filter('claim', search_query) |
+            search_service.filter('user', search_query, path='user_id')
         )
     
     # Pagination
@@ -530,53 +445,11 @@ def update_claim_status(request, claim_id):
     try:
         claim = RewardClaim.objects.get(id=claim_id)
         new_status = request.POST.get('status')
-        
-        if new_status not in ['processing', 'completed', 'cancelled']:
-            return JsonResponse({'success': False, 'error': 'Invalid status'})
-        
-        # Validate status transitions
-        if new_status == 'completed' and claim.claim_amount < 500:
-            return JsonResponse({'success': False, 'error': 'Claims below 500 points cannot be completed'})
-        
-        if new_status == 'completed' and claim.status != 'processing':
-            return JsonResponse({'success': False, 'error': 'Only processing claims can be completed'})
-        
-        if new_status == 'completed' and claim.status == 'completed':
-            return JsonResponse({'success': False, 'error': 'Claim is already completed'})
-        
-        # Update status
-        claim.status = new_status
-        claim.processed_by = request.user
-        claim.processed_at = timezone.now()
-        
-        # Handle completed claims - deduct points when claim is completed
-        if new_status == 'completed':
-            # Deduct points from user when claim is completed
-            user = claim.user
-            user.reward_points -= claim.claim_amount
-            user.save()
-            
-            # Log the point deduction
-            RewardPointHistory.objects.create(
-                user=user,
-                points=-claim.claim_amount,  # Negative points for deduction
-                reason=f"Claim {claim.reference_id} completed - points deducted",
-                awarded_by=request.user
-            )
-        elif new_status == 'cancelled' and claim.status in ['pending', 'processing']:
-            # Refund points if cancelling
-            user = claim.user
-            user.reward_points += claim.claim_amount
-            user.save()
-            
-            RewardPointHistory.objects.create(
-                user=user,
-                points=claim.claim_amount,
-                reason=f"Claim {claim.reference_id} cancelled - points refunded",
-                awarded_by=request.user
-            )
-        
-        claim.save()
+        try:
+            transition_claim(claim.id, new_status, request.user)
+        except ClaimTransitionError as e:
+            return JsonResponse({'success': False, 'error': str(e)})
+        claim.refresh_from_db()
         
         # Prepare success message
         if new_status == 'completed':
@@ -619,3 +492,14 @@ def delete_claim(request, claim_id):
         return JsonResponse({'success': False, 'error': 'Claim not found'})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
+
+@login_required
+@user_passes_test(lambda u: u.user_type == 'admin')
+def export_data(request, dataset):
+    """Stream an export of submissions, collections, points or claims as CSV or JSONL."""
+    from .exports import export_response
+    
+    try:
+        return export_response(dataset, request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
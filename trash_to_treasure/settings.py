@@ -66,22 +66,102 @@ SIMPLE_JWT = {
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'dashboard.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'dashboard.middleware.QueryProfilingMiddleware',
     'dashboard.middleware.SystemStatusMiddleware',
 ]
 
+# Request profiling (dashboard.middleware.QueryProfilingMiddleware)
+# Off by default; admins can still profile a single request by sending
+# the "X-Profile-Request: 1" header.
+QUERY_PROFILING_ENABLED = False
+QUERY_PROFILING_SLOW_MS = 500
+QUERY_PROFILING_TOP_QUERIES = 5
+QUERY_PROFILING_LOG_FILE = BASE_DIR / 'logs' / 'slow_requests.jsonl'
+QUERY_PROFILING_LOG_MAX_BYTES = 5 * 1024 * 1024
+QUERY_PROFILING_LOG_BACKUP_COUNT = 5
+
+# Request metrics (dashboard.metrics), exported at /api/dashboard/metrics/.
+# Workers merge their counters into this shared SQLite file.
+METRICS_ENABLED = True
+METRICS_DB_PATH = BASE_DIR / 'metrics.sqlite3'
+METRICS_FLUSH_INTERVAL = 10  # seconds
+
+# Dashboard aggregate executor (dashboard/aggregates.py)
+# Independent dashboard queries run on this many threads; SQLite always runs
+# them sequentially. Set to 1 to disable concurrency everywhere.
+AGGREGATE_EXECUTOR_MAX_WORKERS = 4
+
+# Search (dashboard/search.py)
+# Defaults to the SQLite FTS5 index when available, else icontains lookups.
+# SEARCH_BACKEND = 'dashboard.search.IcontainsBackend'
+SEARCH_MAX_RESULTS = 1000
+
+# Rider location pings (trash/tracking.py)
+# Pings are kept in memory per rider and written to the database in batches.
+RIDER_LOCATION_BUFFER_SIZE = 120  # recent pings kept per rider
+RIDER_LOCATION_FLUSH_SIZE = 500  # pings
+RIDER_LOCATION_FLUSH_INTERVAL = 30  # seconds
+RIDER_LOCATION_MAX_AGE = 600  # seconds before a rider's position is considered stale
+
+# Pickup time slots (trash/scheduling.py)
+# Slot capacity is derived from the number of active riders and split across
+# areas by their share of recent submissions.
+PICKUP_SLOT_HOURS = [(9, 12), (12, 15), (15, 18)]  # local start/end hours
+PICKUP_SLOT_DAYS_AHEAD = 7
+PICKUP_SLOT_RIDER_CAPACITY = 6  # pickups one rider can make in a slot
+PICKUP_SLOT_MIN_AREA_CAPACITY = 2
+PICKUP_SLOT_REFRESH_INTERVAL = 300  # seconds between rebuilds from the database
+
+# Demand forecasts (dashboard/forecasting.py, needs NumPy)
+DEMAND_FORECAST_CACHE_TIMEOUT = 6 * 60 * 60  # seconds
+
+# Idempotency keys (trash/idempotency.py)
+# Responses to requests sent with an Idempotency-Key header are replayed on
+# retries for this long. Expired keys are removed by purge_idempotency_keys.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds
+
+# Background jobs (dashboard/jobs.py), run by `python manage.py run_jobs`
+# Failed jobs are retried up to JOB_MAX_ATTEMPTS times, JOB_RETRY_DELAY
+# seconds later, doubling after each attempt. A running job that has not
+# reported progress for JOB_STALE_TIMEOUT seconds is assumed to have lost its
+# worker and is queued again.
+JOB_POLL_INTERVAL = 2  # seconds
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30  # seconds
+JOB_STALE_TIMEOUT = 10 * 60  # seconds
+JOB_EXPORT_DIR = BASE_DIR / 'exports'
+
+# Chunked deletes (dashboard/deletion.py), used when clearing system data
+# Each chunk is its own short transaction; the pause between chunks lets
+# other requests and workers take the SQLite write lock.
+DELETE_CHUNK_SIZE = 1000
+DELETE_CHUNK_PAUSE = 0.02  # seconds
+
+# History archive (dashboard/archive.py)
+# `python manage.py archive_history` moves point history and activity log
+# rows older than this into compressed per-user monthly blocks. History
+# pages past the recent rows are read back from the archive.
+HISTORY_ARCHIVE_AFTER_DAYS = 365
+
+# Activity log buffer (accounts/activity.py)
+# Entries are written in one bulk_create once this many are queued, or this
+# many seconds after the oldest one. 1 writes every entry right away.
+ACTIVITY_LOG_BUFFER_SIZE = 100
+ACTIVITY_LOG_FLUSH_INTERVAL = 5  # seconds
+
 ROOT_URLCONF = 'trash_to_treasure.urls'
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -89,10 +169,23 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept in memory (and reloaded on change while DEBUG)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
 
+# Template fragment caching
+# Fragments are keyed by the data versions they depend on (dashboard/data_versions.py),
+# so updates invalidate them immediately; the timeout only bounds how long
+# time-relative windows ("last 30 days") may lag behind.
+TEMPLATE_FRAGMENT_CACHE_TIMEOUT = 300  # seconds
+
 WSGI_APPLICATION = 'trash_to_treasure.wsgi.application'
 
 
@@ -103,9 +196,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Reuse connections across requests, checking them before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts. With the default
+            # DEFERRED mode a transaction that reads before it writes fails
+            # at once with "database is locked" when another connection is
+            # writing (e.g. a chunked reset), instead of waiting its turn.
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Read replica for analytics and exports (dashboard/replica.py). Locally a
+    # copy of db.sqlite3 made by `python manage.py refresh_replica --interval 300`;
+    # until it exists, or when it is older than REPLICA_MAX_LAG, reads stay on default.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        # The file is replaced on every refresh, so connections are not kept
+        'CONN_MAX_AGE': 0,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['dashboard.replica.ReplicaRouter']
+REPLICA_DATABASE_ALIAS = 'replica'
+REPLICA_MAX_LAG = 15 * 60  # seconds
+REPLICA_REFRESH_INTERVAL = 5 * 60  # seconds, default of refresh_replica --interval
+
+# Pragmas run on every new SQLite connection are DEFAULT_PRAGMAS in
+# dashboard/database.py (WAL, synchronous=NORMAL, 20 s busy timeout, 64 MB
+# cache, 256 MB mmap); entries here override or add to them, e.g.
+# {'cache_size': -256000}. `python manage.py benchmark_sqlite` compares the
+# result with SQLite's defaults.
+SQLITE_PRAGMAS = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators